@@ -0,0 +1,136 @@
+"""Queue for deliver Telegram messages under rate limits."""
+
+import asyncio
+from time import monotonic
+from typing import Self
+
+import aiohttp
+from decouple import config
+from loguru import logger
+
+from httplocal import get_session
+from models import Telegram
+
+TELEGRAM_RATE = config("TELEGRAM_RATE", cast=float, default=30.0)  # msgs per second of bot
+TELEGRAM_CHAT_INTERVAL = config("TELEGRAM_CHAT_INTERVAL", cast=float, default=1.0)  # seconds
+TELEGRAM_ATTEMPTS = config("TELEGRAM_ATTEMPTS", cast=int, default=5)
+TELEGRAM_RETRY = config("TELEGRAM_RETRY", cast=float, default=5.0)  # seconds after network error
+
+# Max length of text of one message
+MESSAGE_LIMIT = 4096
+
+
+class Delivery:
+    """Class for send messages to all chats concurrently.
+
+    each chat has own worker with pause between messages, all workers
+    share global rate of bot, messages of chat waiting own turn merged
+    into one
+    """
+
+    def __init__(self: Self, telegram: Telegram) -> None:
+        """Init empty queue of each chat."""
+        self.telegram: Telegram = telegram
+        self.pending: dict[str, list[str]] = {
+            chat_id: [] for chat_id in telegram.get_bot_chat_id()
+        }
+        self.ready: dict[str, asyncio.Event] = {
+            chat_id: asyncio.Event() for chat_id in telegram.get_bot_chat_id()
+        }
+        self.next_at: float = 0.0  # monotonic time of next send of bot
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.sent: int = 0
+        self.failed: int = 0
+
+    def send(self: Self, text: str) -> None:
+        """Add message to queue of all chats, never wait."""
+        for chat_id, pending in self.pending.items():
+            pending.append(text)
+            self.ready[chat_id].set()
+
+    def pop_merged(self: Self, chat_id: str) -> str:
+        """Pop messages of chat merged in one text not longer MESSAGE_LIMIT."""
+        pending = self.pending[chat_id]
+        text = pending.pop(0)[:MESSAGE_LIMIT]
+
+        while pending and len(text) + 2 + len(pending[0]) <= MESSAGE_LIMIT:
+            text += "\n\n" + pending.pop(0)
+
+        if not pending:
+            self.ready[chat_id].clear()
+        return text
+
+    async def acquire(self: Self) -> None:
+        """Wait own turn by global rate of bot."""
+        async with self.lock:
+            delay = self.next_at - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_at = max(self.next_at, monotonic()) + 1 / TELEGRAM_RATE
+
+    async def post(self: Self, chat_id: str, text: str) -> float | None:
+        """Send one message, get seconds to wait before retry, None if done."""
+        await self.acquire()
+
+        try:
+            async with get_session().post(
+                self.telegram.get_telegram_url(),
+                json={
+                    "chat_id": chat_id,
+                    "parse_mode": "HTML",
+                    "disable_notification": True,
+                    "text": text,
+                },
+            ) as resp:
+                data = await resp.json(content_type=None)
+        except (aiohttp.ClientError, TimeoutError, ValueError) as e:
+            logger.error(f"Telegram:{chat_id}:{e!r}")
+            return TELEGRAM_RETRY
+
+        if data.get("ok"):
+            self.sent += 1
+            return None
+
+        # answer 429 of Telegram has seconds of wait in parameters
+        retry_after = data.get("parameters", {}).get("retry_after")
+        if retry_after is not None:
+            logger.warning(f"Telegram:{chat_id}:retry after {retry_after}s")
+            return float(retry_after)
+
+        self.failed += 1
+        logger.error(f"Telegram:{chat_id}:{data}")
+        return None
+
+    async def run_chat(self: Self, chat_id: str) -> None:
+        """Infinity send messages of chat with pause between them."""
+        next_at = 0.0
+        attempt = 0
+
+        while True:
+            await self.ready[chat_id].wait()
+
+            # new messages merged with waiting ones while pause
+            await asyncio.sleep(max(next_at - monotonic(), 0))
+            text = self.pop_merged(chat_id)
+
+            delay = await self.post(chat_id, text)
+            attempt = attempt + 1 if delay is not None else 0
+
+            if delay is not None and attempt < TELEGRAM_ATTEMPTS:
+                self.pending[chat_id].insert(0, text)
+                self.ready[chat_id].set()
+            elif delay is not None:
+                self.failed += 1
+                logger.error(f"Telegram:{chat_id}:drop after {attempt} attempts")
+                attempt = 0
+
+            next_at = monotonic() + max(TELEGRAM_CHAT_INTERVAL, delay or 0)
+
+    async def run(self: Self) -> None:
+        """Run workers of all chats."""
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for chat_id in self.pending:
+                    tg.create_task(self.run_chat(chat_id))
+        finally:
+            logger.info(f"Telegram delivered {self.sent}, failed {self.failed}")
@@ -1,117 +1,224 @@
-"""Bnnc Alertest."""
-
-import asyncio
-from decimal import Decimal
-
-from decouple import Csv, config
-from loguru import logger
-
-from models import Access, Telegram, Token
-from tools import (
-    get_all_margin_pairs,
-    get_margin_account,
-    get_seconds_to_next_minutes,
-    send_telegram_msg,
-)
-
-DAY_IN_MILLISECONDS = 86400000
-WEEK_IN_MILLISECONDS = DAY_IN_MILLISECONDS * 7
-
-
-def get_start_at_for_day(now_mill: int) -> int:
-    """Return milliseconds for shift a day."""
-    return now_mill - DAY_IN_MILLISECONDS
-
-
-def get_start_at_for_week(now_mill: int) -> int:
-    """Return milliseconds for shift a week."""
-    return now_mill - WEEK_IN_MILLISECONDS
-
-
-async def get_available_funds(
-    access: Access,
-    token: Token,
-) -> None:
-    """Get available funds in excechge."""
-    margin_account = await get_margin_account(access)
-
-    usdt = [i for i in margin_account["userAssets"] if i["asset"] == "USDT"]
-
-    token.avail_size = Decimal(usdt[0]["netAsset"])
-    token.borrow_size = Decimal(usdt[0]["borrowed"]) + Decimal(usdt[0]["interest"])
-
-
-async def get_tokens(access: Access, token: Token) -> None:
-    """Get available tokens."""
-    all_token_pairs_in_excange = await get_all_margin_pairs(access)
-
-    token.save_accept_tokens(all_token_pairs_in_excange)
-    token.save_new_tokens(all_token_pairs_in_excange)
-    token.save_del_tokens()
-
-
-async def get_actual_token_stats(
-    access: Access,
-    token: Token,
-    telegram: Telegram,
-) -> None:
-    """Get actual all tokens stats."""
-    await get_available_funds(access, token)
-    await get_tokens(access, token)
-
-    msg = telegram.get_telegram_msg(token)
-    logger.warning(msg)
-    await send_telegram_msg(telegram, msg)
-
-
-async def main() -> None:
-    """Main func in microservice.
-
-    wait second to next time with 10:00 minutes equals
-    in infinity loop to run get_actual_token_stats
-    """
-    logger.info("Run Alertest microservice")
-
-    # Access object
-    access = Access(
-        key=config("KEY", cast=str),
-        secret=config("SECRET", cast=str),
-        base_uri="https://api.binance.com",
-    )
-
-    # Token's object
-    token = Token(
-        time_shift=config("TIME_SHIFT", cast=str, default="1h"),
-        base_stable=config("BASE_STABLE", cast=str, default="USDT"),
-        currency=config("ALLCURRENCY", cast=Csv(str)),
-        ignore_currency=config("IGNORECURRENCY", cast=Csv(str)),
-        base_keep=Decimal(config("BASE_KEEP", cast=int)),
-    )
-
-    # Telegram object
-    telegram = Telegram(
-        telegram_bot_key=config("TELEGRAM_BOT_API_KEY", cast=str),
-        telegram_bot_chat_id=config("TELEGRAM_BOT_CHAT_ID", cast=Csv(str)),
-    )
-
-    await get_actual_token_stats(
-        access,
-        token,
-        telegram,
-    )
-
-    while True:
-        wait_seconds = get_seconds_to_next_minutes(10)
-
-        logger.info(f"Wait {wait_seconds} to run get_actual_token_stats")
-        await asyncio.sleep(wait_seconds)
-
-        await get_actual_token_stats(
-            access,
-            token,
-            telegram,
-        )
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
+"""Bnnc Alertest."""
+
+import asyncio
+from decimal import Decimal
+from functools import partial
+from time import perf_counter
+
+import orjson
+from decouple import Csv, config
+from loguru import logger
+from nats.aio.client import Msg
+from nats.js.kv import KeyValue
+
+from delivery import Delivery
+from httplocal import API_URI, close_session
+from metricslocal import get_now, start_metrics
+from models import Access, Stats, Telegram, Token
+from natslocal import get_kv_balance, get_nats_client
+from tools import (
+    get_all_margin_pairs,
+    get_margin_account,
+    get_seconds_to_next_minutes,
+    load_pairs_cache,
+    save_pairs_cache,
+)
+
+DAY_IN_MILLISECONDS = 86400000
+WEEK_IN_MILLISECONDS = DAY_IN_MILLISECONDS * 7
+
+STATS_SUBJECT = config("STATS_SUBJECT", cast=str, default="alertest.stats")
+
+
+def get_start_at_for_day(now_mill: int) -> int:
+    """Return milliseconds for shift a day."""
+    return now_mill - DAY_IN_MILLISECONDS
+
+
+def get_start_at_for_week(now_mill: int) -> int:
+    """Return milliseconds for shift a week."""
+    return now_mill - WEEK_IN_MILLISECONDS
+
+
+async def get_available_funds(
+    access: Access,
+    stats: Stats,
+) -> None:
+    """Reconcile USDT and borrow estimated by events with excechge."""
+    margin_account = await get_margin_account(access)
+
+    usdt = [i for i in margin_account["userAssets"] if i["asset"] == "USDT"]
+
+    stats.reconcile(
+        avail_size=Decimal(usdt[0]["netAsset"]),
+        borrow_size=Decimal(usdt[0]["borrowed"]) + Decimal(usdt[0]["interest"]),
+    )
+    logger.info(f"Reconcile USDT:{usdt[0]['netAsset']}:drift {stats.drift:.2f}")
+
+
+async def get_tokens(access: Access, token: Token) -> None:
+    """Get available tokens by diff with last allPairs."""
+    all_token_pairs_in_excange = await get_all_margin_pairs(access)
+    start = perf_counter()
+    pairs_hash = token.pairs_hash
+
+    changed = token.update_pairs(all_token_pairs_in_excange)
+
+    if token.pairs_hash == pairs_hash:
+        logger.info("allPairs not changed")
+        return
+
+    logger.info(
+        f"allPairs:{len(token.pairs)} pairs:{len(changed)} changed "
+        f"in {(perf_counter() - start) * 1000:.2f}ms",
+    )
+    await asyncio.to_thread(save_pairs_cache, all_token_pairs_in_excange)
+
+
+async def get_actual_token_stats(
+    access: Access,
+    stats: Stats,
+    delivery: Delivery,
+) -> None:
+    """Get actual all tokens stats."""
+    token = stats.token
+    await get_available_funds(access, stats)
+    await get_tokens(access, token)
+
+    msg = delivery.telegram.get_telegram_msg(token)
+    logger.warning(msg)
+    delivery.send(msg)  # sent by queue in background
+
+
+def balance(stats: Stats, entry: KeyValue.Entry) -> None:
+    """Update stats by balance of token.
+
+    recieve in format
+    {"symbol": "TRXUSDT", "baseincrement": "0.00010000", "available": "0"}
+    """
+    data = orjson.loads(entry.value)
+    stats.update_balance(data["symbol"], data["available"], get_now())
+
+
+async def load_balance(watcher: KeyValue.KeyWatcher, stats: Stats) -> None:
+    """Load last balance of all tokens by one read of KV bucket."""
+    # watcher send last value of each key, None after all of them
+    while entry := await watcher.updates(timeout=None):
+        if entry.operation is None:  # skip DEL and PURGE
+            balance(stats, entry)
+
+    logger.info(f"Snapshot balance:{len(stats.available)} keys")
+
+
+async def watch_balance(watcher: KeyValue.KeyWatcher, stats: Stats) -> None:
+    """Infinity watch changes of balance."""
+    while True:
+        entry = await watcher.updates(timeout=None)
+
+        if entry is not None and entry.operation is None:  # skip DEL and PURGE
+            balance(stats, entry)
+
+
+async def candle(stats: Stats, msg: Msg) -> None:
+    """Update stats by open price of new candle.
+
+    recieve in format
+    {"TRXUSDT": "0.38640000"} on candle.7.TRXUSDT
+    {"TRXUSDT": "0.38640000", "BTCUSDT": "97000.01"} on candle.7.all
+    """
+    now = get_now()
+    for symbol, price in orjson.loads(msg.data).items():
+        stats.update_price(symbol, price, now)
+
+
+async def stats_reply(stats: Stats, msg: Msg) -> None:
+    """Reply current stats on request."""
+    await msg.respond(orjson.dumps(stats.get_stats()))
+
+
+async def main() -> None:
+    """Main func in microservice.
+
+    stats updated by balance and candle events and served on
+    STATS_SUBJECT, wait second to next time with 10:00 minutes equals
+    in infinity loop to run get_actual_token_stats for reconcile
+    """
+    logger.info("Run Alertest microservice")
+    start_metrics()
+
+    # Access object
+    access = Access(
+        key=config("KEY", cast=str),
+        secret=config("SECRET", cast=str),
+        base_uri=API_URI,
+    )
+
+    # Token's object
+    token = Token(
+        time_shift=config("TIME_SHIFT", cast=str, default="1h"),
+        base_stable=config("BASE_STABLE", cast=str, default="USDT"),
+        currency=config("ALLCURRENCY", cast=Csv(str)),
+        ignore_currency=config("IGNORECURRENCY", cast=Csv(str)),
+        base_keep=Decimal(config("BASE_KEEP", cast=int)),
+    )
+
+    # Telegram object
+    telegram = Telegram(
+        telegram_bot_key=config("TELEGRAM_BOT_API_KEY", cast=str),
+        telegram_bot_chat_id=config("TELEGRAM_BOT_CHAT_ID", cast=Csv(str)),
+        telegram_uri=config(
+            "TELEGRAM_URI",
+            cast=str,
+            default="https://api.telegram.org",
+        ),
+    )
+
+    # Messages to all chats by rate limits without wait of sending
+    delivery = Delivery(telegram)
+
+    # Tokens by saved allPairs, first request only diff with it
+    token.update_pairs(load_pairs_cache() or b"[]")
+
+    stats = Stats(token)
+
+    nc = await get_nats_client()
+    js = nc.jetstream()
+
+    # Balance before prices, only change of balance is fill
+    watcher = await (await get_kv_balance(js)).watchall()
+    await load_balance(watcher, stats)
+
+    # Last candle of each subject first, then new ones
+    await js.subscribe("candle.>", ordered_consumer=True, cb=partial(candle, stats))
+    await nc.subscribe(STATS_SUBJECT, cb=partial(stats_reply, stats))
+
+    watch_task = asyncio.create_task(watch_balance(watcher, stats))
+    delivery_task = asyncio.create_task(delivery.run())
+
+    try:
+        await get_actual_token_stats(
+            access,
+            stats,
+            delivery,
+        )
+
+        while True:
+            wait_seconds = get_seconds_to_next_minutes(10)
+
+            logger.info(f"Wait {wait_seconds} to run get_actual_token_stats")
+            await asyncio.sleep(wait_seconds)
+
+            await get_actual_token_stats(
+                access,
+                stats,
+                delivery,
+            )
+    finally:
+        watch_task.cancel()
+        delivery_task.cancel()
+        await nc.close()
+        await close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,157 +1,264 @@
-"""Classes for work."""
-
-import hashlib
-import hmac
-from decimal import Decimal
-from typing import Self
-
-
-class Access:
-    """Class for store access condention to exchange."""
-
-    def __init__(self, key: str, secret: str, base_uri: str) -> None:
-        """Init access condention keys."""
-        self.key: str = key
-        self.secret: str = secret
-        self.base_uri: str = base_uri
-
-    def encrypted(self: Self, msg: str) -> str:
-        """Encrypted msg for exchange."""
-        return hmac.new(
-            self.secret.encode("utf-8"),
-            msg.encode("utf-8"),
-            hashlib.sha256,
-        ).hexdigest()
-
-
-class Token:
-    """Class for store token data for trade."""
-
-    def __init__(
-        self: Self,
-        currency: list,
-        ignore_currency: list,
-        base_keep: Decimal,
-        time_shift: str = "1h",
-        base_stable: str = "USDT",
-    ) -> None:
-        """Init class for store trade tokens."""
-        self.trade_currency: list[str] = currency  # Tokens for trade in bot
-        self.ignore_currency: list[str] = ignore_currency
-        self.base_keep: Decimal = base_keep
-        self.base_stable: str = base_stable
-        self.time_shift: str = time_shift
-        self.borrow_size: Decimal = Decimal("0")
-        self.avail_size: Decimal = Decimal("0")
-
-        self.accept_tokens: list[str] = []  # tradable tokens
-        self.new_tokens: list[str] = (
-            []
-        )  # tokens that can be traded but are not in the bot
-        self.del_tokens: list[str] = (
-            []
-        )  # tokens that have been removed from the exchange
-        self.history: dict = {}
-
-    def init_history(self: Self) -> None:
-        """Init history."""
-        self.history = {f"{key}-{self.base_stable}": "" for key in self.trade_currency}
-
-    def get_candles_for_kline(self: Self, tokens: list) -> str:
-        """Get str candles for kline websocket."""
-        return ",".join(
-            [f"{sym}-{self.base_stable}_{self.time_shift}" for sym in tokens],
-        )
-
-    def get_clear_borrow(self: Self) -> Decimal:
-        """Get clear borrow size."""
-        return self.borrow_size - self.avail_size
-
-    def get_percent_borrow(self: Self) -> int:
-        """Get percent of borrowing."""
-        return (
-            self.get_clear_borrow()
-            * 100
-            / (self.get_len_trade_currency() * self.base_keep)
-        )
-
-    def get_len_trade_currency(self: Self) -> int:
-        """Get len of trade_currency."""
-        return len(self.trade_currency)
-
-    def get_len_accept_tokens(self: Self) -> int:
-        """Get len of accept_tokens."""
-        return len(self.accept_tokens)
-
-    def get_len_del_tokens(self: Self) -> int:
-        """Get len del_tokens."""
-        return len(self.del_tokens)
-
-    def get_len_ignore_currency(self: Self) -> int:
-        """Get len of ignore_currency."""
-        return len(self.ignore_currency)
-
-    def get_len_new_tokens(self: Self) -> int:
-        """Get len of new_tokens."""
-        return len(self.new_tokens)
-
-    def save_accept_tokens(self: Self, all_token_in_excange: list) -> None:
-        """Save all accepted token."""
-        self.accept_tokens = [
-            token_in_excange["base"]
-            for token_in_excange in all_token_in_excange
-            if token_in_excange["quote"] == "USDT"
-            and token_in_excange["base"] not in self.ignore_currency
-            and token_in_excange["isMarginTrade"]
-            and token_in_excange["isBuyAllowed"]
-        ]
-
-    def save_new_tokens(self: Self, all_token_in_excange: list) -> None:
-        """Get all new token for trade."""
-        self.new_tokens = [
-            token_in_excange["base"]
-            for token_in_excange in all_token_in_excange
-            if token_in_excange["quote"] == "USDT"
-            and token_in_excange["isMarginTrade"]
-            and token_in_excange["base"] not in self.trade_currency
-            and token_in_excange["base"] not in self.ignore_currency
-        ]
-
-    def save_del_tokens(self: Self) -> None:
-        """Show all token which deleted from accept_tokens but exist in trade_currency."""
-        self.del_tokens = [
-            used for used in self.trade_currency if used not in self.accept_tokens
-        ]
-
-
-class Telegram:
-    """Class for store access to telegram."""
-
-    def __init__(self, telegram_bot_key: str, telegram_bot_chat_id: str) -> None:
-        """Init API KEY for telegram."""
-        self.telegram_bot_key = telegram_bot_key
-        self.telegram_bot_chat_id: list = telegram_bot_chat_id
-
-    def get_telegram_url(self: Self) -> str:
-        """Return telegram url."""
-        return f"https://api.telegram.org/bot{self.telegram_bot_key}/sendMessage"
-
-    def get_bot_chat_id(self: Self) -> list:
-        """Return list chat id users."""
-        return self.telegram_bot_chat_id
-
-    def get_telegram_msg(self: Self, token: Token) -> str:
-        """Prepare telegram msg.
-
-        ALL TOKENS All tokens accepted by rules trade on margin and quote by USDT
-        """
-        return f"""<b>Binance</b>
-
-<i>KEEP</i>:{token.base_keep}
-<i>USDT</i>:{token.avail_size:.2f}
-<i>BORROWING USDT</i>:{token.get_clear_borrow():.2f} ({token.get_percent_borrow():.2f}%)
-<i>ALL TOKENS</i>:{token.get_len_accept_tokens()}
-<i>USED TOKENS</i>({token.get_len_trade_currency()}):{",".join(token.trade_currency)}
-<i>DELETED</i>({token.get_len_del_tokens()}):{",".join(token.del_tokens)}
-<i>NEW</i>({len(token.new_tokens)}):{",".join(token.new_tokens)}
-<i>IGNORE</i>({len(token.ignore_currency)}):{",".join(token.ignore_currency)}"""
+"""Classes for work."""
+
+import hashlib
+import hmac
+from decimal import Decimal
+from typing import Self
+
+import orjson
+
+
+class Access:
+    """Class for store access condention to exchange."""
+
+    def __init__(self, key: str, secret: str, base_uri: str) -> None:
+        """Init access condention keys."""
+        self.key: str = key
+        self.secret: str = secret
+        self.base_uri: str = base_uri
+
+    def encrypted(self: Self, msg: str) -> str:
+        """Encrypted msg for exchange."""
+        return hmac.new(
+            self.secret.encode("utf-8"),
+            msg.encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+
+
+class Token:
+    """Class for store token data for trade."""
+
+    def __init__(
+        self: Self,
+        currency: list,
+        ignore_currency: list,
+        base_keep: Decimal,
+        time_shift: str = "1h",
+        base_stable: str = "USDT",
+    ) -> None:
+        """Init class for store trade tokens."""
+        self.trade_currency: list[str] = currency  # Tokens for trade in bot
+        self.ignore_currency: list[str] = ignore_currency
+        self.base_keep: Decimal = base_keep
+        self.base_stable: str = base_stable
+        self.time_shift: str = time_shift
+        self.borrow_size: Decimal = Decimal("0")
+        self.avail_size: Decimal = Decimal("0")
+
+        self.accept_tokens: list[str] = []  # tradable tokens
+        self.new_tokens: list[str] = (
+            []
+        )  # tokens that can be traded but are not in the bot
+        self.del_tokens: list[str] = (
+            []
+        )  # tokens that have been removed from the exchange
+        self.history: dict = {}
+
+        # Index of allPairs by base asset for diff with next snapshot
+        self.trade_set: set[str] = set(currency)
+        self.ignore_set: set[str] = set(ignore_currency)
+        self.pairs: dict[str, dict] = {}  # pair with base_stable quote by base
+        self.pairs_hash: str = ""
+        self.accept_set: set[str] = set()
+        self.new_set: set[str] = set()
+
+    def init_history(self: Self) -> None:
+        """Init history."""
+        self.history = {f"{key}-{self.base_stable}": "" for key in self.trade_currency}
+
+    def get_candles_for_kline(self: Self, tokens: list) -> str:
+        """Get str candles for kline websocket."""
+        return ",".join(
+            [f"{sym}-{self.base_stable}_{self.time_shift}" for sym in tokens],
+        )
+
+    def get_clear_borrow(self: Self) -> Decimal:
+        """Get clear borrow size."""
+        return self.borrow_size - self.avail_size
+
+    def get_percent_borrow(self: Self) -> int:
+        """Get percent of borrowing."""
+        return (
+            self.get_clear_borrow()
+            * 100
+            / (self.get_len_trade_currency() * self.base_keep)
+        )
+
+    def get_len_trade_currency(self: Self) -> int:
+        """Get len of trade_currency."""
+        return len(self.trade_currency)
+
+    def get_len_accept_tokens(self: Self) -> int:
+        """Get len of accept_tokens."""
+        return len(self.accept_tokens)
+
+    def get_len_del_tokens(self: Self) -> int:
+        """Get len del_tokens."""
+        return len(self.del_tokens)
+
+    def get_len_ignore_currency(self: Self) -> int:
+        """Get len of ignore_currency."""
+        return len(self.ignore_currency)
+
+    def get_len_new_tokens(self: Self) -> int:
+        """Get len of new_tokens."""
+        return len(self.new_tokens)
+
+    def is_accept(self: Self, pair: dict) -> bool:
+        """Check pair is tradable on margin by rules."""
+        return (
+            pair["base"] not in self.ignore_set
+            and pair["isMarginTrade"]
+            and pair["isBuyAllowed"]
+        )
+
+    def is_new(self: Self, pair: dict) -> bool:
+        """Check pair can be traded but not in the bot."""
+        return (
+            pair["isMarginTrade"]
+            and pair["base"] not in self.trade_set
+            and pair["base"] not in self.ignore_set
+        )
+
+    def update_pairs(self: Self, all_token_in_excange: bytes) -> set[str]:
+        """Update tokens by changed pairs of allPairs snapshot.
+
+        skip all if content hash same as last snapshot,
+        result is base assets with changed pair
+        """
+        pairs_hash = hashlib.sha256(all_token_in_excange).hexdigest()
+        if pairs_hash == self.pairs_hash:
+            return set()
+
+        pairs = {
+            pair["base"]: pair
+            for pair in orjson.loads(all_token_in_excange)
+            if pair["quote"] == self.base_stable
+        }
+        changed = {
+            base
+            for base in pairs.keys() | self.pairs.keys()
+            if pairs.get(base) != self.pairs.get(base)
+        }
+
+        for base in changed:
+            pair = pairs.get(base)
+            for tokens, rule in [
+                (self.accept_set, self.is_accept),
+                (self.new_set, self.is_new),
+            ]:
+                if pair is not None and rule(pair):
+                    tokens.add(base)
+                else:
+                    tokens.discard(base)
+
+        self.pairs = pairs
+        self.pairs_hash = pairs_hash
+
+        # lists for report keep order of pairs on exchange
+        if changed:
+            self.accept_tokens = [base for base in pairs if base in self.accept_set]
+            self.new_tokens = [base for base in pairs if base in self.new_set]
+            self.del_tokens = [
+                used for used in self.trade_currency if used not in self.accept_set
+            ]
+        return changed
+
+
+class Stats:
+    """Class for keep portfolio figures by balance and candle events.
+
+    each event change only own symbol, so update is O(1):
+    value of tokens = sum(available * price), USDT change by fill notional,
+    USDT and borrow reset by reconciliation with margin account
+    """
+
+    def __init__(self: Self, token: Token) -> None:
+        """Init empty figures."""
+        self.token: Token = token
+        self.available: dict[str, Decimal] = {}
+        self.prices: dict[str, Decimal] = {}
+        self.value: Decimal = Decimal("0")  # tokens value in USDT
+        self.drift: Decimal = Decimal("0")  # USDT estimate error on last reconcile
+        self.updated_at: int = 0  # ms of last event
+
+    def update_balance(self: Self, symbol: str, available: str, now: int) -> None:
+        """Change available of symbol, USDT change by opposite side of fill.
+
+        available is free size with locked by resting sell order
+        """
+        change = Decimal(available) - self.available.get(symbol, Decimal("0"))
+        self.available[symbol] = Decimal(available)
+        self.updated_at = now
+
+        if symbol in self.prices:
+            notional = change * self.prices[symbol]
+            self.value += notional
+            self.token.avail_size -= notional
+
+    def update_price(self: Self, symbol: str, price: str, now: int) -> None:
+        """Change price of symbol by open price of new candle."""
+        change = Decimal(price) - self.prices.get(symbol, Decimal("0"))
+        self.prices[symbol] = Decimal(price)
+        self.updated_at = now
+
+        self.value += change * self.available.get(symbol, Decimal("0"))
+
+    def reconcile(self: Self, avail_size: Decimal, borrow_size: Decimal) -> None:
+        """Reset USDT and borrow by margin account, save error of estimate."""
+        self.drift = avail_size - self.token.avail_size
+        self.token.avail_size = avail_size
+        self.token.borrow_size = borrow_size
+
+    def get_stats(self: Self) -> dict:
+        """Get current figures for reply."""
+        return {
+            "value": str(self.value + self.token.avail_size),
+            "tokens": str(self.value),
+            "usdt": str(self.token.avail_size),
+            "borrow": str(self.token.get_clear_borrow()),
+            "borrow_percent": f"{self.token.get_percent_borrow():.2f}",
+            "drift": str(self.drift),
+            "priced": len(self.prices),
+            "updated_at": self.updated_at,
+        }
+
+
+class Telegram:
+    """Class for store access to telegram."""
+
+    def __init__(
+        self,
+        telegram_bot_key: str,
+        telegram_bot_chat_id: str,
+        telegram_uri: str = "https://api.telegram.org",
+    ) -> None:
+        """Init API KEY for telegram."""
+        self.telegram_bot_key = telegram_bot_key
+        self.telegram_bot_chat_id: list = telegram_bot_chat_id
+        self.telegram_uri: str = telegram_uri
+
+    def get_telegram_url(self: Self) -> str:
+        """Return telegram url."""
+        return f"{self.telegram_uri}/bot{self.telegram_bot_key}/sendMessage"
+
+    def get_bot_chat_id(self: Self) -> list:
+        """Return list chat id users."""
+        return self.telegram_bot_chat_id
+
+    def get_telegram_msg(self: Self, token: Token) -> str:
+        """Prepare telegram msg.
+
+        ALL TOKENS All tokens accepted by rules trade on margin and quote by USDT
+        """
+        return f"""<b>Binance</b>
+
+<i>KEEP</i>:{token.base_keep}
+<i>USDT</i>:{token.avail_size:.2f}
+<i>BORROWING USDT</i>:{token.get_clear_borrow():.2f} ({token.get_percent_borrow():.2f}%)
+<i>ALL TOKENS</i>:{token.get_len_accept_tokens()}
+<i>USED TOKENS</i>({token.get_len_trade_currency()}):{",".join(token.trade_currency)}
+<i>DELETED</i>({token.get_len_del_tokens()}):{",".join(token.del_tokens)}
+<i>NEW</i>({len(token.new_tokens)}):{",".join(token.new_tokens)}
+<i>IGNORE</i>({len(token.ignore_currency)}):{",".join(token.ignore_currency)}"""
@@ -0,0 +1,180 @@
+"""Nats tools for get js context."""
+
+import hashlib
+from contextlib import suppress
+from time import perf_counter
+
+from decouple import config
+from loguru import logger
+from nats.aio.client import Client
+from nats.js import JetStreamContext
+from nats.js.api import DiscardPolicy, StorageType, StreamConfig
+from nats.js.errors import NotFoundError
+from nats.js.kv import KeyValue
+
+NATS_STORAGE = config("NATS_STORAGE", cast=str, default="file")
+CANDLE_MAX_AGE = config("CANDLE_MAX_AGE", cast=int, default=60 * 60 * 2)  # seconds
+FILTERS_TTL = config("FILTERS_TTL", cast=int, default=60 * 60 * 2)  # seconds
+CANDLE_SHARDS = config("CANDLE_SHARDS", cast=int, default=32)
+
+
+async def disconnected_cb(*args: list) -> None:
+    """CallBack на отключение от nats."""
+    logger.error(f"Got disconnected... {args}")
+
+
+async def reconnected_cb(*args: list) -> None:
+    """CallBack на переподключение к nats."""
+    logger.error(f"Got reconnected... {args}")
+
+
+async def error_cb(excep: Exception) -> None:
+    """CallBack на ошибку подключения к nats."""
+    logger.error(f"Error ... {excep}")
+
+
+async def closed_cb(*args: list) -> None:
+    """CallBack на закрытие подключения к nats."""
+    logger.error(f"Closed ... {args}")
+
+
+async def get_nats_client() -> Client:
+    """Get connected nats client."""
+    nc = Client()
+
+    await nc.connect(
+        servers="bnnc_nats",
+        max_reconnect_attempts=-1,
+        reconnected_cb=reconnected_cb,
+        disconnected_cb=disconnected_cb,
+        error_cb=error_cb,
+        closed_cb=closed_cb,
+    )
+
+    return nc
+
+
+async def get_js_context() -> JetStreamContext:
+    """Get JetStream Context."""
+    return (await get_nats_client()).jetstream()
+
+
+async def get_kv_balance(js: JetStreamContext) -> KeyValue:
+    """Get KV bucket with last balance of each symbol.
+
+    key BTCUSDT, value {"symbol": "BTCUSDT", "baseincrement": "0.0001", "available": "0"}
+    """
+    return await js.create_key_value(bucket="balance", history=1)
+
+
+async def get_kv_filters(js: JetStreamContext) -> KeyValue:
+    """Get KV bucket with exchange filters of each symbol.
+
+    key BTCUSDT, value {"symbol": "BTCUSDT", "tickSize": "0.01", ...}
+    """
+    return await js.create_key_value(bucket="filters", history=1, ttl=FILTERS_TTL)
+
+
+async def get_kv_replicas(js: JetStreamContext, ttl: float) -> KeyValue:
+    """Get KV bucket of live Processor replicas.
+
+    key is replica id, removed after ttl without heartbeat
+    """
+    return await js.create_key_value(bucket="replicas", history=1, ttl=ttl)
+
+
+async def get_kv_claims(js: JetStreamContext) -> KeyValue:
+    """Get KV bucket of claims on trade of symbol by candle message.
+
+    key BTCUSDT.123 (symbol and stream sequence), only one replica can create
+    """
+    return await js.create_key_value(
+        bucket="claims",
+        history=1,
+        ttl=CANDLE_MAX_AGE,
+    )
+
+
+def get_shard(symbol: str) -> int:
+    """Get shard of symbol by stable hash, same in all services."""
+    digest = hashlib.md5(symbol.encode("utf-8"), usedforsecurity=False).digest()
+    return int.from_bytes(digest[:8], "big") % CANDLE_SHARDS
+
+
+def get_shard_subject(shard: int) -> str:
+    """Get subject filter of all candles of shard."""
+    return f"candle.{shard}.>"
+
+
+def get_stream_config() -> StreamConfig:
+    """Get layout of bnnc stream.
+
+    candle.7.BTCUSDT - candle of one symbol of shard 7
+    candle.7.all - candles of all symbols of shard 7 on one boundary
+    all candles not older CANDLE_MAX_AGE are kept for replay,
+    state with only last value (balance and filters by symbol) is in KV
+    buckets instead of balance.BTCUSDT subjects, see get_kv_balance
+    """
+    return StreamConfig(
+        name="bnnc",
+        subjects=["candle.>"],
+        storage=StorageType(NATS_STORAGE),
+        max_age=CANDLE_MAX_AGE,
+        max_msgs_per_subject=-1,
+        discard=DiscardPolicy.OLD,
+    )
+
+
+async def measure_replay(js: JetStreamContext, name: str) -> float:
+    """Get seconds for replay all messages of stream by new consumer."""
+    info = await js.stream_info(name)
+    start = perf_counter()
+
+    for subject in info.config.subjects:
+        sub = await js.subscribe(subject, ordered_consumer=True)
+        pending = (await sub.consumer_info()).num_pending
+
+        for _ in range(pending):
+            await sub.next_msg(timeout=5)
+
+        await sub.unsubscribe()
+
+    elapsed = perf_counter() - start
+    logger.info(f"Replay {name}:{info.state.messages} msgs in {elapsed:.3f}s")
+    return elapsed
+
+
+async def setup_stream(js: JetStreamContext) -> None:
+    """Create bnnc stream by layout, migrate old stream if need."""
+    stream = get_stream_config()
+
+    try:
+        info = await js.stream_info(stream.name)
+    except NotFoundError:
+        await js.add_stream(stream)
+        return
+
+    if (
+        info.config.subjects == stream.subjects
+        and info.config.storage == stream.storage
+        and info.config.max_msgs_per_subject == stream.max_msgs_per_subject
+        and int(info.config.max_age or 0) == stream.max_age
+    ):
+        return  # already in actual layout
+
+    before = await measure_replay(js, stream.name)
+
+    if info.config.storage == stream.storage:
+        await js.update_stream(stream)
+
+        # durable consumers of old subjects
+        for durable in ["candle", "balance"]:
+            with suppress(NotFoundError):
+                await js.delete_consumer(stream.name, durable)
+    else:
+        # storage can't be changed on existing stream
+        await js.delete_stream(stream.name)
+        await js.add_stream(stream)
+
+    after = await measure_replay(js, stream.name)
+    logger.warning(f"Migrate stream {stream.name}: replay {before:.3f}s -> {after:.3f}s")
@@ -0,0 +1,143 @@
+"""Check Delivery against local stand-in of Telegram Bot API."""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from time import monotonic
+
+import pytest
+from aiohttp import web
+
+import delivery
+from delivery import Delivery
+from httplocal import close_session
+from models import Telegram
+
+CHATS = ["1", "2"]
+CHAT_INTERVAL = 0.2  # seconds between messages of one chat
+RETRY_AFTER = 0.5  # seconds in answer 429 of stand-in
+WAIT = 5.0  # seconds for all messages
+
+
+class TelegramStandIn:
+    """Telegram Bot API which save messages and limit chats by 429."""
+
+    def __init__(self: "TelegramStandIn", limited: set[str]) -> None:
+        """Init stand-in, first message of limited chats get 429."""
+        self.limited = limited
+        self.messages: dict[str, list[tuple[str, float]]] = {}
+        self.attempts: dict[str, list[float]] = {}
+        self.changed = asyncio.Condition()
+
+    async def send_message(
+        self: "TelegramStandIn",
+        request: web.Request,
+    ) -> web.Response:
+        """Save message of chat or answer 429 with retry_after."""
+        data = await request.json()
+        chat_id = data["chat_id"]
+        self.attempts.setdefault(chat_id, []).append(monotonic())
+
+        if chat_id in self.limited:
+            self.limited.discard(chat_id)
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 0.5",
+                    "parameters": {"retry_after": RETRY_AFTER},
+                },
+                status=429,
+            )
+
+        self.messages.setdefault(chat_id, []).append((data["text"], monotonic()))
+        async with self.changed:
+            self.changed.notify_all()
+        return web.json_response({"ok": True, "result": {}})
+
+    async def wait_for(self: "TelegramStandIn", condition: Callable[[], bool]) -> None:
+        """Wait until condition on delivered messages is true."""
+        async with asyncio.timeout(WAIT), self.changed:
+            await self.changed.wait_for(condition)
+
+    def get_texts(self: "TelegramStandIn", chat_id: str) -> list[str]:
+        """Get delivered texts of chat in order."""
+        return [text for text, _ in self.messages.get(chat_id, [])]
+
+    def count(self: "TelegramStandIn") -> int:
+        """Count delivered messages of all chats."""
+        return sum(len(messages) for messages in self.messages.values())
+
+
+@pytest.fixture(autouse=True)
+def fast_delivery(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Short pause of chat, so test not wait real seconds."""
+    monkeypatch.setattr(delivery, "TELEGRAM_CHAT_INTERVAL", CHAT_INTERVAL)
+    monkeypatch.setattr(delivery, "TELEGRAM_RATE", 1000.0)
+
+
+async def run_stand_in(
+    stand_in: TelegramStandIn,
+    scenario: Callable[[Delivery], Awaitable[None]],
+) -> None:
+    """Run scenario on Delivery which send to stand-in."""
+    app = web.Application()
+    app.router.add_post("/bottest/sendMessage", stand_in.send_message)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    port = runner.addresses[0][1]
+    queue = Delivery(Telegram("test", CHATS, telegram_uri=f"http://127.0.0.1:{port}"))
+    task = asyncio.create_task(queue.run())
+    try:
+        await scenario(queue)
+    finally:
+        task.cancel()
+        await close_session()
+        await runner.cleanup()
+
+
+def test_order_and_merge() -> None:
+    """Messages of chat keep order, messages sent in pause merged into one."""
+    stand_in = TelegramStandIn(limited=set())
+
+    async def scenario(queue: Delivery) -> None:
+        queue.send("first")
+        await stand_in.wait_for(lambda: stand_in.count() == len(CHATS))
+
+        # both sent in pause of chat after first
+        queue.send("second")
+        queue.send("third")
+        await stand_in.wait_for(lambda: stand_in.count() == 2 * len(CHATS))
+
+    asyncio.run(run_stand_in(stand_in, scenario))
+
+    assert stand_in.get_texts("1") == ["first", "second\n\nthird"]
+    assert stand_in.get_texts("2") == ["first", "second\n\nthird"]
+
+    (_, first), (_, second) = stand_in.messages["1"]
+    assert second - first >= CHAT_INTERVAL
+
+
+def test_retry_after() -> None:
+    """Chat wait retry_after of 429 and resend, other chat not blocked."""
+    stand_in = TelegramStandIn(limited={"1"})
+
+    async def scenario(queue: Delivery) -> None:
+        queue.send("first")
+        await stand_in.wait_for(lambda: "2" in stand_in.messages)
+
+        # waiting message of limited chat merged with retried one
+        queue.send("second")
+        await stand_in.wait_for(lambda: stand_in.count() == 1 + len(CHATS))
+
+    asyncio.run(run_stand_in(stand_in, scenario))
+
+    assert stand_in.get_texts("1") == ["first\n\nsecond"]
+    assert stand_in.get_texts("2") == ["first", "second"]
+
+    limited, retried = stand_in.attempts["1"]
+    assert retried - limited >= RETRY_AFTER
+    assert stand_in.messages["2"][0][1] < retried
@@ -0,0 +1,99 @@
+"""Check Token.update_pairs and compare it with former list checks."""
+
+from decimal import Decimal
+from time import perf_counter
+
+import orjson
+
+from models import Token
+
+PAIRS = 5000  # pairs of synthetic allPairs, USDT quote and others
+TRADED = 200  # tokens of trade_currency
+IGNORED = 20  # tokens of ignore_currency
+
+
+def get_pairs(changed: tuple[int, ...] = ()) -> list[dict]:
+    """Get synthetic allPairs, pairs of changed index not allowed to buy."""
+    return [
+        {
+            "base": f"T{i // 2}",
+            "quote": "USDT" if i % 2 == 0 else "BTC",
+            "isMarginTrade": i % 7 != 0,
+            "isBuyAllowed": i % 11 != 0 and i not in changed,
+        }
+        for i in range(PAIRS)
+    ]
+
+
+def get_token() -> Token:
+    """Get token which trade first and ignore last bases of allPairs."""
+    bases = PAIRS // 2
+    return Token(
+        currency=[f"T{i}" for i in range(0, TRADED * 2, 2)],
+        ignore_currency=[f"T{bases - i}" for i in range(1, IGNORED + 1)],
+        base_keep=Decimal(1000),
+    )
+
+
+def get_former(token: Token, pairs: list[dict]) -> tuple[list, list, list]:
+    """Get accept, new and del tokens by list checks of each pair, former path."""
+    usdt = [pair for pair in pairs if pair["quote"] == "USDT"]
+    accept_tokens = [
+        pair["base"]
+        for pair in usdt
+        if pair["base"] not in token.ignore_currency
+        and pair["isMarginTrade"]
+        and pair["isBuyAllowed"]
+    ]
+    new_tokens = [
+        pair["base"]
+        for pair in usdt
+        if pair["isMarginTrade"]
+        and pair["base"] not in token.trade_currency
+        and pair["base"] not in token.ignore_currency
+    ]
+    del_tokens = [used for used in token.trade_currency if used not in accept_tokens]
+    return accept_tokens, new_tokens, del_tokens
+
+
+def get_lists(token: Token) -> tuple[list, list, list]:
+    """Get accept, new and del tokens of Token."""
+    return token.accept_tokens, token.new_tokens, token.del_tokens
+
+
+def test_benchmark() -> None:
+    """Compare former checks with first index, same and changed snapshot.
+
+    run with -s for report
+    """
+    token = get_token()
+    pairs = get_pairs()
+    changed = get_pairs(changed=(2, 4, 6))
+    payload, changed_payload = orjson.dumps(pairs), orjson.dumps(changed)
+
+    for name, run in (
+        ("former", lambda: get_former(token, orjson.loads(payload))),
+        ("first index", lambda: token.update_pairs(payload)),
+        ("same payload", lambda: token.update_pairs(payload)),
+        ("3 changed", lambda: token.update_pairs(changed_payload)),
+    ):
+        start = perf_counter()
+        run()
+        print(f"\n{name}: {(perf_counter() - start) * 1000:.2f}ms")
+
+    assert get_lists(token) == get_former(token, changed)
+
+
+def test_update_pairs() -> None:
+    """Lists equal former ones in order of exchange, only changed bases returned."""
+    token = get_token()
+
+    assert token.update_pairs(orjson.dumps(get_pairs())) == {
+        f"T{i}" for i in range(PAIRS // 2)
+    }
+    assert get_lists(token) == get_former(token, get_pairs())
+    assert token.update_pairs(orjson.dumps(get_pairs())) == set()
+
+    changed = get_pairs(changed=(2, 4))
+    assert token.update_pairs(orjson.dumps(changed)) == {"T1", "T2"}
+    assert get_lists(token) == get_former(token, changed)
@@ -0,0 +1,98 @@
+"""Vectorized backtest of Processor rebalance for chunk of symbols."""
+
+import numpy as np
+
+# Float tolerance of step boundary, Processor round by Decimal
+EPS = 1e-9
+
+
+def align(
+    klines: list[np.ndarray],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Align klines of symbols by union of open times.
+
+    each kline is array of rows [open_time, open, high, low, close],
+    result are times and matrices time x symbol, nan if no candle
+    """
+    times = np.unique(np.concatenate([kline[:, 0] for kline in klines]))
+    shape = (len(times), len(klines))
+    open_, high, low, close = (np.full(shape, np.nan) for _ in range(4))
+
+    for i, kline in enumerate(klines):
+        rows = np.searchsorted(times, kline[:, 0])
+        open_[rows, i] = kline[:, 1]
+        high[rows, i] = kline[:, 2]
+        low[rows, i] = kline[:, 3]
+        close[rows, i] = kline[:, 4]
+
+    return times, open_, high, low, close
+
+
+def simulate(  # noqa: PLR0913, PLR0917
+    open_: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    steps: np.ndarray,
+    base_keep: float,
+    fee: float,
+) -> dict[str, np.ndarray]:
+    """Run rebalance of each candle for matrices time x symbol.
+
+    Same rule as get_side_and_size: on open price sell down or buy up
+    to base_keep, size rounded down by LOT_SIZE step. Limit order by open
+    price is filled only if price trade through it in candle: low < open
+    for buy, high > open for sell, else canceled by Orderest.
+
+    Balance is int count of steps. After fill it is ceil(keep) for sell and
+    floor(keep) for buy, keep is base_keep in steps by open price.
+
+    Only side of each candle depend on balance after last fill, so it is
+    not vectorized across time: loop go by candles, each step vectorized
+    across symbols, all other figures computed for all candles at once.
+    """
+    valid = ~np.isnan(open_)
+    price = np.where(valid, open_, 1.0)
+
+    # target balance in steps by each open price, all candles by one pass
+    keep = base_keep / (price * steps)
+    floor_keep = np.floor(keep + EPS)
+    ceil_keep = np.ceil(keep - EPS)
+    fill_buy = valid & (low < open_)
+    fill_sell = valid & (high > open_)
+
+    # start balanced on first candle of each symbol
+    first = valid.argmax(axis=0)
+    columns = np.arange(open_.shape[1])
+    start = floor_keep[first, columns]
+
+    # only balance depend on last fill, one small step by candle
+    held = np.empty_like(keep)
+    balance = start.copy()
+    for t in range(len(keep)):
+        sell = balance >= keep[t]
+        balance = np.where(
+            np.where(sell, fill_sell[t], fill_buy[t]),
+            np.where(sell, ceil_keep[t], floor_keep[t]),
+            balance,
+        )
+        held[t] = balance
+
+    # trades and cash by all candles by one pass
+    trade = np.diff(held, axis=0, prepend=start[np.newaxis, :]) * steps
+    notional = np.abs(trade) * price
+    cash = np.cumsum(-trade * price - notional * fee, axis=0)
+
+    last = len(keep) - 1 - valid[::-1].argmax(axis=0)
+    last_close = np.where(np.isnan(close), price, close)[last, columns]
+    initial = start * steps * price[first, columns]
+    final = held[-1] * steps * last_close + cash[-1]
+
+    return {
+        "pnl": final - initial,
+        "initial": initial,
+        "turnover": notional.sum(axis=0),
+        "fees": notional.sum(axis=0) * fee,
+        "trades": (trade != 0).sum(axis=0),
+        "cash": cash.sum(axis=1),  # usdt of chunk by time, negative is borrow
+    }
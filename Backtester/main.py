@@ -0,0 +1,138 @@
+"""Bnnc Backtester.
+
+Offline run of Processor rebalance on historical klines for check
+BASE_KEEP, TIME_SHIFT or symbols before live.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from decouple import Csv, config
+from loguru import logger
+
+from backtest import align, simulate
+from tools import get_interval_ms, load_klines, load_steps, resample
+
+DATA_DIR = Path(config("DATA_DIR", cast=str, default="data"))
+DATA_INTERVAL = config("DATA_INTERVAL", cast=str, default="1h")
+FEE = config("FEE", cast=float, default=0.001)
+STEP_SIZE = config("STEP_SIZE", cast=float, default=0.01)  # if no exchangeInfo
+CHUNK = config("CHUNK", cast=int, default=25)  # symbols by one job
+WORKERS = config("WORKERS", cast=int, default=os.cpu_count() or 1)
+
+
+def get_path(symbol: str) -> Path:
+    """Get path of klines file of symbol, Parquet or CSV."""
+    parquet = DATA_DIR / f"{symbol}.parquet"
+    return parquet if parquet.exists() else DATA_DIR / f"{symbol}.csv"
+
+
+def run_chunk(
+    symbols: list[str],
+    steps: list[float],
+    base_keep: float,
+    time_shift: str,
+) -> dict:
+    """Load klines of chunk and run backtest, run in process of pool."""
+    interval = get_interval_ms(time_shift)
+    klines = [load_klines(get_path(symbol)) for symbol in symbols]
+
+    if interval != get_interval_ms(DATA_INTERVAL):
+        klines = [resample(kline, interval) for kline in klines]
+
+    times, open_, high, low, close = align(klines)
+    result = simulate(open_, high, low, close, np.array(steps), base_keep, FEE)
+
+    return {"symbols": symbols, "times": times, **result}
+
+
+def get_cash(results: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    """Get usdt of all symbols by union of times of chunks."""
+    times = np.unique(np.concatenate([result["times"] for result in results]))
+    cash = np.zeros(len(times))
+
+    for result in results:
+        # last known cash of chunk on each time, 0 before first candle
+        rows = np.searchsorted(result["times"], times, side="right") - 1
+        cash += np.where(rows >= 0, result["cash"][np.maximum(rows, 0)], 0.0)
+
+    return times, cash
+
+
+def report(results: list[dict], base_keep: float) -> None:
+    """Log PnL, turnover and borrow of run."""
+    pnl = np.concatenate([result["pnl"] for result in results])
+    initial = np.concatenate([result["initial"] for result in results])
+    turnover = sum(result["turnover"].sum() for result in results)
+    fees = sum(result["fees"].sum() for result in results)
+    trades = sum(result["trades"].sum() for result in results)
+    symbols = [symbol for result in results for symbol in result["symbols"]]
+
+    times, cash = get_cash(results)
+    borrow = np.maximum(-cash, 0.0)
+
+    logger.success(
+        f"PnL:{pnl.sum():.2f} USDT:{pnl.sum() * 100 / initial.sum():.2f}%:"
+        f"turnover {turnover:.2f}:fees {fees:.2f}:trades {trades}",
+    )
+    logger.success(
+        f"Borrow:max {borrow.max():.2f}:mean {borrow.mean():.2f}:"
+        f"max {borrow.max() * 100 / (base_keep * len(symbols)):.2f}% of keep:"
+        f"{len(times)} candles",
+    )
+
+    order = np.argsort(pnl)
+    for i in [*order[:5], *order[-5:]]:
+        logger.info(f"{symbols[i]}:{pnl[i]:.2f}")
+
+
+def main() -> None:
+    """Main func in microservice."""
+    logger.info("Start Backtester")
+    start = perf_counter()
+
+    base_stable = config("BASE_STABLE", cast=str, default="USDT")
+    base_keep = config("BASE_KEEP", cast=float)
+    time_shift = config("TIME_SHIFT", cast=str, default="1h")
+    ignore = set(config("IGNORECURRENCY", cast=Csv(str), default=""))
+    symbols = [
+        f"{currency}{base_stable}"
+        for currency in config("ALLCURRENCY", cast=Csv(str))
+        if currency not in ignore
+    ]
+
+    saved_steps = load_steps(DATA_DIR / "exchangeInfo.json")
+    steps = [saved_steps.get(symbol, STEP_SIZE) for symbol in symbols]
+
+    # Each process load and run own chunk of symbols
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(
+            pool.map(
+                run_chunk,
+                *zip(
+                    *[
+                        (
+                            symbols[i : i + CHUNK],
+                            steps[i : i + CHUNK],
+                            base_keep,
+                            time_shift,
+                        )
+                        for i in range(0, len(symbols), CHUNK)
+                    ],
+                    strict=True,
+                ),
+            ),
+        )
+
+    report(results, base_keep)
+    logger.info(
+        f"Backtest {len(symbols)} symbols on {WORKERS} workers "
+        f"in {perf_counter() - start:.2f}s",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Check simulate against Decimal rule of Processor candle by candle."""
+
+import random
+from decimal import ROUND_DOWN, Decimal
+
+import numpy as np
+import pytest
+
+from backtest import align, simulate
+
+BASE_KEEP = 1000
+FEE = 0.001
+CANDLES = 500
+HOUR = 60 * 60 * 1000
+
+# LOT_SIZE step of each symbol, symbols start on other candles
+STEPS = ["0.001", "0.01", "0.1", "1"]
+STARTS = [0, 0, 37, 250]
+
+
+def get_side_and_size(
+    available: Decimal,
+    baseincrement: Decimal,
+    price: Decimal,
+    base_keep: Decimal,
+) -> dict:
+    """Get side of trade and size of tokens by Decimal, one symbol.
+
+    Same rule as get_side_and_size of Processor
+    """
+    new_balance = price * available
+
+    if new_balance >= base_keep:
+        tokens_count = (new_balance - base_keep) / price
+        side = "sell"
+    else:
+        tokens_count = (base_keep - new_balance) / price
+        side = "buy"
+
+    return {"side": side, "size": tokens_count.quantize(baseincrement, ROUND_DOWN)}
+
+
+def get_price(rnd: random.Random, low: int, high: int) -> Decimal:
+    """Get random price with 4 decimals as exchange send."""
+    return Decimal(rnd.randrange(low * 10**4, high * 10**4)).scaleb(-4)
+
+
+def get_candles(rnd: random.Random, start: int) -> list[list[Decimal]]:
+    """Get random candles [open_time, open, high, low, close] from start.
+
+    high or low equal open in part of candles, so order is not filled
+    """
+    candles = []
+    for t in range(start, CANDLES):
+        open_ = get_price(rnd, 50, 150)
+        high = open_ + (get_price(rnd, 0, 5) if rnd.random() < 0.7 else 0)
+        low = open_ - (get_price(rnd, 0, 5) if rnd.random() < 0.7 else 0)
+        candles.append([Decimal(t * HOUR), open_, high, low, get_price(rnd, 50, 150)])
+    return candles
+
+
+def replay(candles: list[list[Decimal]], step: Decimal) -> dict:
+    """Get trades, turnover and final balance by Decimal rule of each candle.
+
+    start balanced on first candle, limit order by open price filled only
+    if candle trade through it
+    """
+    base_keep = Decimal(BASE_KEEP)
+    _, first, *_ = candles[0]
+    available = (base_keep / first).quantize(step, ROUND_DOWN)
+
+    trades, turnover = 0, Decimal(0)
+    for _, open_, high, low, _ in candles:
+        sidze = get_side_and_size(available, step, open_, base_keep)
+        sell = sidze["side"] == "sell"
+        if sidze["size"] and (high > open_ if sell else low < open_):
+            available += -sidze["size"] if sell else sidze["size"]
+            trades += 1
+            turnover += sidze["size"] * open_
+
+    return {"trades": trades, "turnover": turnover, "available": available}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_same_as_processor(seed: int) -> None:
+    """Trades and turnover of each symbol equal Decimal rule of Processor."""
+    rnd = random.Random(seed)
+    candles = [get_candles(rnd, start) for start in STARTS]
+
+    _, open_, high, low, close = align(
+        [np.array(symbol_candles, dtype=float) for symbol_candles in candles],
+    )
+    result = simulate(
+        open_,
+        high,
+        low,
+        close,
+        np.array(STEPS, dtype=float),
+        BASE_KEEP,
+        FEE,
+    )
+
+    expected = [
+        replay(symbol_candles, Decimal(step))
+        for symbol_candles, step in zip(candles, STEPS, strict=True)
+    ]
+    assert result["trades"].tolist() == [symbol["trades"] for symbol in expected]
+    assert result["turnover"] == pytest.approx(
+        [float(symbol["turnover"]) for symbol in expected],
+        rel=1e-12,
+    )
+    assert all(symbol["trades"] for symbol in expected)
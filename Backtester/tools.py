@@ -0,0 +1,78 @@
+"""Tools for load historical data of Backtester."""
+
+from pathlib import Path
+
+import numpy as np
+import orjson
+
+COLUMNS = ["open_time", "open", "high", "low", "close"]
+
+# data.binance.vision use microseconds since 2025
+MICROSECONDS_START = 10**14
+
+
+def load_klines(path: Path) -> np.ndarray:
+    """Load klines from CSV or Parquet file.
+
+    rows [open_time, open, high, low, close] sorted by open_time in ms,
+    CSV in format of data.binance.vision with or without header
+    """
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq  # noqa: PLC0415
+
+        table = pq.read_table(path, columns=COLUMNS)
+        klines = np.column_stack(
+            [table[column].to_numpy().astype(float) for column in COLUMNS],
+        )
+    else:
+        with path.open() as file:
+            header = not file.readline()[:1].isdigit()
+        klines = np.loadtxt(
+            path,
+            delimiter=",",
+            usecols=range(5),
+            skiprows=int(header),
+            ndmin=2,
+        )
+
+    klines[klines[:, 0] > MICROSECONDS_START, 0] //= 1000
+    return klines[np.argsort(klines[:, 0], kind="stable")]
+
+
+def resample(klines: np.ndarray, interval: int) -> np.ndarray:
+    """Resample klines to bigger interval in ms, 1h to 4h."""
+    groups = klines[:, 0] // interval
+    _, starts = np.unique(groups, return_index=True)
+
+    return np.column_stack(
+        [
+            groups[starts] * interval,
+            klines[starts, 1],
+            np.maximum.reduceat(klines[:, 2], starts),
+            np.minimum.reduceat(klines[:, 3], starts),
+            klines[np.append(starts[1:], len(klines)) - 1, 4],
+        ],
+    )
+
+
+def load_steps(path: Path) -> dict[str, float]:
+    """Load LOT_SIZE stepSize by symbol from saved exchangeInfo response."""
+    if not path.exists():
+        return {}
+
+    return {
+        symbol["symbol"]: float(
+            next(
+                f["stepSize"]
+                for f in symbol["filters"]
+                if f["filterType"] == "LOT_SIZE"
+            ),
+        )
+        for symbol in orjson.loads(path.read_bytes())["symbols"]
+    }
+
+
+def get_interval_ms(time_shift: str) -> int:
+    """Get length of candle in milliseconds, 1h -> 3600000."""
+    units = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}
+    return int(time_shift[:-1]) * units[time_shift[-1]]
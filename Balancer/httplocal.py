@@ -0,0 +1,217 @@
+"""Http tools for get shared aiohttp session."""
+
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from time import perf_counter, time
+from typing import Self
+from urllib.parse import urlsplit
+
+import aiohttp
+from decouple import config
+from loguru import logger
+
+from metricslocal import HTTP_LATENCY, RATE_BANNED_UNTIL, RATE_REMAINING, RATE_USED
+
+HTTP_POOL_LIMIT = config("HTTP_POOL_LIMIT", cast=int, default=100)
+HTTP_POOL_LIMIT_PER_HOST = config("HTTP_POOL_LIMIT_PER_HOST", cast=int, default=50)
+HTTP_DNS_CACHE_TTL = config("HTTP_DNS_CACHE_TTL", cast=int, default=300)
+HTTP_KEEPALIVE_TIMEOUT = config("HTTP_KEEPALIVE_TIMEOUT", cast=int, default=60)
+HTTP_TIMEOUT = config("HTTP_TIMEOUT", cast=int, default=10)
+
+# Base URIs of exchange, change on local simulator for load test
+API_URI = config("BINANCE_API_URI", cast=str, default="https://api.binance.com")
+STREAM_URI = config(
+    "BINANCE_STREAM_URI",
+    cast=str,
+    default="wss://stream.binance.com:443",
+)
+
+# Limits of Binance per IP/account, keep a safety margin from real limit
+API_WEIGHT_LIMIT = config("API_WEIGHT_LIMIT", cast=int, default=5400)
+SAPI_WEIGHT_LIMIT = config("SAPI_WEIGHT_LIMIT", cast=int, default=10800)
+ORDER_LIMIT_10S = config("ORDER_LIMIT_10S", cast=int, default=90)
+
+# Request weight of endpoints used in tools.py
+ENDPOINT_WEIGHT = {
+    ("GET", "/api/v3/exchangeInfo"): 20,
+    ("GET", "/api/v3/klines"): 2,
+    ("GET", "/sapi/v1/margin/account"): 10,
+    ("GET", "/sapi/v1/margin/allPairs"): 1,
+    ("GET", "/sapi/v1/margin/openOrders"): 10,
+    ("POST", "/sapi/v1/margin/order"): 6,
+    ("DELETE", "/sapi/v1/margin/order"): 10,
+    ("DELETE", "/sapi/v1/margin/openOrders"): 1,
+    ("POST", "/sapi/v1/userDataStream"): 1,
+    ("PUT", "/sapi/v1/userDataStream"): 1,
+}
+DEFAULT_WEIGHT = 10
+ORDER_ENDPOINTS = {("POST", "/sapi/v1/margin/order")}
+
+session: aiohttp.ClientSession | None = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Get long-lived session with keep-alive connection pool.
+
+    One session on process, all requests reuse DNS, TCP and TLS.
+    """
+    global session  # noqa: PLW0603
+
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+
+    return session
+
+
+async def close_session() -> None:
+    """Close shared session and all pooled connections."""
+    if session is not None and not session.closed:
+        await session.close()
+
+
+class Bucket:
+    """Class for store used weight in fixed window of exchange."""
+
+    def __init__(self: Self, header: str, limit: int, window: int) -> None:
+        """Init empty bucket."""
+        self.header: str = header
+        self.limit: int = limit
+        self.window: int = window
+        self.window_id: int = 0
+        self.used: int = 0
+        self.peak: int = 0
+
+    def roll(self: Self, now: float) -> None:
+        """Refill bucket when new window started."""
+        window_id = int(now // self.window)
+        if window_id != self.window_id:
+            if self.peak:
+                logger.info(
+                    f"Budget {self.header}:{self.peak}/{self.limit}",
+                )
+            self.window_id = window_id
+            self.used = 0
+            self.peak = 0
+
+    def get_delay(self: Self, now: float, cost: int) -> float:
+        """Get seconds to wait before spend cost."""
+        self.roll(now)
+        if self.used + cost <= self.limit:
+            return 0.0
+        return (self.window_id + 1) * self.window - now
+
+    def get_used(self: Self) -> int:
+        """Get used weight in current window without roll, safe from other thread."""
+        return self.used if int(time() // self.window) == self.window_id else 0
+
+    def get_remaining(self: Self) -> int:
+        """Get weight left in current window."""
+        return self.limit - self.get_used()
+
+    def spend(self: Self, cost: int) -> None:
+        """Spend weight from bucket."""
+        self.used += cost
+        self.peak = max(self.peak, self.used)
+
+    def sync(self: Self, headers: dict, now: float) -> None:
+        """Sync used weight with exchange header.
+
+        Exchange count weight of all services on this IP
+        """
+        used = headers.get(self.header)
+        if used is not None:
+            self.roll(now)
+            self.used = max(self.used, int(used))
+            self.peak = max(self.peak, self.used)
+
+
+class RateGovernor:
+    """Class for hold request weight under exchange limits."""
+
+    def __init__(self: Self) -> None:
+        """Init buckets for api, sapi and orders."""
+        self.buckets: dict[str, Bucket] = {
+            "api": Bucket("X-MBX-USED-WEIGHT-1M", API_WEIGHT_LIMIT, 60),
+            "sapi": Bucket("X-SAPI-USED-IP-WEIGHT-1M", SAPI_WEIGHT_LIMIT, 60),
+        }
+        self.orders: Bucket = Bucket("X-MBX-ORDER-COUNT-10S", ORDER_LIMIT_10S, 10)
+        self.banned_until: float = 0.0
+
+    @staticmethod
+    def get_bucket_name(path: str) -> str:
+        """Get name of bucket by path."""
+        return "sapi" if path.startswith("/sapi/") else "api"
+
+    def get_delay(self: Self, path: str, cost: int, *, is_order: bool) -> float:
+        """Get seconds to wait before request."""
+        now = time()
+        delay = max(
+            self.banned_until - now,
+            self.buckets[self.get_bucket_name(path)].get_delay(now, cost),
+        )
+        if is_order:
+            delay = max(delay, self.orders.get_delay(now, 1))
+        return delay
+
+    async def acquire(self: Self, method: str, path: str) -> None:
+        """Wait until request fit in budget."""
+        cost = ENDPOINT_WEIGHT.get((method, path), DEFAULT_WEIGHT)
+        is_order = (method, path) in ORDER_ENDPOINTS
+
+        # check and spend without await between, other buckets not wait
+        while (delay := self.get_delay(path, cost, is_order=is_order)) > 0:
+            logger.warning(f"Rate limit wait {delay:.2f}s:{method}:{path}")
+            await asyncio.sleep(delay)
+
+        self.buckets[self.get_bucket_name(path)].spend(cost)
+        if is_order:
+            self.orders.spend(1)
+
+    def update(self: Self, path: str, resp: aiohttp.ClientResponse) -> None:
+        """Update budget by response headers."""
+        now = time()
+        self.buckets[self.get_bucket_name(path)].sync(resp.headers, now)
+        self.orders.sync(resp.headers, now)
+
+        if resp.status in (429, 418):  # 418 is IP ban after ignored 429
+            retry_after = int(resp.headers.get("Retry-After", 60))
+            self.banned_until = max(self.banned_until, now + retry_after)
+            logger.error(f"{resp.status}:{path}:retry after {retry_after}s")
+
+    def export_metrics(self: Self) -> None:
+        """Export budget of all buckets, read on each scrape of metrics."""
+        for name, bucket in [*self.buckets.items(), ("orders", self.orders)]:
+            RATE_USED.labels(name).set_function(bucket.get_used)
+            RATE_REMAINING.labels(name).set_function(bucket.get_remaining)
+        RATE_BANNED_UNTIL.set_function(lambda: self.banned_until)
+
+
+governor = RateGovernor()
+governor.export_metrics()
+
+
+@asynccontextmanager
+async def binance_request(
+    method: str,
+    url: str,
+    **kwargs: dict,
+) -> AsyncIterator[aiohttp.ClientResponse]:
+    """Request to exchange under rate governor."""
+    path = urlsplit(url).path
+
+    await governor.acquire(method, path)
+
+    start = perf_counter()
+    async with get_session().request(method, url, **kwargs) as resp:
+        HTTP_LATENCY.labels(method, path).observe(perf_counter() - start)
+        governor.update(path, resp)
+        yield resp
@@ -1,169 +1,282 @@
-"""Bnnc Balancer."""
-
-import asyncio
-from decimal import Decimal
-
-import orjson
-from decouple import Csv, config
-from loguru import logger
-from nats.js import JetStreamContext
-from websockets import connect
-
-from models import Access, OrderBook, Token
-from natslocal import get_js_context
-from tools import (
-    exchangeinfo,
-    get_margin_account,
-    get_websocket_listen_key,
-    keep_alive_listen_key,
-)
-
-
-async def fill_base_increment(orderbook: OrderBook) -> None:
-    """Fill min increment size by ticket."""
-    # Get exchangeinfo about tickSize
-    symbol_info = await exchangeinfo(list(orderbook.order_book))
-
-    for symbol in symbol_info["symbols"]:
-
-        step = [
-            filter_symbol
-            for filter_symbol in symbol["filters"]
-            if filter_symbol["filterType"] == "LOT_SIZE"
-        ][0]["stepSize"]
-
-        orderbook.fill_base_increment_by_symbol(
-            symbol["symbol"],
-            step[: step.index("1") + 1],  # 0.010000000 to 0.01
-        )
-
-
-async def fill_base_available(access: Access, orderbook: OrderBook) -> None:
-    """Fill base avaiable size on exchange."""
-    # Get all assert for margin trade
-    account_data = await get_margin_account(access)
-
-    for asset in account_data["userAssets"]:
-        custom_asset = f"{asset['asset']}USDT"
-
-        # filter only asset in order_book
-        if custom_asset in orderbook.order_book:
-            orderbook.fill_base_available_by_symbol(custom_asset, asset["free"])
-        elif asset["free"] != "0" and custom_asset != "USDTUSDT":
-            logger.warning(f"Ghost assert:{custom_asset}:{asset['free']}")
-
-
-async def init_order_book(
-    access: Access,
-    orderbook: OrderBook,
-) -> None:
-    """First init order_book."""
-    # fill base increment by symbol from orderbook
-    await fill_base_increment(orderbook)
-    await fill_base_available(access, orderbook)
-
-
-async def run_keep_alive(access: Access, listenkey: str) -> None:
-    """Infinity sent PUT for KeepAlive."""
-    while True:
-        await keep_alive_listen_key(access, listenkey)
-        await asyncio.sleep(600)  # sleep 10 min
-
-
-async def balance(
-    msg: dict,
-    orderbook: OrderBook,
-    js: JetStreamContext,
-) -> None:
-    """Work with change amount of balance on exchange."""
-    if msg["e"] == "outboundAccountPosition":
-        # {'e': 'outboundAccountPosition', 'E': 1733347691452, 'u': 1733347691452, 'B': [{'a': 'USDT', 'f': '2000.07982380', 'l': '0.00000000'}]}
-        for symbol in msg["B"]:
-            if symbol["a"] != "USDT":
-
-                # token name + symbol['a']  BTCUSDT
-                symbol_ = f"{symbol['a']}USDT"
-
-                await js.publish(
-                    "balance",
-                    orjson.dumps(
-                        {
-                            "symbol": symbol_,
-                            "baseincrement": orderbook.order_book[symbol_][
-                                "baseincrement"
-                            ],
-                            "available": symbol["f"],
-                        },
-                    ),
-                )
-                orderbook.order_book[symbol_]["available"] = symbol["f"]
-
-
-async def web_socket(
-    listen_key: str,
-    orderbook: OrderBook,
-    js: JetStreamContext,
-) -> None:
-    """Run infinity listening stream of balance."""
-    async with connect(
-        uri=f"wss://stream.binance.com:443/ws/{listen_key}",
-        max_queue=1024,
-    ) as ws:
-
-        background_tasks = set()
-
-        while True:
-            msg = await ws.recv()
-
-            task = asyncio.create_task(
-                balance(
-                    orjson.loads(msg),
-                    orderbook,
-                    js,
-                ),
-            )
-            background_tasks.add(task)
-            task.add_done_callback(background_tasks.discard)
-
-
-async def main() -> None:
-    """Main func in microservice."""
-    logger.info("Start Balancer")
-
-    # Access object
-    access = Access(
-        key=config("KEY", cast=str),
-        secret=config("SECRET", cast=str),
-        base_uri="https://api.binance.com",
-    )
-
-    # Token's object
-    token = Token(
-        currency=config("ALLCURRENCY", cast=Csv(str)),
-        ignore_currency=config("IGNORECURRENCY", cast=Csv(str)),
-        base_keep=Decimal(config("BASE_KEEP", cast=int)),
-        time_shift=config("TIME_SHIFT", cast=str, default="1h"),
-        base_stable=config("BASE_STABLE", cast=str, default="USDT"),
-    )
-
-    orderbook = OrderBook(token=token)
-
-    await init_order_book(access, orderbook)
-
-    js = await get_js_context()
-
-    # Send first initial balance from excange
-    await orderbook.send_balance(js)
-
-    listen_key_resp = await get_websocket_listen_key(access)
-    listen_key = listen_key_resp["listenKey"]
-
-    async with asyncio.TaskGroup() as tg:
-        tg.create_task(web_socket(listen_key, orderbook, js))
-        tg.create_task(run_keep_alive(access, listen_key))
-
-    await asyncio.sleep(60 * 60 * 24 * 365)  # Wait 1 year
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
+"""Bnnc Balancer."""
+
+import asyncio
+from decimal import Decimal
+
+import orjson
+from decouple import Csv, config
+from loguru import logger
+from nats.js.kv import KeyValue
+from websockets import connect
+
+from httplocal import API_URI, STREAM_URI, close_session
+from metricslocal import FRAMES, observe_since, start_metrics
+from models import Access, OrderBook, Token
+from natslocal import get_js_context, get_kv_balance, get_kv_filters
+from recordlocal import FrameRecorder, get_recorder
+from tools import (
+    exchangeinfo,
+    get_margin_account,
+    get_websocket_listen_key,
+    keep_alive_listen_key,
+)
+
+FILTERS_REFRESH = config("FILTERS_REFRESH", cast=int, default=60 * 60)  # seconds
+EXCHANGEINFO_CHUNK = config("EXCHANGEINFO_CHUNK", cast=int, default=100)
+# Failed exchangeinfo repeated after FILTERS_RETRY * 2**attempt seconds
+FILTERS_RETRY = config("FILTERS_RETRY", cast=int, default=5)
+FILTERS_RETRY_CAP = config("FILTERS_RETRY_CAP", cast=int, default=5 * 60)
+
+
+async def get_symbols_info(symbols: list[str]) -> tuple[list[dict], list[str]]:
+    """Get exchangeinfo of symbols by parallel chunks, and symbols of failed chunks."""
+    chunks = [
+        symbols[i : i + EXCHANGEINFO_CHUNK]
+        for i in range(0, len(symbols), EXCHANGEINFO_CHUNK)
+    ]
+    infos = await asyncio.gather(
+        *[exchangeinfo(chunk) for chunk in chunks],
+        return_exceptions=True,
+    )
+
+    result = []
+    failed = []
+    for chunk, info in zip(chunks, infos, strict=True):
+        # error payload is dict with code and msg, not symbols
+        if isinstance(info, dict) and "symbols" in info:
+            result.extend(info["symbols"])
+        else:
+            logger.error(f"Exchangeinfo failed:{len(chunk)} symbols:{info!r}")
+            failed.extend(chunk)
+    return result, failed
+
+
+def get_filters(symbol_info: dict) -> dict:
+    """Get filters of symbol used for check order.
+
+    {"symbol": "BTCUSDT", "tickSize": "0.01", "minPrice": "0.01",
+    "maxPrice": "1000000", "stepSize": "0.00001", "minQty": "0.00001",
+    "maxQty": "9000", "minNotional": "5"}
+    """
+    filters = {f["filterType"]: f for f in symbol_info["filters"]}
+    notional = filters.get("NOTIONAL", filters.get("MIN_NOTIONAL", {}))
+
+    return {
+        "symbol": symbol_info["symbol"],
+        "tickSize": filters["PRICE_FILTER"]["tickSize"],
+        "minPrice": filters["PRICE_FILTER"]["minPrice"],
+        "maxPrice": filters["PRICE_FILTER"]["maxPrice"],
+        "stepSize": filters["LOT_SIZE"]["stepSize"],
+        "minQty": filters["LOT_SIZE"]["minQty"],
+        "maxQty": filters["LOT_SIZE"]["maxQty"],
+        "minNotional": notional.get("minNotional", "0"),
+    }
+
+
+def get_total(free: str, locked: str) -> str:
+    """Get size of token with locked by resting sell order.
+
+    Processor size order by all tokens, resting order cancelled before new
+    """
+    return f"{Decimal(free) + Decimal(locked):f}"
+
+
+async def fill_base_increment(
+    orderbook: OrderBook,
+    filters: KeyValue,
+    symbols: list[str],
+) -> list[str]:
+    """Fill min increment size by ticket and save filters in KV bucket.
+
+    get symbols which failed for retry
+    """
+    # Get exchangeinfo about tickSize
+    infos, failed = await get_symbols_info(symbols)
+
+    for symbol in infos:
+        symbol_filters = get_filters(symbol)
+        step = symbol_filters["stepSize"]
+
+        orderbook.fill_base_increment_by_symbol(
+            symbol["symbol"],
+            step[: step.index("1") + 1],  # 0.010000000 to 0.01
+        )
+
+        await filters.put(symbol["symbol"], orjson.dumps(symbol_filters))
+
+    return failed
+
+
+async def fill_filters(orderbook: OrderBook, filters: KeyValue) -> None:
+    """Fill filters of all symbols, failed symbols again after backoff."""
+    symbols = list(orderbook.order_book)
+    attempt = 0
+
+    while symbols := await fill_base_increment(orderbook, filters, symbols):
+        attempt += 1
+        delay = min(FILTERS_RETRY * 2 ** (attempt - 1), FILTERS_RETRY_CAP)
+        logger.warning(f"Retry filters of {len(symbols)} symbols in {delay}s")
+        await asyncio.sleep(delay)
+
+
+async def run_refresh_filters(orderbook: OrderBook, filters: KeyValue) -> None:
+    """Infinity refresh exchange filters before TTL of bucket."""
+    while True:
+        await asyncio.sleep(FILTERS_REFRESH)
+        await fill_filters(orderbook, filters)
+
+
+async def fill_base_available(access: Access, orderbook: OrderBook) -> None:
+    """Fill base avaiable size on exchange."""
+    # Get all assert for margin trade
+    account_data = await get_margin_account(access)
+
+    for asset in account_data["userAssets"]:
+        custom_asset = f"{asset['asset']}USDT"
+
+        # filter only asset in order_book
+        if custom_asset in orderbook.order_book:
+            orderbook.fill_base_available_by_symbol(
+                custom_asset,
+                get_total(asset["free"], asset["locked"]),
+            )
+        elif asset["free"] != "0" and custom_asset != "USDTUSDT":
+            logger.warning(f"Ghost assert:{custom_asset}:{asset['free']}")
+
+
+async def init_order_book(
+    access: Access,
+    orderbook: OrderBook,
+    filters: KeyValue,
+) -> None:
+    """First init order_book."""
+    # fill base increment by symbol from orderbook
+    await fill_filters(orderbook, filters)
+    await fill_base_available(access, orderbook)
+
+
+async def run_keep_alive(access: Access, listenkey: str) -> None:
+    """Infinity sent PUT for KeepAlive."""
+    while True:
+        await keep_alive_listen_key(access, listenkey)
+        await asyncio.sleep(600)  # sleep 10 min
+
+
+async def balance(
+    msg: dict,
+    orderbook: OrderBook,
+    kv: KeyValue,
+) -> None:
+    """Work with change amount of balance on exchange."""
+    if msg["e"] == "outboundAccountPosition":
+        # {'e': 'outboundAccountPosition', 'E': 1733347691452, 'u': 1733347691452, 'B': [{'a': 'USDT', 'f': '2000.07982380', 'l': '0.00000000'}]}
+        for symbol in msg["B"]:
+            if symbol["a"] != "USDT":
+
+                # token name + symbol['a']  BTCUSDT
+                symbol_ = f"{symbol['a']}USDT"
+                available = get_total(symbol["f"], symbol["l"])
+
+                await kv.put(
+                    symbol_,
+                    orjson.dumps(
+                        {
+                            "symbol": symbol_,
+                            "baseincrement": orderbook.order_book[symbol_][
+                                "baseincrement"
+                            ],
+                            "available": available,
+                        },
+                    ),
+                )
+                orderbook.order_book[symbol_]["available"] = available
+
+                # from balance event on exchange to put in KV
+                observe_since("balance", symbol_, msg["E"])
+
+
+async def web_socket(
+    listen_key: str,
+    orderbook: OrderBook,
+    kv: KeyValue,
+    recorder: FrameRecorder | None,
+) -> None:
+    """Run infinity listening stream of balance."""
+    async with connect(
+        uri=f"{STREAM_URI}/ws/{listen_key}",
+        max_queue=1024,
+    ) as ws:
+
+        background_tasks = set()
+
+        while True:
+            msg = await ws.recv()
+            FRAMES.labels("user").inc()
+
+            if recorder is not None:
+                recorder.add(msg.encode())
+
+            task = asyncio.create_task(
+                balance(
+                    orjson.loads(msg),
+                    orderbook,
+                    kv,
+                ),
+            )
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+
+
+async def main() -> None:
+    """Main func in microservice."""
+    logger.info("Start Balancer")
+    start_metrics()
+
+    # Access object
+    access = Access(
+        key=config("KEY", cast=str),
+        secret=config("SECRET", cast=str),
+        base_uri=API_URI,
+    )
+
+    # Token's object
+    token = Token(
+        currency=config("ALLCURRENCY", cast=Csv(str)),
+        ignore_currency=config("IGNORECURRENCY", cast=Csv(str)),
+        base_keep=Decimal(config("BASE_KEEP", cast=int)),
+        time_shift=config("TIME_SHIFT", cast=str, default="1h"),
+        base_stable=config("BASE_STABLE", cast=str, default="USDT"),
+    )
+
+    orderbook = OrderBook(token=token)
+
+    try:
+        js = await get_js_context()
+        kv = await get_kv_balance(js)
+        filters = await get_kv_filters(js)
+
+        await init_order_book(access, orderbook, filters)
+
+        # Save first initial balance from excange
+        await orderbook.send_balance(kv)
+
+        listen_key_resp = await get_websocket_listen_key(access)
+        listen_key = listen_key_resp["listenKey"]
+
+        # Raw frames for replay if RECORD_FILE set
+        recorder = get_recorder()
+
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(web_socket(listen_key, orderbook, kv, recorder))
+            if recorder is not None:
+                tg.create_task(recorder.run())
+            tg.create_task(run_keep_alive(access, listen_key))
+            tg.create_task(run_refresh_filters(orderbook, filters))
+
+        await asyncio.sleep(60 * 60 * 24 * 365)  # Wait 1 year
+    finally:
+        await close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
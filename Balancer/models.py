@@ -6,7 +6,7 @@ from decimal import Decimal
 from typing import Self
 
 import orjson
-from nats.js import JetStreamContext
+from nats.js.kv import KeyValue
 
 
 class Access:
@@ -189,11 +189,11 @@ class OrderBook:
             },
         )
 
-    async def send_balance(self: Self, js: JetStreamContext) -> None:
-        """Send first run balance state."""
+    async def send_balance(self: Self, kv: KeyValue) -> None:
+        """Save first run balance state in KV bucket."""
         for symbol, value in self.order_book.items():
-            await js.publish(
-                "balance",
+            await kv.put(
+                symbol,
                 orjson.dumps(
                     {
                         "symbol": symbol,
@@ -0,0 +1,67 @@
+"""Record raw websocket frames to file and read them for replay."""
+
+import asyncio
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+from time import time
+from typing import Self
+
+from decouple import config
+from loguru import logger
+
+RECORD_FILE = config("RECORD_FILE", cast=str, default="")  # empty is off
+RECORD_FLUSH = config("RECORD_FLUSH", cast=float, default=1.0)  # seconds
+
+# Each record is receive time in ms, length of frame and frame bytes
+HEADER = struct.Struct(">qI")
+
+
+class FrameRecorder:
+    """Class for write frames by batch out of event loop."""
+
+    def __init__(self: Self, path: str) -> None:
+        """Init recorder with empty buffer."""
+        self.path: Path = Path(path)
+        self.buffer: list[bytes] = []
+        self.count: int = 0
+
+    def add(self: Self, frame: bytes) -> None:
+        """Add frame with receive time to buffer."""
+        self.buffer += [HEADER.pack(int(time() * 1000), len(frame)), frame]
+
+    def write(self: Self, chunk: list[bytes]) -> None:
+        """Append chunk of records to file."""
+        with self.path.open("ab") as file:
+            file.writelines(chunk)
+
+    async def flush(self: Self) -> None:
+        """Write buffer to file in thread."""
+        if self.buffer:
+            chunk, self.buffer = self.buffer, []
+            self.count += len(chunk) // 2
+            await asyncio.to_thread(self.write, chunk)
+
+    async def run(self: Self) -> None:
+        """Infinity flush buffer."""
+        logger.info(f"Record frames to {self.path}")
+        try:
+            while True:
+                await asyncio.sleep(RECORD_FLUSH)
+                await self.flush()
+        finally:
+            await self.flush()
+            logger.info(f"Recorded {self.count} frames to {self.path}")
+
+
+def get_recorder() -> FrameRecorder | None:
+    """Get recorder if RECORD_FILE set."""
+    return FrameRecorder(RECORD_FILE) if RECORD_FILE else None
+
+
+def read_frames(path: str) -> Iterator[tuple[int, bytes]]:
+    """Read receive time in ms and frame of each record."""
+    with Path(path).open("rb") as file:
+        while header := file.read(HEADER.size):
+            received, size = HEADER.unpack(header)
+            yield received, file.read(size)
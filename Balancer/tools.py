@@ -3,10 +3,10 @@
 from datetime import UTC, datetime
 from time import time
 
-import aiohttp
 from loguru import logger
 from orjson import loads
 
+from httplocal import API_URI, binance_request, get_session
 from models import Access
 
 
@@ -26,10 +26,12 @@ async def request(
     data_json: str | None = None,
 ) -> dict:
     """Universal http reqponse."""
-    async with (
-        aiohttp.ClientSession(headers=headers) as session,
-        session.request(method, url, data=data_json) as response,
-    ):
+    async with get_session().request(
+        method,
+        url,
+        data=data_json,
+        headers=headers,
+    ) as response:
         res = await response.read()  # bytes
         data = loads(res)  # dict ['code':str, 'data':dict]
 
@@ -55,15 +57,12 @@ async def get_margin_account(access: Access) -> dict:
     signature = access.encrypted(query_string)
     data.update({"signature": signature})
 
-    async with (
-        aiohttp.ClientSession(
-            headers={"X-MBX-APIKEY": access.key},
-        ) as session,
-        session.get(
-            url="https://api.binance.com/sapi/v1/margin/account",
-            params=data,
-        ) as resp,
-    ):
+    async with binance_request(
+        "GET",
+        url=f"{API_URI}/sapi/v1/margin/account",
+        params=data,
+        headers={"X-MBX-APIKEY": access.key},
+    ) as resp:
         return await resp.json()
 
 
@@ -74,17 +73,15 @@ async def exchangeinfo(tokens: list[str]) -> dict:
     """
     filter_tokens = str(tokens).replace(" ", "").replace("'", '"')
 
-    url = "https://api.binance.com/api/v3/exchangeInfo"
-
-    async with (
-        aiohttp.ClientSession() as session,
-        session.get(
-            url=url,
-            params={
-                "symbols": filter_tokens,
-            },
-        ) as resp,
-    ):
+    url = f"{API_URI}/api/v3/exchangeInfo"
+
+    async with binance_request(
+        "GET",
+        url=url,
+        params={
+            "symbols": filter_tokens,
+        },
+    ) as resp:
         return await resp.json()
 
 
@@ -107,31 +104,25 @@ async def get_websocket_listen_key(access: Access) -> dict:
             "listenKey": "..."
     }
     """
-    async with (
-        aiohttp.ClientSession(
-            headers={
-                "X-MBX-APIKEY": access.key,
-            },
-        ) as session,
-        session.post(
-            url="https://api.binance.com/sapi/v1/userDataStream",
-        ) as resp,
-    ):
+    async with binance_request(
+        "POST",
+        url=f"{API_URI}/sapi/v1/userDataStream",
+        headers={
+            "X-MBX-APIKEY": access.key,
+        },
+    ) as resp:
         return await resp.json()
 
 
 async def keep_alive_listen_key(access: Access, listen_key: str) -> dict:
     """KeepAlive for listenKey."""
     params = {"listenKey": listen_key}
-    async with (
-        aiohttp.ClientSession(
-            headers={
-                "X-MBX-APIKEY": access.key,
-            },
-        ) as session,
-        session.put(
-            url="https://api.binance.com/sapi/v1/userDataStream",
-            params=params,
-        ) as resp,
-    ):
+    async with binance_request(
+        "PUT",
+        url=f"{API_URI}/sapi/v1/userDataStream",
+        params=params,
+        headers={
+            "X-MBX-APIKEY": access.key,
+        },
+    ) as resp:
         return await resp.json()
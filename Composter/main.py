@@ -1,62 +1,244 @@
-"""bnnc_composeter."""
-
-import asyncio
-from decimal import Decimal
-
-import orjson
-from decouple import Csv, config
-from loguru import logger
-from nats.js import JetStreamContext
-from websockets import connect
-
-from models import Token
-from natslocal import get_js_context
-
-
-async def main() -> None:
-    """Main func in microservice."""
-    js = await get_js_context()
-
-    # Token's object
-    token = Token(
-        time_shift=config("TIME_SHIFT", cast=str, default="1h"),
-        base_stable=config("BASE_STABLE", cast=str, default="USDT"),
-        currency=config("ALLCURRENCY", cast=Csv(str)),
-        ignore_currency=config("IGNORECURRENCY", cast=Csv(str)),
-        base_keep=Decimal(config("BASE_KEEP", cast=int)),
-    )
-
-    async def candle(msg: dict, js: JetStreamContext, token: Token) -> None:
-        symbol = msg["s"]
-        open_price = msg["o"]
-
-        if token.history[symbol] != open_price:
-            # symbol has BTCUSDT format
-            await js.publish("candle", orjson.dumps({symbol: open_price}))
-            logger.success(f"New candle:{symbol}:{open_price}")
-            token.history[symbol] = open_price
-
-    token.init_history()
-
-    async with connect(
-        uri=token.get_url_websocket(),
-        max_queue=1024,
-    ) as ws:
-        background_tasks = set()
-
-        while True:
-            recv = await ws.recv()
-
-            task = asyncio.create_task(
-                candle(
-                    orjson.loads(recv)["data"]["k"],
-                    js,
-                    token,
-                ),
-            )
-            background_tasks.add(task)
-            task.add_done_callback(background_tasks.discard)
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
+"""bnnc_composeter."""
+
+import asyncio
+from decimal import Decimal
+from functools import partial
+from random import uniform
+from time import perf_counter, time
+
+import orjson
+from decouple import Csv, config
+from loguru import logger
+from websockets import WebSocketException, connect
+from websockets.asyncio.client import ClientConnection
+
+from httplocal import close_session
+from metricslocal import FRAMES, get_now, observe_since, start_metrics
+from models import CandleBatch, KlineFilter, Token
+from natslocal import get_js_context
+from recordlocal import FrameRecorder, get_recorder
+from storelocal import KlineStore, get_store
+from tools import get_klines
+
+BACKOFF_CAP = config("BACKOFF_CAP", cast=float, default=60.0)
+BACKFILL_TIMEOUT = config("BACKFILL_TIMEOUT", cast=float, default=30.0)
+
+
+async def candle(
+    msg: dict,
+    batch: CandleBatch,
+    token: Token,
+    event_time: int,
+) -> None:
+    """Send open price of new candle to batch."""
+    symbol = msg["s"]
+    open_price = msg["o"]
+
+    if msg["t"] < token.open_times.get(symbol, 0):
+        return  # candle older then already known
+
+    if token.history[symbol] != open_price:
+        # symbol has BTCUSDT format, marked before await for skip same
+        # candle from other frame or backfill
+        previous = token.history[symbol], token.open_times.get(symbol, 0)
+        token.history[symbol] = open_price
+        token.open_times[symbol] = msg["t"]
+
+        try:
+            await batch.add(symbol, open_price, msg["t"], event_time)
+        except Exception:
+            # not published, candle can come again
+            token.history[symbol], token.open_times[symbol] = previous
+            raise
+
+
+def forget_failed(kline_filter: KlineFilter, frame: bytes, task: asyncio.Task) -> None:
+    """Forget candle of frame if publish failed, next frame of candle try again."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Candle failed:{task.exception()!r}")
+        kline_filter.forget(frame)
+
+
+async def backfill(symbols: list[str], batch: CandleBatch, token: Token) -> None:
+    """Send open price of candles started while connection was lost."""
+    start = perf_counter()
+    open_time = token.get_candle_open_time(int(time() * 1000))
+
+    # only symbols which crossed candle boundary in gap
+    symbols = [s for s in symbols if token.open_times.get(s, 0) < open_time]
+
+    try:
+        async with asyncio.timeout(BACKFILL_TIMEOUT):
+            klines = await asyncio.gather(
+                *[get_klines(symbol, token.time_shift) for symbol in symbols],
+                return_exceptions=True,
+            )
+    except TimeoutError:
+        logger.error(f"Backfill timeout {BACKFILL_TIMEOUT}s:{symbols}")
+        return
+
+    for symbol, kline in zip(symbols, klines, strict=True):
+        # error payload is dict with code and msg, not list of klines
+        if not isinstance(kline, list) or not kline:
+            logger.error(f"Backfill:{symbol}:{kline}")
+            continue
+
+        await candle(
+            {"s": symbol, "o": kline[0][1], "t": kline[0][0]},
+            batch,
+            token,
+            get_now(),
+        )
+
+    logger.info(f"Backfill {len(symbols)} symbols in {perf_counter() - start:.3f}s")
+
+
+async def listen(  # noqa: PLR0913, PLR0917
+    ws: ClientConnection,
+    kline_filter: KlineFilter,
+    batch: CandleBatch,
+    token: Token,
+    recorder: FrameRecorder | None,
+    store: KlineStore | None,
+) -> None:
+    """Run infinity listening of kline streams on connection."""
+    background_tasks = set()
+
+    while True:
+        recv = await ws.recv(decode=False)
+        FRAMES.labels("kline").inc()
+
+        if recorder is not None:
+            recorder.add(recv)
+
+        if store is not None and b'"x":true' in recv:
+            # last frame of candle, filter skip it by known open time
+            store.add(orjson.loads(recv)["data"]["k"])
+
+        if not kline_filter.is_new(recv):
+            continue
+
+        data = orjson.loads(recv)
+
+        if "data" not in data:
+            # reply on SUBSCRIBE {"result":null,"id":1}
+            logger.info(f"Stream reply:{data}")
+            continue
+
+        # delay from exchange event to receive
+        observe_since("ingest", data["data"]["s"], data["data"]["E"])
+
+        task = asyncio.create_task(
+            candle(
+                data["data"]["k"],
+                batch,
+                token,
+                data["data"]["E"],
+            ),
+        )
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+        task.add_done_callback(partial(forget_failed, kline_filter, recv))
+
+
+async def read_streams(  # noqa: PLR0913, PLR0917
+    streams: list[str],
+    kline_filter: KlineFilter,
+    batch: CandleBatch,
+    token: Token,
+    recorder: FrameRecorder | None,
+    store: KlineStore | None,
+) -> None:
+    """Run listening of kline streams on own connection with reconnect."""
+    symbols = [stream.split("@")[0].upper() for stream in streams]
+    background_tasks = set()
+    attempt = 0
+
+    while True:
+        try:
+            async with connect(
+                uri=token.get_url_websocket(),
+                max_queue=1024,
+            ) as ws:
+                await ws.send(
+                    orjson.dumps(
+                        {"method": "SUBSCRIBE", "params": streams, "id": 1},
+                    ).decode(),
+                )
+                logger.info(f"Subscribe on {len(streams)} streams")
+
+                if attempt:
+                    # Fill candles lost while reconnect
+                    task = asyncio.create_task(backfill(symbols, batch, token))
+                    background_tasks.add(task)
+                    task.add_done_callback(background_tasks.discard)
+
+                attempt = 0
+                await listen(ws, kline_filter, batch, token, recorder, store)
+
+        # WebSocketException is closed connection and failed handshake
+        except (WebSocketException, OSError, TimeoutError) as e:
+            attempt += 1
+            delay = uniform(0, min(BACKOFF_CAP, 2**attempt))  # noqa: S311
+            logger.error(f"Websocket lost:{e}, reconnect in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def main() -> None:
+    """Main func in microservice."""
+    start_metrics()
+    js = await get_js_context()
+
+    # Token's object
+    token = Token(
+        time_shift=config("TIME_SHIFT", cast=str, default="1h"),
+        base_stable=config("BASE_STABLE", cast=str, default="USDT"),
+        currency=config("ALLCURRENCY", cast=Csv(str)),
+        ignore_currency=config("IGNORECURRENCY", cast=Csv(str)),
+        base_keep=Decimal(config("BASE_KEEP", cast=int)),
+    )
+
+    token.init_history()
+
+    # One message with all symbols on each candle boundary
+    batch = CandleBatch(
+        js=js,
+        total=len(token.history),
+        window=config("CANDLE_WINDOW", cast=float, default=2.0),
+    )
+
+    # Skip frames of candle which already started
+    kline_filter = KlineFilter()
+
+    # Raw frames for replay if RECORD_FILE set
+    recorder = get_recorder()
+
+    # Closed klines to files if KLINE_STORE_DIR set
+    store = get_store()
+
+    # Each connection read own part of streams
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for streams in token.get_stream_chunks(
+                config("STREAMS_PER_CONNECTION", cast=int, default=200),
+            ):
+                tg.create_task(
+                    read_streams(
+                        streams,
+                        kline_filter,
+                        batch,
+                        token,
+                        recorder,
+                        store,
+                    ),
+                )
+            if recorder is not None:
+                tg.create_task(recorder.run())
+            if store is not None:
+                tg.create_task(store.run())
+    finally:
+        await close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""Prometheus metrics of latency by stages of pipeline."""
+
+from time import time
+
+from decouple import config
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+METRICS_PORT = config("METRICS_PORT", cast=int, default=9100)
+
+# NATS headers with time of stage in ms, send from Composter to Processor
+EVENT_TIME = "Bnnc-Event-Time"  # oldest kline event time E in message
+OPEN_TIME = "Bnnc-Open-Time"  # kline start time k.t
+PUBLISH_TIME = "Bnnc-Publish-Time"  # Composter publish time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_LATENCY = Histogram(
+    "bnnc_stage_latency_seconds",
+    "Latency of pipeline stage by symbol",
+    ["stage", "symbol"],
+    buckets=BUCKETS,
+)
+STAGE_LATENCY_MAX = Gauge(
+    "bnnc_stage_latency_max_seconds",
+    "Max latency of pipeline stage by symbol",
+    ["stage", "symbol"],
+)
+HTTP_LATENCY = Histogram(
+    "bnnc_http_request_seconds",
+    "Latency of exchange request",
+    ["method", "path"],
+    buckets=BUCKETS,
+)
+FRAMES = Counter("bnnc_frames", "Websocket frames received", ["stream"])
+PUBLISHED = Counter("bnnc_published", "Messages published to NATS", ["subject"])
+REJECTED = Counter(
+    "bnnc_rejected",
+    "Orders rejected by exchange filters before send",
+    ["symbol"],
+)
+ACK_LAG = Histogram(
+    "bnnc_ack_lag_seconds",
+    "Time from delivery to ack of message",
+    buckets=BUCKETS,
+)
+PENDING = Gauge("bnnc_consumer_pending", "Messages pending on consumer")
+RATE_USED = Gauge(
+    "bnnc_rate_used",
+    "Used weight of exchange limit in current window",
+    ["bucket"],
+)
+RATE_REMAINING = Gauge(
+    "bnnc_rate_remaining",
+    "Remaining weight of exchange limit in current window",
+    ["bucket"],
+)
+RATE_BANNED_UNTIL = Gauge(
+    "bnnc_rate_banned_until_seconds",
+    "Unix time when exchange ban by 429 or 418 ends",
+)
+
+max_latency: dict[tuple[str, str], float] = {}
+
+
+def get_now() -> int:
+    """Get now time in ms."""
+    return int(time() * 1000)
+
+
+def observe(stage: str, symbol: str, seconds: float) -> None:
+    """Save latency of stage for symbol."""
+    STAGE_LATENCY.labels(stage, symbol).observe(seconds)
+
+    if seconds > max_latency.get((stage, symbol), 0.0):
+        max_latency[(stage, symbol)] = seconds
+        STAGE_LATENCY_MAX.labels(stage, symbol).set(seconds)
+
+
+def observe_since(stage: str, symbol: str, start: int) -> None:
+    """Save latency of stage from start time in ms to now."""
+    observe(stage, symbol, max(get_now() - start, 0) / 1000)
+
+
+def get_time_headers(headers: dict | None) -> dict[str, int]:
+    """Get stage times from NATS headers of message."""
+    return {
+        name: int(value)
+        for name, value in (headers or {}).items()
+        if name in (EVENT_TIME, OPEN_TIME, PUBLISH_TIME)
+    }
+
+
+def start_metrics() -> None:
+    """Run HTTP endpoint with metrics in Prometheus format."""
+    start_http_server(METRICS_PORT)
+    logger.info(f"Metrics on :{METRICS_PORT}/metrics")
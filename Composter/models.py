@@ -1,172 +1,386 @@
-"""Classes for work."""
-
-from decimal import Decimal
-from typing import Self
-
-import orjson
-from loguru import logger
-from nats.js import JetStreamContext
-
-
-class Token:
-    """Class for store token data for trade."""
-
-    def __init__(
-        self: Self,
-        currency: list,
-        ignore_currency: list,
-        base_keep: Decimal,
-        time_shift: str = "1h",
-        base_stable: str = "USDT",
-    ) -> None:
-        """Init class for store trade tokens."""
-        self.trade_currency: list[str] = currency  # Tokens for trade in bot
-        self.ignore_currency: list[str] = ignore_currency
-        self.base_keep: Decimal = base_keep
-        self.base_stable: str = base_stable
-        self.time_shift: str = time_shift
-        self.borrow_size: Decimal = Decimal("0")
-        self.avail_size: Decimal = Decimal("0")
-
-        self.accept_tokens: list[str] = []  # tradable tokens
-        self.new_tokens: list[str] = (
-            []
-        )  # tokens that can be traded but are not in the bot
-        self.del_tokens: list[str] = (
-            []
-        )  # tokens that have been removed from the exchange
-        self.history: dict = {}
-
-    def get_url_websocket(self) -> str:
-        """Get url for connect via websocket."""
-        return f"wss://stream.binance.com:443/stream?streams={self.get_candles_for_kline()}"
-
-    def init_history(self: Self) -> None:
-        """Init history."""
-        # format BTCUSDT:"1234567898.00"
-        self.history = {f"{key}{self.base_stable}": "" for key in self.trade_currency}
-
-    def get_candles_for_kline(self: Self) -> str:
-        """Get str candles for kline websocket."""
-        return "/".join(
-            [
-                f"{symbol.lower()}{self.base_stable.lower()}@kline_{self.time_shift}"
-                for symbol in self.trade_currency
-            ],
-        )
-
-    def get_clear_borrow(self: Self) -> Decimal:
-        """Get clear borrow size."""
-        return self.borrow_size - self.avail_size
-
-    def get_percent_borrow(self: Self) -> int:
-        """Get percent of borrowing."""
-        return (
-            self.get_clear_borrow()
-            * 100
-            / (self.trade_currency * float(self.base_keep))
-        )
-
-    def get_len_trade_currency(self: Self) -> int:
-        """Get len of trade_currency."""
-        return len(self.trade_currency)
-
-    def get_len_accept_tokens(self: Self) -> int:
-        """Get len of accept_tokens."""
-        return len(self.accept_tokens)
-
-    def get_len_del_tokens(self: Self) -> int:
-        """Get len del_tokens."""
-        return len(self.del_tokens)
-
-    def get_len_ignore_currency(self: Self) -> int:
-        """Get len of ignore_currency."""
-        return len(self.ignore_currency)
-
-    def get_len_new_tokens(self: Self) -> int:
-        """Get len of new_tokens."""
-        return len(self.new_tokens)
-
-    @staticmethod
-    def remove_postfix(symbol: str, postfix: str = "-USDT") -> str:
-        """Remove postfix."""
-        return symbol.replace(postfix, "")
-
-    def save_accept_tokens(self: Self, all_token_in_excange: list) -> None:
-        """Save all accepted token."""
-        self.accept_tokens = [
-            Token.remove_postfix(token_in_excange["symbol"])
-            for token_in_excange in all_token_in_excange
-            if token_in_excange["isMarginEnabled"]
-            and token_in_excange["quoteCurrency"] == "USDT"
-            and Token.remove_postfix(token_in_excange["symbol"])
-            not in self.ignore_currency
-        ]
-
-    def save_new_tokens(self: Self, all_token_in_excange: list) -> None:
-        """."""
-        self.new_tokens = [
-            Token.remove_postfix(token_in_excange["symbol"])
-            for token_in_excange in all_token_in_excange
-            if Token.remove_postfix(token_in_excange["symbol"])
-            not in self.accept_tokens
-        ]
-
-    def save_del_tokens(self: Self) -> None:
-        """."""
-        self.del_tokens = [
-            used for used in self.trade_currency if used not in self.accept_tokens
-        ]
-
-
-class OrderBook:
-    """Class for store orders data from excange."""
-
-    def __init__(self: Self, token: Token) -> None:
-        """Init order book by symbol from config by available 0."""
-        self.order_book: dict = {s: {"available": 0} for s in token.trade_currency}
-
-    def fill_order_book(self: Self, account_list: list) -> None:
-        """Fill real available from exchange."""
-        self.order_book: dict = {
-            account["currency"]: {"available": account["available"]}
-            for account in account_list
-            if account["currency"] in self.order_book
-        }
-
-    def fill_base_increment(self: Self, symbol_increments: list) -> None:
-        """Fill real baseincrement from exchange.
-
-        after:
-        {"ICP":{"available":"123"}}
-
-        before:
-        {"ICP":{"available":"123","baseincrement":"0.0001"}}
-        """
-        self.order_book.update(
-            {
-                symbol_increment["baseCurrency"]: {
-                    "baseincrement": symbol_increment["baseIncrement"],
-                    "available": self.order_book[symbol_increment["baseCurrency"]],
-                }
-                for symbol_increment in symbol_increments
-                if symbol_increment["baseCurrency"] in self.order_book
-                and symbol_increment["quoteCurrency"] == "USDT"
-            },
-        )
-
-    async def send_balance(self: Self, js: JetStreamContext) -> None:
-        """Send first run balance state."""
-        for symbol, value in self.order_book.items():
-            data = {
-                "symbol": f"{symbol}-USDT",
-                "baseincrement": value["baseincrement"],
-                "available": value["available"],
-            }
-            logger.info(
-                f"{data['symbol']}\t{data['baseincrement']}\t{data['available']}",
-            )
-            await js.publish(
-                "balance",
-                orjson.dumps(data),
-            )
+"""Classes for work."""
+
+import asyncio
+from decimal import Decimal
+from typing import Self
+
+import orjson
+from loguru import logger
+from nats.js import JetStreamContext
+
+from httplocal import STREAM_URI
+from metricslocal import (
+    EVENT_TIME,
+    OPEN_TIME,
+    PUBLISH_TIME,
+    PUBLISHED,
+    get_now,
+    observe,
+)
+from natslocal import get_shard
+
+
+# Kline intervals of fixed length in ms, candle start at multiple of length
+# from epoch. 3d, 1w and 1M start by calendar, they are not supported.
+INTERVALS = {
+    "1s": 1_000,
+    "1m": 60_000,
+    "3m": 180_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "30m": 1_800_000,
+    "1h": 3_600_000,
+    "2h": 7_200_000,
+    "4h": 14_400_000,
+    "6h": 21_600_000,
+    "8h": 28_800_000,
+    "12h": 43_200_000,
+    "1d": 86_400_000,
+}
+
+
+class Token:
+    """Class for store token data for trade."""
+
+    def __init__(
+        self: Self,
+        currency: list,
+        ignore_currency: list,
+        base_keep: Decimal,
+        time_shift: str = "1h",
+        base_stable: str = "USDT",
+    ) -> None:
+        """Init class for store trade tokens."""
+        if time_shift not in INTERVALS:
+            msg = f"TIME_SHIFT {time_shift} not supported, use one of {list(INTERVALS)}"
+            raise ValueError(msg)
+
+        self.trade_currency: list[str] = currency  # Tokens for trade in bot
+        self.ignore_currency: list[str] = ignore_currency
+        self.base_keep: Decimal = base_keep
+        self.base_stable: str = base_stable
+        self.time_shift: str = time_shift
+        self.borrow_size: Decimal = Decimal("0")
+        self.avail_size: Decimal = Decimal("0")
+
+        self.accept_tokens: list[str] = []  # tradable tokens
+        self.new_tokens: list[str] = (
+            []
+        )  # tokens that can be traded but are not in the bot
+        self.del_tokens: list[str] = (
+            []
+        )  # tokens that have been removed from the exchange
+        self.history: dict = {}
+        self.open_times: dict[str, int] = {}  # start time of last candle
+
+    def get_url_websocket(self) -> str:
+        """Get url for connect via websocket.
+
+        streams are added by SUBSCRIBE after connect
+        """
+        return f"{STREAM_URI}/stream"
+
+    def init_history(self: Self) -> None:
+        """Init history."""
+        # format BTCUSDT:"1234567898.00"
+        self.history = {f"{key}{self.base_stable}": "" for key in self.trade_currency}
+
+    def get_candles_for_kline(self: Self) -> list[str]:
+        """Get streams of candles for kline websocket."""
+        return [
+            f"{symbol.lower()}{self.base_stable.lower()}@kline_{self.time_shift}"
+            for symbol in self.trade_currency
+        ]
+
+    def get_interval_ms(self: Self) -> int:
+        """Get length of candle in milliseconds, 1h -> 3600000."""
+        return INTERVALS[self.time_shift]
+
+    def get_candle_open_time(self: Self, now: int) -> int:
+        """Get start time of current candle by now in milliseconds."""
+        return now - now % self.get_interval_ms()
+
+    def get_stream_chunks(self: Self, size: int) -> list[list[str]]:
+        """Get streams split by connections with size streams in each."""
+        streams = self.get_candles_for_kline()
+        return [streams[i : i + size] for i in range(0, len(streams), size)]
+
+    def get_clear_borrow(self: Self) -> Decimal:
+        """Get clear borrow size."""
+        return self.borrow_size - self.avail_size
+
+    def get_percent_borrow(self: Self) -> int:
+        """Get percent of borrowing."""
+        return (
+            self.get_clear_borrow()
+            * 100
+            / (self.trade_currency * float(self.base_keep))
+        )
+
+    def get_len_trade_currency(self: Self) -> int:
+        """Get len of trade_currency."""
+        return len(self.trade_currency)
+
+    def get_len_accept_tokens(self: Self) -> int:
+        """Get len of accept_tokens."""
+        return len(self.accept_tokens)
+
+    def get_len_del_tokens(self: Self) -> int:
+        """Get len del_tokens."""
+        return len(self.del_tokens)
+
+    def get_len_ignore_currency(self: Self) -> int:
+        """Get len of ignore_currency."""
+        return len(self.ignore_currency)
+
+    def get_len_new_tokens(self: Self) -> int:
+        """Get len of new_tokens."""
+        return len(self.new_tokens)
+
+    @staticmethod
+    def remove_postfix(symbol: str, postfix: str = "-USDT") -> str:
+        """Remove postfix."""
+        return symbol.replace(postfix, "")
+
+    def save_accept_tokens(self: Self, all_token_in_excange: list) -> None:
+        """Save all accepted token."""
+        self.accept_tokens = [
+            Token.remove_postfix(token_in_excange["symbol"])
+            for token_in_excange in all_token_in_excange
+            if token_in_excange["isMarginEnabled"]
+            and token_in_excange["quoteCurrency"] == "USDT"
+            and Token.remove_postfix(token_in_excange["symbol"])
+            not in self.ignore_currency
+        ]
+
+    def save_new_tokens(self: Self, all_token_in_excange: list) -> None:
+        """."""
+        self.new_tokens = [
+            Token.remove_postfix(token_in_excange["symbol"])
+            for token_in_excange in all_token_in_excange
+            if Token.remove_postfix(token_in_excange["symbol"])
+            not in self.accept_tokens
+        ]
+
+    def save_del_tokens(self: Self) -> None:
+        """."""
+        self.del_tokens = [
+            used for used in self.trade_currency if used not in self.accept_tokens
+        ]
+
+
+class OrderBook:
+    """Class for store orders data from excange."""
+
+    def __init__(self: Self, token: Token) -> None:
+        """Init order book by symbol from config by available 0."""
+        self.order_book: dict = {s: {"available": 0} for s in token.trade_currency}
+
+    def fill_order_book(self: Self, account_list: list) -> None:
+        """Fill real available from exchange."""
+        self.order_book: dict = {
+            account["currency"]: {"available": account["available"]}
+            for account in account_list
+            if account["currency"] in self.order_book
+        }
+
+    def fill_base_increment(self: Self, symbol_increments: list) -> None:
+        """Fill real baseincrement from exchange.
+
+        after:
+        {"ICP":{"available":"123"}}
+
+        before:
+        {"ICP":{"available":"123","baseincrement":"0.0001"}}
+        """
+        self.order_book.update(
+            {
+                symbol_increment["baseCurrency"]: {
+                    "baseincrement": symbol_increment["baseIncrement"],
+                    "available": self.order_book[symbol_increment["baseCurrency"]],
+                }
+                for symbol_increment in symbol_increments
+                if symbol_increment["baseCurrency"] in self.order_book
+                and symbol_increment["quoteCurrency"] == "USDT"
+            },
+        )
+
+    async def send_balance(self: Self, js: JetStreamContext) -> None:
+        """Send first run balance state."""
+        for symbol, value in self.order_book.items():
+            data = {
+                "symbol": f"{symbol}-USDT",
+                "baseincrement": value["baseincrement"],
+                "available": value["available"],
+            }
+            logger.info(
+                f"{data['symbol']}\t{data['baseincrement']}\t{data['available']}",
+            )
+            await js.publish(
+                "balance",
+                orjson.dumps(data),
+            )
+
+
+class CandleBatch:
+    """Class for collect new candles of one boundary in one message."""
+
+    def __init__(self: Self, js: JetStreamContext, total: int, window: float) -> None:
+        """Init empty batch.
+
+        total - count of tracked symbols
+        window - seconds for wait other symbols after first new candle
+        """
+        self.js: JetStreamContext = js
+        self.total: int = total
+        self.window: float = window
+        self.pending: dict[str, str] = {}  # {"BTCUSDT": "97000.01"}
+        self.events: dict[str, int] = {}  # event time of candles in pending
+        self.open_time: int = 0  # start time of candles in pending
+        self.flushed_time: int = 0  # start time of last published batch
+        self.timer: asyncio.Task | None = None
+
+    async def add(
+        self: Self,
+        symbol: str,
+        open_price: str,
+        open_time: int,
+        event_time: int,
+    ) -> None:
+        """Add new candle to batch, publish when all symbols reported."""
+        if open_time == self.flushed_time or open_time < self.open_time:
+            # straggler after deadline of own batch
+            await self.publish({symbol: open_price}, {symbol: event_time}, open_time)
+            return
+
+        previous = None
+        if open_time != self.open_time:
+            # switch boundary and timer before await, other candles of new
+            # boundary go to new batch while previous one is published
+            previous = self.take()
+            self.open_time = open_time
+            self.timer = asyncio.create_task(self.flush_by_deadline())
+
+        self.pending[symbol] = open_price
+        self.events[symbol] = event_time
+
+        if previous is not None:
+            await self.publish(*previous)
+
+        if len(self.pending) == self.total:
+            await self.flush()
+
+    async def flush_by_deadline(self: Self) -> None:
+        """Publish batch when window is over."""
+        await asyncio.sleep(self.window)
+        self.timer = None
+        await self.flush()
+
+    def take(self: Self) -> tuple[dict[str, str], dict[str, int], int] | None:
+        """Take collected candles and stop timer, without await."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if not self.pending:
+            return None
+
+        pending, self.pending = self.pending, {}
+        events, self.events = self.events, {}
+        self.flushed_time = self.open_time
+        return pending, events, self.open_time
+
+    async def flush(self: Self) -> None:
+        """Publish all collected candles by one message."""
+        taken = self.take()
+        if taken is not None:
+            await self.publish(*taken)
+
+    async def publish(
+        self: Self,
+        candles: dict[str, str],
+        events: dict[str, int],
+        open_time: int,
+    ) -> None:
+        """Publish candles by one message on each shard of symbols.
+
+        replica of Processor read only own shards
+        """
+        shards: dict[int, dict[str, str]] = {}
+        for symbol, open_price in candles.items():
+            shards.setdefault(get_shard(symbol), {})[symbol] = open_price
+
+        await asyncio.gather(
+            *[
+                self.publish_shard(
+                    shard,
+                    shard_candles,
+                    {symbol: events[symbol] for symbol in shard_candles},
+                    open_time,
+                )
+                for shard, shard_candles in shards.items()
+            ],
+        )
+
+    async def publish_shard(
+        self: Self,
+        shard: int,
+        candles: dict[str, str],
+        events: dict[str, int],
+        open_time: int,
+    ) -> None:
+        """Publish candles of shard in format {"BTCUSDT": "97000.01"}.
+
+        one symbol on candle.7.BTCUSDT, more on candle.7.all,
+        headers with time of stages for latency metrics
+        """
+        name = next(iter(candles)) if len(candles) == 1 else "all"
+        now = get_now()
+
+        await self.js.publish(
+            f"candle.{shard}.{name}",
+            orjson.dumps(candles),
+            headers={
+                EVENT_TIME: str(min(events.values())),
+                OPEN_TIME: str(open_time),
+                PUBLISH_TIME: str(now),
+            },
+        )
+
+        PUBLISHED.labels("all" if len(candles) > 1 else "symbol").inc()
+        for symbol, event_time in events.items():
+            observe("compose", symbol, max(now - event_time, 0) / 1000)
+
+        logger.success(f"New candle:{shard}:{len(candles)}:{candles}")
+
+
+class KlineFilter:
+    """Class for skip frames of known candle without decode.
+
+    frame format
+    {"stream":"btcusdt@kline_1h","data":{...,"k":{"t":1733349600000,...}}}
+    """
+
+    def __init__(self: Self) -> None:
+        """Init empty start times of candles by stream."""
+        self.start_times: dict[bytes, bytes] = {}
+
+    def is_new(self: Self, frame: bytes) -> bool:
+        """Check frame start new candle on own stream."""
+        pos = frame.find(b'"k":{"t":')
+        if pos == -1:
+            return True  # unknown format, need full decode
+
+        start = pos + 9
+        stream = frame[: frame.find(b",")]  # {"stream":"btcusdt@kline_1h"
+        start_time = frame[start : frame.find(b",", start)]
+
+        if self.start_times.get(stream) == start_time:
+            return False
+
+        self.start_times[stream] = start_time
+        return True
+
+    def forget(self: Self, frame: bytes) -> None:
+        """Forget start time of stream of frame, next frame is new."""
+        self.start_times.pop(frame[: frame.find(b",")], None)
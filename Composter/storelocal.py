@@ -0,0 +1,208 @@
+"""Store closed klines in columnar files and read them by memory map.
+
+layout {KLINE_STORE_DIR}/{interval}/{YYYY-MM-DD}/{SYMBOL}.{column},
+each column is fixed width array with one row by candle of day,
+row of candle is (open_time % day) // interval so open time is index,
+open_time 0 in row mean no candle
+"""
+
+import asyncio
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+from decouple import config
+from loguru import logger
+
+KLINE_STORE_DIR = config("KLINE_STORE_DIR", cast=str, default="")  # empty is off
+KLINE_STORE_FLUSH = config("KLINE_STORE_FLUSH", cast=float, default=1.0)  # seconds
+
+DAY = 86_400_000  # ms, one set of files by day
+
+COLUMNS = {
+    "open_time": np.dtype("<i8"),
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<f8"),
+    "trades": np.dtype("<i8"),
+}
+
+# Field of kline in stream for each column
+FIELDS = {
+    "open_time": "t",
+    "open": "o",
+    "high": "h",
+    "low": "l",
+    "close": "c",
+    "volume": "v",
+    "trades": "n",
+}
+
+
+def get_interval_ms(interval: str) -> int:
+    """Get length of candle in milliseconds, 1h -> 3600000."""
+    units = {"s": 1_000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+    return int(interval[:-1]) * units[interval[-1]]
+
+
+def get_day_path(path: Path, interval: str, day: int) -> Path:
+    """Get folder of files of day, day is open_time // DAY."""
+    date = datetime.fromtimestamp(day * DAY // 1000, tz=UTC)
+    return path / interval / f"{date:%Y-%m-%d}"
+
+
+class KlineStore:
+    """Class for write closed klines by batch out of event loop."""
+
+    def __init__(self: Self, path: str) -> None:
+        """Init store with empty buffer and no open files."""
+        self.path: Path = Path(path)
+        self.buffer: list[dict] = []
+        self.files: dict[tuple[str, int, str], dict[str, np.memmap]] = {}
+        self.day: int = 0
+        self.count: int = 0
+
+    def add(self: Self, kline: dict) -> None:
+        """Add closed kline of stream to buffer."""
+        self.buffer.append(kline)
+
+    def get_columns(
+        self: Self,
+        interval: str,
+        day: int,
+        symbol: str,
+    ) -> dict[str, np.memmap]:
+        """Get writable columns of symbol on day, create files if new."""
+        key = (interval, day, symbol)
+        if key not in self.files:
+            folder = get_day_path(self.path, interval, day)
+            folder.mkdir(parents=True, exist_ok=True)
+            rows = DAY // get_interval_ms(interval)
+
+            self.files[key] = {
+                column: np.memmap(
+                    folder / f"{symbol}.{column}",
+                    dtype=dtype,
+                    mode="r+" if (folder / f"{symbol}.{column}").exists() else "w+",
+                    shape=(rows,),
+                )
+                for column, dtype in COLUMNS.items()
+            }
+        return self.files[key]
+
+    def rotate(self: Self, day: int) -> None:
+        """Close files of days before day."""
+        if day <= self.day:
+            return
+
+        self.day = day
+        for key in [key for key in self.files if key[1] < day - 1]:
+            for column in self.files.pop(key).values():
+                column.flush()
+            logger.info(f"Close kline store {key}")
+
+    def write(self: Self, chunk: list[dict]) -> None:
+        """Write chunk of klines to rows by open time."""
+        touched = {}
+        for kline in chunk:
+            day = kline["t"] // DAY
+            columns = self.get_columns(kline["i"], day, kline["s"])
+            row = kline["t"] % DAY // get_interval_ms(kline["i"])
+
+            for column, field in FIELDS.items():
+                columns[column][row] = kline[field]
+            touched[(kline["i"], day, kline["s"])] = columns
+
+        for columns in touched.values():
+            for column in columns.values():
+                column.flush()
+
+        # keep files of previous day open for late klines
+        self.rotate(max(kline["t"] // DAY for kline in chunk))
+
+    async def flush(self: Self) -> None:
+        """Write buffer to files in thread."""
+        if self.buffer:
+            chunk, self.buffer = self.buffer, []
+            self.count += len(chunk)
+            await asyncio.to_thread(self.write, chunk)
+
+    async def run(self: Self) -> None:
+        """Infinity flush buffer."""
+        logger.info(f"Store klines to {self.path}")
+        try:
+            while True:
+                await asyncio.sleep(KLINE_STORE_FLUSH)
+                await self.flush()
+        finally:
+            await self.flush()
+            logger.info(f"Stored {self.count} klines to {self.path}")
+
+
+def get_store() -> KlineStore | None:
+    """Get store if KLINE_STORE_DIR set."""
+    return KlineStore(KLINE_STORE_DIR) if KLINE_STORE_DIR else None
+
+
+class KlineReader:
+    """Class for read stored klines of interval without copy."""
+
+    def __init__(self: Self, path: str, interval: str) -> None:
+        """Init reader of interval with no open files."""
+        self.path: Path = Path(path)
+        self.interval: str = interval
+        self.interval_ms: int = get_interval_ms(interval)
+        self.files: dict[tuple[int, str], dict[str, np.memmap]] = {}
+
+    def get_day(self: Self, day: int, symbol: str) -> dict[str, np.memmap] | None:
+        """Get read only columns of symbol on day, None if not stored."""
+        key = (day, symbol)
+        if key not in self.files:
+            folder = get_day_path(self.path, self.interval, day)
+            if not (folder / f"{symbol}.trades").exists():
+                return None  # last created column, day can be written later
+
+            self.files[key] = {
+                column: np.memmap(folder / f"{symbol}.{column}", dtype=dtype, mode="r")
+                for column, dtype in COLUMNS.items()
+            }
+        return self.files[key]
+
+    def get(self: Self, symbol: str, open_time: int) -> dict[str, float] | None:
+        """Get kline of symbol by open time, None if not stored."""
+        columns = self.get_day(open_time // DAY, symbol)
+        if columns is None:
+            return None
+
+        row = open_time % DAY // self.interval_ms
+        if columns["open_time"][row] != open_time:
+            return None
+
+        return {column: values[row].item() for column, values in columns.items()}
+
+    def read(
+        self: Self,
+        symbol: str,
+        start: int,
+        end: int,
+    ) -> list[dict[str, np.ndarray]]:
+        """Get klines of symbol with open time in [start, end).
+
+        result is one dict of views on files by each stored day,
+        rows without candle has open_time 0
+        """
+        views = []
+        for day in range(start // DAY, (end - 1) // DAY + 1):
+            columns = self.get_day(day, symbol)
+            if columns is None:
+                continue
+
+            first = -(-max(start - day * DAY, 0) // self.interval_ms)
+            last = -(-min(end - day * DAY, DAY) // self.interval_ms)
+            views.append(
+                {column: values[first:last] for column, values in columns.items()},
+            )
+        return views
@@ -0,0 +1,131 @@
+"""Check KlineFilter and compare it with full decode on recorded frames."""
+
+from pathlib import Path
+from time import perf_counter, process_time
+
+import orjson
+import pytest
+from decouple import config
+
+from models import KlineFilter
+from recordlocal import FrameRecorder, read_frames
+
+# Real recording by RECORD_FILE of Composter, synthetic frames if empty
+BENCH_RECORD_FILE = config("BENCH_RECORD_FILE", cast=str, default="")
+
+HOUR = 60 * 60 * 1000
+SYMBOLS = 300
+UPDATES = 30  # frames of each candle, exchange send one in 1-2 seconds
+
+
+def get_frame(symbol: str, open_time: int, update: int) -> bytes:
+    """Get kline frame in format of combined stream."""
+    return orjson.dumps(
+        {
+            "stream": f"{symbol.lower()}@kline_1h",
+            "data": {
+                "e": "kline",
+                "E": open_time + update * 2000,
+                "s": symbol,
+                "k": {
+                    "t": open_time,
+                    "T": open_time + HOUR - 1,
+                    "s": symbol,
+                    "i": "1h",
+                    "o": "1.00000000",
+                    "c": f"1.{update:08d}",
+                    "h": "2.00000000",
+                    "l": "0.50000000",
+                    "v": f"{update * 10}.00000000",
+                    "x": update == UPDATES - 1,
+                },
+            },
+        },
+    )
+
+
+def write_recording(path: Path) -> None:
+    """Write synthetic recording of 2 candles of each symbol."""
+    recorder = FrameRecorder(str(path))
+    for open_time in (HOUR, 2 * HOUR):
+        for update in range(UPDATES):
+            for i in range(SYMBOLS):
+                recorder.add(get_frame(f"S{i}USDT", open_time, update))
+    recorder.write(recorder.buffer)
+
+
+def get_recorded_frames(path: Path) -> list[bytes]:
+    """Get frames of recording, synthetic recording if BENCH_RECORD_FILE not set."""
+    if not BENCH_RECORD_FILE:
+        write_recording(path)
+    return [frame for _, frame in read_frames(BENCH_RECORD_FILE or str(path))]
+
+
+def decode_all(frames: list[bytes]) -> list[tuple[str, int]]:
+    """Get new candles by full decode of each frame, former path."""
+    start_times = {}
+    candles = []
+    for frame in frames:
+        kline = orjson.loads(frame).get("data", {}).get("k")
+        if kline and start_times.get(kline["s"]) != kline["t"]:
+            start_times[kline["s"]] = kline["t"]
+            candles.append((kline["s"], kline["t"]))
+    return candles
+
+
+def decode_new(frames: list[bytes]) -> list[tuple[str, int]]:
+    """Get new candles by decode of frames passed KlineFilter."""
+    kline_filter = KlineFilter()
+    candles = []
+    for frame in frames:
+        if kline_filter.is_new(frame):
+            kline = orjson.loads(frame).get("data", {}).get("k")
+            if kline:
+                candles.append((kline["s"], kline["t"]))
+    return candles
+
+
+def test_benchmark(tmp_path: Path) -> None:
+    """Compare frames per second and CPU per frame, run with -s for report."""
+    frames = get_recorded_frames(tmp_path / "frames.bin")
+
+    results = []
+    for name, decode in (("decode all", decode_all), ("filter", decode_new)):
+        start, cpu = perf_counter(), process_time()
+        results.append(decode(frames))
+        elapsed, cpu = perf_counter() - start, process_time() - cpu
+
+        print(
+            f"\n{name}: {len(frames) / elapsed:,.0f} frames/s, "
+            f"{cpu / len(frames) * 1e6:.2f}us CPU/frame",
+        )
+
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize(
+    ("frame", "expected"),
+    [
+        (get_frame("BTCUSDT", HOUR, 1), False),  # same candle
+        (get_frame("BTCUSDT", 2 * HOUR, 0), True),  # next candle
+        (get_frame("ETHUSDT", HOUR, 1), True),  # other stream
+        (b'{"result":null,"id":1}', True),  # reply, need decode
+    ],
+)
+def test_is_new(frame: bytes, *, expected: bool) -> None:
+    """Only frames of known candle are skipped."""
+    kline_filter = KlineFilter()
+    assert kline_filter.is_new(get_frame("BTCUSDT", HOUR, 0))
+
+    assert kline_filter.is_new(frame) is expected
+
+
+def test_forget() -> None:
+    """Frame of forgotten candle is new again."""
+    kline_filter = KlineFilter()
+    frame = get_frame("BTCUSDT", HOUR, 0)
+    kline_filter.is_new(frame)
+
+    kline_filter.forget(frame)
+
+    assert kline_filter.is_new(get_frame("BTCUSDT", HOUR, 1))
@@ -0,0 +1,51 @@
+"""Check known candles of Composter after failed publish."""
+
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+from main import candle
+from models import Token
+
+HOUR = 60 * 60 * 1000
+
+
+class FlakyBatch:
+    """Batch which fail first add."""
+
+    def __init__(self: "FlakyBatch") -> None:
+        """Init batch without candles."""
+        self.fails = 1
+        self.candles: list[tuple[str, str, int]] = []
+
+    async def add(
+        self: "FlakyBatch",
+        symbol: str,
+        open_price: str,
+        open_time: int,
+        _: int,
+    ) -> None:
+        """Save candle or raise while fails left."""
+        if self.fails:
+            self.fails -= 1
+            raise ConnectionError(symbol)
+        self.candles.append((symbol, open_price, open_time))
+
+
+def test_candle_after_failed_publish() -> None:
+    """Failed candle not known, same candle published by next frame."""
+    token = Token(currency=["BTC"], ignore_currency=[], base_keep=Decimal(1000))
+    token.init_history()
+    batch = FlakyBatch()
+    msg = {"s": "BTCUSDT", "o": "97000.01", "t": HOUR}
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(candle(msg, batch, token, HOUR))
+    assert token.history["BTCUSDT"] == ""
+    assert token.open_times["BTCUSDT"] == 0
+
+    asyncio.run(candle(msg, batch, token, HOUR))
+
+    assert batch.candles == [("BTCUSDT", "97000.01", HOUR)]
+    assert token.history["BTCUSDT"] == "97000.01"
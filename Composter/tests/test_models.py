@@ -0,0 +1,79 @@
+"""Check CandleBatch by fake JetStream with slow publish."""
+
+import asyncio
+from decimal import Decimal
+
+import orjson
+import pytest
+
+from metricslocal import OPEN_TIME, get_time_headers
+from models import INTERVALS, CandleBatch, Token
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "TRXUSDT"]
+HOUR = 60 * 60 * 1000
+
+
+class FakeJetStream:
+    """JetStream which save published candles by open time."""
+
+    def __init__(self: "FakeJetStream") -> None:
+        """Init without messages."""
+        self.candles: dict[int, list[str]] = {}
+
+    async def publish(
+        self: "FakeJetStream",
+        _: str,
+        payload: bytes,
+        headers: dict,
+    ) -> None:
+        """Save symbols of message after delay of server."""
+        await asyncio.sleep(0.01)
+        open_time = get_time_headers(headers)[OPEN_TIME]
+        self.candles.setdefault(open_time, []).extend(orjson.loads(payload))
+
+
+async def run_boundaries() -> tuple[FakeJetStream, CandleBatch, int]:
+    """Add candles of new boundary while batch of previous one publish."""
+    js = FakeJetStream()
+    batch = CandleBatch(js=js, total=len(SYMBOLS), window=10)
+
+    await batch.add("BTCUSDT", "97000.01", HOUR, HOUR)
+    await asyncio.gather(
+        *[batch.add(symbol, "1.0", 2 * HOUR, 2 * HOUR) for symbol in SYMBOLS],
+    )
+
+    # tasks left after publish of both boundaries, timer not expected
+    tasks = len(asyncio.all_tasks()) - 1
+    return js, batch, tasks
+
+
+def test_new_boundary_while_publish() -> None:
+    """Each candle published once by own boundary, no timer left."""
+    js, batch, tasks = asyncio.run(run_boundaries())
+
+    # symbols of one boundary are split by shards, order of shards not fixed
+    assert {time: sorted(symbols) for time, symbols in js.candles.items()} == {
+        HOUR: ["BTCUSDT"],
+        2 * HOUR: SYMBOLS,
+    }
+    assert batch.timer is None
+    assert tasks == 0
+
+
+@pytest.mark.parametrize("interval", list(INTERVALS))
+def test_candle_open_time(interval: str) -> None:
+    """Open time of candle is multiple of interval, not later now."""
+    token = Token([], [], Decimal(1000), time_shift=interval)
+    now = 1733349600000 + 12345678
+
+    open_time = token.get_candle_open_time(now)
+
+    assert open_time % INTERVALS[interval] == 0
+    assert 0 <= now - open_time < INTERVALS[interval]
+
+
+@pytest.mark.parametrize("interval", ["3d", "1w", "1M"])
+def test_calendar_interval(interval: str) -> None:
+    """Intervals started by calendar rejected on config load."""
+    with pytest.raises(ValueError, match="TIME_SHIFT"):
+        Token([], [], Decimal(1000), time_shift=interval)
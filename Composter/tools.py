@@ -0,0 +1,20 @@
+"""Tools for Composter."""
+
+from httplocal import API_URI, binance_request
+
+
+async def get_klines(symbol: str, interval: str, limit: int = 1) -> list:
+    """Get last klines of symbol.
+
+    [[1733349600000, "97000.01", "97100.00", ...]]
+    """
+    async with binance_request(
+        "GET",
+        url=f"{API_URI}/api/v3/klines",
+        params={
+            "symbol": symbol,
+            "interval": interval,
+            "limit": limit,
+        },
+    ) as resp:
+        return await resp.json()
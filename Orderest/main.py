@@ -1,43 +1,280 @@
-"""Bnnc Orderest."""
-
-import asyncio
-
-from decouple import config
-from loguru import logger
-
-from models import Access
-from tools import cancel_order, get_order_list, get_seconds_to_next_minutes
-
-
-async def find_order_for_cancel(access: Access) -> None:
-    """Find order created more then 1 hour ago."""
-    orders = await get_order_list(access)
-    logger.info(orders)
-    for order in orders:
-        logger.warning(f"Need cancel:{order['symbol']}:{order['orderId']}")
-        # need more info about DELETE method
-        await cancel_order(access, order["symbol"], order["orderId"])
-
-
-async def main() -> None:
-    """Main func in microservice."""
-    # Access object
-    access = Access(
-        key=config("KEY", cast=str),
-        secret=config("SECRET", cast=str),
-        base_uri="https://api.binance.com",
-    )
-
-    await find_order_for_cancel(access)
-
-    while True:
-        wait_seconds = get_seconds_to_next_minutes(58)
-
-        logger.info(f"Wait {wait_seconds} to run find_order_for_cancel")
-        await asyncio.sleep(wait_seconds)
-
-        await find_order_for_cancel(access)
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
+"""Bnnc Orderest."""
+
+import asyncio
+from time import perf_counter, time
+
+import orjson
+from decouple import config
+from loguru import logger
+from websockets import connect
+
+from httplocal import API_URI, STREAM_URI, close_session
+from metricslocal import FRAMES, observe, observe_since, start_metrics
+from models import Access, OrderIndex
+from tools import (
+    cancel_all_orders,
+    cancel_order,
+    get_order_list,
+    get_websocket_listen_key,
+    keep_alive_listen_key,
+)
+
+# Orders older then ORDER_MAX_AGE seconds are stale, Processor keep or replace
+# own order on each candle, so only orders left for few candles are stale
+ORDER_MAX_AGE = config("ORDER_MAX_AGE", cast=int, default=3 * 60 * 60)
+CANCEL_CONCURRENCY = config("CANCEL_CONCURRENCY", cast=int, default=10)
+# Failed cancel repeated after CANCEL_RETRY * 2**attempt seconds
+CANCEL_RETRY = config("CANCEL_RETRY", cast=int, default=5)
+CANCEL_RETRY_CAP = config("CANCEL_RETRY_CAP", cast=int, default=5 * 60)
+# Full fetch of open orders only for fix missed events
+RECONCILE_INTERVAL = config("RECONCILE_INTERVAL", cast=int, default=6 * 60 * 60)
+
+# Status of order after which order not open
+CLOSED_STATUSES = {"FILLED", "CANCELED", "REJECTED", "EXPIRED", "EXPIRED_IN_MATCH"}
+
+# Exchange error of cancel when order already filled or canceled
+UNKNOWN_ORDER = -2011
+
+
+def is_failed(result: list | dict | BaseException) -> bool:
+    """Check request failed, exchange send {"code": -2011, "msg": "..."}."""
+    return isinstance(result, BaseException) or (
+        isinstance(result, dict) and "code" in result
+    )
+
+
+def is_cancelled(result: dict | BaseException) -> bool:
+    """Check order not open after cancel, -2011 is already filled or canceled."""
+    if isinstance(result, BaseException):
+        return False
+    return result.get("code", UNKNOWN_ORDER) == UNKNOWN_ORDER
+
+
+async def get_open_ids(
+    access: Access,
+    symbol: str,
+    semaphore: asyncio.Semaphore,
+) -> set[int] | None:
+    """Get orderId of open orders of symbol on exchange, None if failed."""
+    async with semaphore:
+        try:
+            orders = await get_order_list(access, symbol)
+        except Exception as exc:  # noqa: BLE001
+            orders = exc
+
+    if is_failed(orders):
+        logger.error(f"Get open orders failed:{symbol}:{orders!r}")
+        return None
+    return {order["orderId"] for order in orders}
+
+
+async def cancel_all_symbol(
+    access: Access,
+    symbol: str,
+    stale: list[dict],
+    semaphore: asyncio.Semaphore,
+) -> list[dict]:
+    """Cancel all open orders of symbol by one request, get failed orders."""
+    async with semaphore:
+        try:
+            result = await cancel_all_orders(access, symbol)
+        except Exception as exc:  # noqa: BLE001
+            result = exc
+
+    # -2011 is nothing open, orders closed before cancel
+    if is_failed(result) and not is_cancelled(result):
+        logger.error(f"Cancel all failed:{symbol}:{result!r}")
+        return stale
+    return []
+
+
+async def cancel_symbol(
+    access: Access,
+    symbol: str,
+    stale: list[dict],
+    semaphore: asyncio.Semaphore,
+) -> list[dict]:
+    """Cancel stale orders of symbol, get orders with failed cancel.
+
+    only orders from index are cancelled, new order of symbol stay open:
+    one request for all orders only if open orders on exchange all stale
+    """
+    if len(stale) > 1:
+        open_ids = await get_open_ids(access, symbol, semaphore)
+
+        if open_ids is not None and open_ids <= {order["orderId"] for order in stale}:
+            if not open_ids:
+                return []  # all stale orders already closed
+            return await cancel_all_symbol(access, symbol, stale, semaphore)
+
+    return await cancel_by_id(access, symbol, stale, semaphore)
+
+
+async def cancel_by_id(
+    access: Access,
+    symbol: str,
+    stale: list[dict],
+    semaphore: asyncio.Semaphore,
+) -> list[dict]:
+    """Cancel stale orders of symbol by orderId, get orders with failed cancel."""
+
+    async def cancel(order: dict) -> dict:
+        async with semaphore:
+            return await cancel_order(access, symbol, order["orderId"])
+
+    results = await asyncio.gather(
+        *[cancel(order) for order in stale],
+        return_exceptions=True,
+    )
+
+    failed = []
+    for order, result in zip(stale, results, strict=True):
+        if not is_cancelled(result):
+            logger.error(f"Cancel failed:{symbol}:{order['orderId']}:{result!r}")
+            failed.append(order)
+
+    return failed
+
+
+async def cancel_expired(
+    access: Access,
+    index: OrderIndex,
+    expired: dict[str, list[dict]],
+) -> None:
+    """Cancel orders reached deadline, failed cancel go back to index."""
+    start = perf_counter()
+    semaphore = asyncio.Semaphore(CANCEL_CONCURRENCY)
+
+    for symbol, stale in expired.items():
+        logger.warning(f"Need cancel:{symbol}:{len(stale)}")
+
+    results = await asyncio.gather(
+        *[
+            cancel_symbol(access, symbol, stale, semaphore)
+            for symbol, stale in expired.items()
+        ],
+    )
+    failed = [order for result in results for order in result]
+
+    # order still open on exchange, cancel again after backoff
+    now = int(time() * 1000)
+    for order in failed:
+        order["attempt"] = order.get("attempt", 0) + 1
+        delay = min(CANCEL_RETRY * 2 ** (order["attempt"] - 1), CANCEL_RETRY_CAP)
+        index.push(order, now + delay * 1000)
+
+    total = sum(len(stale) for stale in expired.values())
+    observe("cancel_sweep", "all", perf_counter() - start)
+    logger.info(
+        f"Sweep {len(expired)} symbols in {perf_counter() - start:.3f}s:"
+        f"cancelled {total - len(failed)}:failed {len(failed)}",
+    )
+
+
+async def run_cancel_timer(access: Access, index: OrderIndex) -> None:
+    """Infinity cancel each order when it reach ORDER_MAX_AGE."""
+    while True:
+        index.changed.clear()
+        delay = index.get_delay(int(time() * 1000))
+
+        # sleep until first deadline or new order in index
+        try:
+            async with asyncio.timeout(delay):
+                await index.changed.wait()
+        except TimeoutError:
+            pass
+
+        expired = index.pop_expired(int(time() * 1000))
+        if expired:
+            await cancel_expired(access, index, expired)
+
+
+async def reconcile(access: Access, index: OrderIndex) -> None:
+    """Sync index with full list of open orders on exchange."""
+    orders = await get_order_list(access)
+    if is_failed(orders):
+        logger.error(f"Get open orders failed:{orders}")
+        return
+
+    changes = index.replace(
+        [
+            {"symbol": order["symbol"], "orderId": order["orderId"], "time": order["time"]}
+            for order in orders
+        ],
+    )
+    logger.info(f"Reconcile {len(orders)} open orders:{changes} changes")
+
+
+async def run_reconcile(access: Access, index: OrderIndex) -> None:
+    """Infinity reconcile index by low frequency."""
+    while True:
+        await asyncio.sleep(RECONCILE_INTERVAL)
+        await reconcile(access, index)
+
+
+def execution_report(msg: dict, index: OrderIndex) -> None:
+    """Work with change status of order on exchange.
+
+    {"e": "executionReport", "s": "BTCUSDT", "i": 28, "X": "NEW", "O": 1733347691452, ...}
+    """
+    if msg["e"] != "executionReport":
+        return
+
+    # from order event on exchange to receive
+    observe_since("report", msg["s"], msg["E"])
+
+    if msg["X"] == "NEW":
+        index.add({"symbol": msg["s"], "orderId": msg["i"], "time": msg["O"]})
+    elif msg["X"] in CLOSED_STATUSES:
+        index.remove(msg["i"])
+
+
+async def web_socket(listen_key: str, index: OrderIndex) -> None:
+    """Run infinity listening stream of orders."""
+    async with connect(
+        uri=f"{STREAM_URI}/ws/{listen_key}",
+        max_queue=1024,
+    ) as ws:
+        while True:
+            msg = await ws.recv()
+            FRAMES.labels("user").inc()
+            execution_report(orjson.loads(msg), index)
+
+
+async def run_keep_alive(access: Access, listenkey: str) -> None:
+    """Infinity sent PUT for KeepAlive."""
+    while True:
+        await keep_alive_listen_key(access, listenkey)
+        await asyncio.sleep(600)  # sleep 10 min
+
+
+async def main() -> None:
+    """Main func in microservice."""
+    start_metrics()
+
+    # Access object
+    access = Access(
+        key=config("KEY", cast=str),
+        secret=config("SECRET", cast=str),
+        base_uri=API_URI,
+    )
+
+    index = OrderIndex(max_age=ORDER_MAX_AGE * 1000)
+
+    try:
+        # listen before first fetch for not miss orders created between them
+        listen_key_resp = await get_websocket_listen_key(access)
+        listen_key = listen_key_resp["listenKey"]
+
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(web_socket(listen_key, index))
+            tg.create_task(run_keep_alive(access, listen_key))
+            await reconcile(access, index)
+            tg.create_task(run_cancel_timer(access, index))
+            tg.create_task(run_reconcile(access, index))
+    finally:
+        await close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,10 @@
 """Classes for work."""
 
+import asyncio
 import hashlib
+import heapq
 import hmac
+from collections import defaultdict
 from typing import Self
 
 
@@ -21,3 +24,84 @@ class Access:
             msg.encode("utf-8"),
             hashlib.sha256,
         ).hexdigest()
+
+
+class OrderIndex:
+    """Class for store open orders and deadline of cancel each of them.
+
+    orders removed from index stay in heap and skipped on pop
+    """
+
+    def __init__(self: Self, max_age: int) -> None:
+        """Init empty index, max_age in ms."""
+        self.max_age: int = max_age
+        self.orders: dict[int, dict] = {}  # orderId to order
+        self.by_symbol: dict[str, set[int]] = defaultdict(set)
+        self.timers: list[tuple[int, int]] = []  # heap of (deadline, orderId)
+        self.changed: asyncio.Event = asyncio.Event()
+
+    def add(self: Self, order: dict) -> None:
+        """Add open order.
+
+        {"symbol": "BTCUSDT", "orderId": 28, "time": 1733347691452}
+        """
+        self.push(order, order["time"] + self.max_age)
+
+    def push(self: Self, order: dict, deadline: int) -> None:
+        """Add order with deadline of cancel in ms."""
+        order_id = order["orderId"]
+        if order_id in self.orders:
+            return
+
+        self.orders[order_id] = order
+        self.by_symbol[order["symbol"]].add(order_id)
+        heapq.heappush(self.timers, (deadline, order_id))
+        self.changed.set()  # new deadline can be first
+
+    def remove(self: Self, order_id: int) -> dict | None:
+        """Remove filled or canceled order."""
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            self.by_symbol[order["symbol"]].discard(order_id)
+            if not self.by_symbol[order["symbol"]]:
+                del self.by_symbol[order["symbol"]]
+        return order
+
+    def replace(self: Self, orders: list[dict]) -> int:
+        """Replace index by full list of open orders, get count of changes."""
+        open_ids = {order["orderId"] for order in orders}
+        removed = [
+            order_id for order_id in list(self.orders) if order_id not in open_ids
+        ]
+        for order_id in removed:
+            self.remove(order_id)
+
+        added = [order for order in orders if order["orderId"] not in self.orders]
+        for order in added:
+            self.add(order)
+
+        return len(removed) + len(added)
+
+    def get_delay(self: Self, now: int) -> float | None:
+        """Get seconds to first deadline, None if index is empty."""
+        # drop timers of removed orders
+        while self.timers and self.timers[0][1] not in self.orders:
+            heapq.heappop(self.timers)
+
+        if not self.timers:
+            return None
+        return max(self.timers[0][0] - now, 0) / 1000
+
+    def pop_expired(self: Self, now: int) -> dict[str, list[dict]]:
+        """Pop orders reached deadline grouped by symbol.
+
+        {"BTCUSDT": [order, ...]}, order with failed cancel must be added back by push
+        """
+        expired = defaultdict(list)
+        while self.timers and self.timers[0][0] <= now:
+            _, order_id = heapq.heappop(self.timers)
+            order = self.remove(order_id)
+            if order is not None:
+                expired[order["symbol"]].append(order)
+
+        return expired
@@ -1,12 +1,11 @@
 """Tools for Orderest."""
 
-from datetime import UTC, datetime
 from time import time
 
-import aiohttp
 from loguru import logger
 from orjson import loads
 
+from httplocal import API_URI, binance_request, get_session
 from models import Access
 
 
@@ -18,10 +17,12 @@ async def request(
     data_json: str | None = None,
 ) -> dict:
     """Universal http reqponse."""
-    async with (
-        aiohttp.ClientSession(headers=headers) as session,
-        session.request(method, url, data=data_json) as response,
-    ):
+    async with get_session().request(
+        method,
+        url,
+        data=data_json,
+        headers=headers,
+    ) as response:
         res = await response.read()  # bytes
         data = loads(res)  # dict ['code':str, 'data':dict]
 
@@ -36,9 +37,9 @@ async def request(
         return result
 
 
-async def cancel_order(access: Access, symbol: str, order_id: int) -> None:
+async def cancel_order(access: Access, symbol: str, order_id: int) -> dict:
     """Cancel order by number."""
-    logger.info("Run cancel_order")
+    logger.info(f"Run cancel_order:{symbol}:{order_id}")
 
     timestamp = int(time() * 1000)
 
@@ -54,53 +55,95 @@ async def cancel_order(access: Access, symbol: str, order_id: int) -> None:
     signature = access.encrypted(query_string)
     data.update({"signature": signature})
 
-    async with (
-        aiohttp.ClientSession(
-            headers={
-                "X-MBX-APIKEY": access.key,
-                "Content-Type": "application/x-www-form-urlencoded",
-            },
-        ) as session,
-        session.delete(
-            url="https://api.binance.com/sapi/v1/margin/order",
-            params=data,
-        ) as resp,
-    ):
+    async with binance_request(
+        "DELETE",
+        url=f"{API_URI}/sapi/v1/margin/order",
+        params=data,
+        headers={
+            "X-MBX-APIKEY": access.key,
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+    ) as resp:
         return await resp.json()
 
 
-async def get_order_list(access: Access) -> dict:
-    """Get all active orders in excange."""
+async def cancel_all_orders(access: Access, symbol: str) -> list | dict:
+    """Cancel all open orders of symbol by one request."""
+    logger.info(f"Run cancel_all_orders:{symbol}")
+
+    timestamp = int(time() * 1000)
+
+    data = {
+        "recvWindows": 10000,
+        "timestamp": timestamp,
+        "symbol": symbol,
+    }
+
+    query_string = "&".join([f"{k}={v}" for k, v in data.items()])
+
+    signature = access.encrypted(query_string)
+    data.update({"signature": signature})
+
+    async with binance_request(
+        "DELETE",
+        url=f"{API_URI}/sapi/v1/margin/openOrders",
+        params=data,
+        headers={
+            "X-MBX-APIKEY": access.key,
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+    ) as resp:
+        return await resp.json()
+
+
+async def get_order_list(access: Access, symbol: str | None = None) -> list | dict:
+    """Get active orders in excange, all or of one symbol."""
     timestamp = int(time() * 1000)
 
     data = {"recvWindows": 10000, "timestamp": timestamp}
+    if symbol is not None:
+        data["symbol"] = symbol
 
     query_string = "&".join([f"{k}={v}" for k, v in data.items()])
 
     signature = access.encrypted(query_string)
     data.update({"signature": signature})
 
-    async with (
-        aiohttp.ClientSession(
-            headers={"X-MBX-APIKEY": access.key},
-        ) as session,
-        session.get(
-            url="https://api.binance.com/sapi/v1/margin/openOrders",
-            params=data,
-        ) as resp,
-    ):
+    async with binance_request(
+        "GET",
+        url=f"{API_URI}/sapi/v1/margin/openOrders",
+        params=data,
+        headers={"X-MBX-APIKEY": access.key},
+    ) as resp:
         return await resp.json()
 
 
-def get_seconds_to_next_minutes(minutes: int) -> int:
-    """Get next 10:00 minutes."""
-    now = datetime.now(tz=UTC)
+async def get_websocket_listen_key(access: Access) -> dict:
+    """Get listenKey for websocket.
 
-    if now.minute > minutes:
-        result_minute = 60 - now.minute + minutes
-    elif now.minute < minutes:
-        result_minute = minutes - now.minute
-    else:
-        result_minute = minutes
+    {
+            "listenKey": "..."
+    }
+    """
+    async with binance_request(
+        "POST",
+        url=f"{API_URI}/sapi/v1/userDataStream",
+        headers={
+            "X-MBX-APIKEY": access.key,
+        },
+    ) as resp:
+        return await resp.json()
 
-    return result_minute * 60
+
+async def keep_alive_listen_key(access: Access, listen_key: str) -> dict:
+    """KeepAlive for listenKey."""
+    params = {"listenKey": listen_key}
+    async with binance_request(
+        "PUT",
+        url=f"{API_URI}/sapi/v1/userDataStream",
+        params=params,
+        headers={
+            "X-MBX-APIKEY": access.key,
+        },
+    ) as resp:
+        return await resp.json()
@@ -0,0 +1,138 @@
+"""Compare latency of order request by REST and WebSocket API.
+
+Send test orders (checked by exchange, not placed) by both transports,
+one by one and by burst, and print percentiles of round trip.
+Run against Simulator or exchange:
+
+    python latency.py
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from statistics import quantiles
+from time import perf_counter, time
+
+from decouple import config
+from loguru import logger
+
+from httplocal import API_URI, binance_request, close_session
+from models import Access
+from wsapi import WsApiSession
+
+LATENCY_COUNT = config("LATENCY_COUNT", cast=int, default=100)  # requests by mode
+LATENCY_BURST = config("LATENCY_BURST", cast=int, default=10)  # requests together
+LATENCY_SYMBOL = config("LATENCY_SYMBOL", cast=str, default="BTCUSDT")
+LATENCY_PRICE = config("LATENCY_PRICE", cast=str, default="10000")
+LATENCY_SIZE = config("LATENCY_SIZE", cast=str, default="0.001")
+WS_API_WAIT = 10.0  # seconds for first connect
+
+ORDER = {
+    "symbol": LATENCY_SYMBOL,
+    "side": "BUY",
+    "type": "LIMIT",
+    "quantity": LATENCY_SIZE,
+    "price": LATENCY_PRICE,
+    "timeInForce": "GTC",
+}
+
+
+async def make_rest_test_order(access: Access) -> dict:
+    """Check limit order by REST without place."""
+    data = {
+        **ORDER,
+        "recvWindows": 10000,
+        "timestamp": int(time() * 1000),
+    }
+
+    query_string = "&".join([f"{k}={v}" for k, v in data.items()])
+
+    signature = access.encrypted(query_string)
+    data.update({"signature": signature})
+
+    async with binance_request(
+        "POST",
+        url=f"{API_URI}/api/v3/order/test",
+        data=data,
+        headers={
+            "X-MBX-APIKEY": access.key,
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+    ) as resp:
+        return await resp.json()
+
+
+async def make_ws_test_order(session: WsApiSession) -> dict:
+    """Check limit order by WebSocket API without place."""
+    return await session.request("order.test", ORDER)
+
+
+async def measure(
+    send: Callable[[], Awaitable[dict]],
+    burst: int,
+) -> tuple[list[float], int]:
+    """Get latency in ms of each request and count of errors, burst run together."""
+
+    async def timed() -> tuple[float, bool]:
+        start = perf_counter()
+        try:
+            result = await send()
+        except (ConnectionError, TimeoutError) as e:
+            logger.error(f"Request failed:{e!r}")
+            return (perf_counter() - start) * 1000, False
+        return (perf_counter() - start) * 1000, "code" not in result
+
+    latencies = []
+    errors = 0
+    for _ in range(0, LATENCY_COUNT, burst):
+        for latency, is_ok in await asyncio.gather(*[timed() for _ in range(burst)]):
+            latencies.append(latency)
+            errors += not is_ok
+    return latencies, errors
+
+
+def get_report(name: str, latencies: list[float], errors: int) -> str:
+    """Get line with percentiles of latency in ms."""
+    percentiles = quantiles(latencies, n=100)
+    p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+    return (
+        f"{name:<12} n={len(latencies)} errors={errors} "
+        f"p50={p50:.1f} p90={p90:.1f} p99={p99:.1f} max={max(latencies):.1f}"
+    )
+
+
+async def main() -> None:
+    """Measure both transports one by one and by burst."""
+    access = Access(
+        key=config("KEY", cast=str),
+        secret=config("SECRET", cast=str),
+        base_uri=API_URI,
+    )
+
+    session = WsApiSession(access)
+    task = asyncio.create_task(session.run())
+
+    try:
+        async with asyncio.timeout(WS_API_WAIT):
+            await session.connected.wait()
+
+        # first request open HTTP connection, not counted
+        await make_rest_test_order(access)
+
+        reports = []
+        for burst in (1, LATENCY_BURST):
+            for name, send in (
+                ("rest", lambda: make_rest_test_order(access)),
+                ("ws", lambda: make_ws_test_order(session)),
+            ):
+                latencies, errors = await measure(send, burst)
+                reports.append(get_report(f"{name} x{burst}", latencies, errors))
+
+        for report in reports:
+            logger.info(report)
+    finally:
+        task.cancel()
+        await close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
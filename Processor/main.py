@@ -1,141 +1,477 @@
-"""Bnnc Processor."""
-
-import asyncio
-from decimal import ROUND_DOWN, Decimal
-
-import orjson
-from decouple import Csv, config
-from loguru import logger
-from nats.aio.client import Msg
-
-from models import Access, Token
-from natslocal import get_js_context
-from tools import make_margin_limit_order
-
-
-def get_side_and_size(
-    available: Decimal,
-    baseincrement: Decimal,
-    price: Decimal,
-    token: Token,
-) -> dict:
-    """Get side of trade and size of tokens."""
-    # Get new balance by new price and available count of token's
-    # Decimal type
-    new_balance = price * available
-
-    # default "0" count of token's
-    tokens_count = Decimal("0")
-
-    if new_balance >= token.base_keep:
-        # need sell of part
-        tokens_count = (new_balance - token.base_keep) / price
-        side = "sell"
-
-    else:
-        # need buy of part
-        tokens_count = (token.base_keep - new_balance) / price
-        side = "buy"
-
-    # Round by increment token
-    size = tokens_count.quantize(
-        baseincrement,
-        ROUND_DOWN,
-    )
-
-    return {"side": side, "size": size}
-
-
-async def candle(msg: Msg) -> None:
-    """Collect data of open price each candle by interval.
-
-    recieve in format
-    {"TRXUSDT": "0.38640000"}
-    """
-    for symbol, price in orjson.loads(msg.data).items():
-        logger.success(f"New candle:{symbol}:{price}")
-
-        # check if token not yet send balance
-        if symbol in ledger:
-
-            # get side and size
-            sidze = get_side_and_size(
-                ledger[symbol]["available"],
-                ledger[symbol]["baseincrement"],
-                Decimal(price),
-                token,
-            )
-
-            if sidze["size"] != Decimal("0.0"):  # check on buy '0' count of tokens
-
-                # make limit order
-                await make_margin_limit_order(
-                    access=access,
-                    side=sidze["side"],
-                    price=price,
-                    symbol=symbol,
-                    size=float(sidze["size"]),
-                )
-    await msg.ack()
-
-
-async def balance(msg: Msg) -> None:
-    """Collect balance of each tokens.
-
-    recieve in format
-    {"symbol": "TRXUSDT", "baseincrement": "0.00010000", "available": "0"}
-    """
-    data = orjson.loads(msg.data)
-
-    symbol = data["symbol"]
-    available = data["available"]
-    baseincrement = data["baseincrement"]
-
-    ledger.update(
-        {
-            symbol: {
-                "baseincrement": Decimal(baseincrement),
-                "available": Decimal(available),
-            },
-        },
-    )
-
-    logger.success(f"Change balance:{symbol} to {available}")
-
-    await msg.ack()
-
-
-async def main() -> None:
-    """Main func in microservice."""
-    logger.info("Start Processor")
-    global ledger, access, token
-    ledger = {}
-
-    js = await get_js_context()
-
-    # Access object
-    access = Access(
-        key=config("KEY", cast=str),
-        secret=config("SECRET", cast=str),
-        base_uri="https://api.binance.com",
-    )
-
-    # Token's object
-    token = Token(
-        time_shift=config("TIME_SHIFT", cast=str, default="1h"),
-        base_stable=config("BASE_STABLE", cast=str, default="USDT"),
-        currency=config("ALLCURRENCY", cast=Csv(str)),
-        ignore_currency=config("IGNORECURRENCY", cast=Csv(str)),
-        base_keep=Decimal(config("BASE_KEEP", cast=int)),
-    )
-
-    await js.add_stream(name="bnnc", subjects=["candle", "balance"])
-
-    await js.subscribe("candle", "candle", cb=candle)
-    await js.subscribe("balance", "balance", cb=balance)
-
-    await asyncio.sleep(60 * 60 * 24 * 365)  # Wait 1 year
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
+"""Bnnc Processor."""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from decimal import Decimal
+from functools import partial
+from socket import gethostname
+from time import perf_counter, time
+
+import orjson
+from decouple import Csv, config
+from loguru import logger
+from nats.aio.client import Msg
+from nats.js import JetStreamContext
+from nats.js.api import AckPolicy, ConsumerConfig
+from nats.js.errors import KeyWrongLastSequenceError
+from nats.js.kv import KeyValue
+from websockets import connect
+
+from httplocal import API_URI, STREAM_URI, close_session
+from metricslocal import (
+    ACK_LAG,
+    EVENT_TIME,
+    FRAMES,
+    PENDING,
+    PUBLISH_TIME,
+    REJECTED,
+    get_now,
+    get_time_headers,
+    observe,
+    observe_since,
+    start_metrics,
+)
+from models import Access, Dispatcher, HashRing, LiveOrders, Token
+from natslocal import (
+    CANDLE_SHARDS,
+    FILTERS_TTL,
+    get_js_context,
+    get_kv_balance,
+    get_kv_claims,
+    get_kv_filters,
+    get_kv_replicas,
+    get_shard_subject,
+    setup_stream,
+)
+from portfolio import Portfolio, SymbolFilter
+from tools import (
+    cancel_margin_order,
+    get_client_order_id,
+    get_websocket_listen_key,
+    keep_alive_listen_key,
+    make_margin_limit_order,
+)
+
+# Exchange error of cancel when order already filled or canceled
+UNKNOWN_ORDER = -2011
+
+# Status of order after which order not resting
+CLOSED_STATUSES = {"FILLED", "CANCELED", "REJECTED", "EXPIRED", "EXPIRED_IN_MATCH"}
+
+# Retry of failed orders of candle, delay grow by attempt
+ORDER_RETRIES = 3
+ORDER_RETRY_DELAY = 1.0  # seconds
+
+
+async def make_order(
+    symbol: str,
+    price: str,
+    sidze: dict,
+    claim: str,
+    event_time: int,
+) -> None:
+    """Make order by side and size of symbol."""
+    # fix price and size by exchange filters, skip order which exchange reject,
+    # expired key not removed from watcher, so filters without refresh skipped
+    size = sidze["size"]
+    if symbol in filters and filters[symbol].is_fresh(time()):
+        checked = filters[symbol].check(price, size)
+        if checked is None:
+            REJECTED.labels(symbol).inc()
+            logger.warning(f"Rejected by filters:{symbol}:{price}:{size}")
+            return
+        price, size = checked
+
+    # only one replica can trade symbol by one candle
+    try:
+        revision = await claims.create(claim, replica_id.encode())
+    except KeyWrongLastSequenceError:
+        logger.warning(f"Already claimed:{claim}")
+        return
+
+    try:
+        await place_order(symbol, price, size, sidze["side"], event_time)
+    except Exception:
+        # release own claim, retry of job or redelivery can claim again
+        await claims.delete(claim, last=revision)
+        raise
+
+
+async def place_order(
+    symbol: str,
+    price: str,
+    size: str,
+    side: str,
+    event_time: int,
+) -> None:
+    """Keep resting order or replace it by new order."""
+    # resting order of last candle already match target
+    if live_orders.is_same(symbol, side, price, size):
+        logger.info(f"Keep resting order:{symbol}:{price}:{size}")
+        return
+
+    # cancel resting order of last candle before new one, not stack orders
+    if not await cancel_live_order(symbol):
+        return
+
+    # make limit order, saved before for not miss report of fast fill
+    client_order_id = get_client_order_id()
+    live_orders.save(symbol, client_order_id, side, price, size)
+    # on exception order maybe placed, kept unconfirmed for cancel by retry
+    result = await make_margin_limit_order(
+        access=access,
+        side=side,
+        price=price,
+        symbol=symbol,
+        size=size,
+        client_order_id=client_order_id,
+    )
+
+    if "orderId" in result:
+        live_orders.confirm(client_order_id)
+        # from kline event on exchange to ack of order
+        observe_since("end_to_end", symbol, event_time)
+    else:
+        live_orders.pop(symbol)
+        logger.error(f"Order failed:{symbol}:{result}")
+
+
+async def cancel_live_order(symbol: str) -> bool:
+    """Cancel resting order of symbol, False if order maybe still resting."""
+    order = live_orders.get(symbol)
+    if order is None:
+        return True
+
+    result = await cancel_margin_order(access, symbol, order["clientOrderId"])
+
+    if result.get("code") not in (None, UNKNOWN_ORDER):
+        logger.error(f"Cancel failed:{symbol}:{result}")
+        return False
+
+    live_orders.pop(symbol)
+    return True
+
+
+async def run_jobs(jobs: dict[str, Callable[[], Awaitable[None]]]) -> list[str]:
+    """Run jobs by symbol in dispatcher, return symbols of failed jobs."""
+    symbols = list(jobs)
+    results = await asyncio.gather(
+        *[dispatcher.submit(symbol, jobs[symbol]) for symbol in symbols],
+        return_exceptions=True,
+    )
+
+    failed = []
+    for symbol, result in zip(symbols, results, strict=True):
+        if isinstance(result, Exception):
+            logger.error(f"Job failed:{symbol}:{result!r}")
+            failed.append(symbol)
+    return failed
+
+
+async def ack_when_done(
+    msg: Msg,
+    jobs: dict[str, Callable[[], Awaitable[None]]],
+    received: int,
+) -> None:
+    """Ack msg when jobs from it done, then retry only failed symbols.
+
+    failed symbol not hold redelivery of whole batch
+    """
+    failed = await run_jobs(jobs)
+
+    await msg.ack()
+    ACK_LAG.observe(max(get_now() - received, 0) / 1000)
+
+    for attempt in range(1, ORDER_RETRIES + 1):
+        if not failed:
+            return
+        await asyncio.sleep(ORDER_RETRY_DELAY * attempt)
+        logger.warning(f"Retry {attempt}:{msg.subject}:{failed}")
+        failed = await run_jobs({symbol: jobs[symbol] for symbol in failed})
+
+    if failed:
+        logger.error(f"Give up after {ORDER_RETRIES} retries:{msg.subject}:{failed}")
+
+
+def ack_in_background(
+    msg: Msg,
+    jobs: dict[str, Callable[[], Awaitable[None]]],
+    received: int,
+) -> None:
+    """Run ack of msg in background task."""
+    task = asyncio.create_task(ack_when_done(msg, jobs, received))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def candle(msg: Msg) -> None:
+    """Collect data of open price each candle by interval.
+
+    recieve in format
+    {"TRXUSDT": "0.38640000"} on candle.7.TRXUSDT
+    {"TRXUSDT": "0.38640000", "BTCUSDT": "97000.01"} on candle.7.all
+    """
+    received = get_now()
+    times = get_time_headers(msg.headers)
+    event_time = times.get(EVENT_TIME, received)
+    seq = msg.metadata.sequence.stream
+    PENDING.set(msg.metadata.num_pending)
+
+    # consumer of replica deliver only own shards
+    prices = orjson.loads(msg.data)
+
+    for symbol, price in prices.items():
+        logger.success(f"New candle:{symbol}:{price}")
+        if PUBLISH_TIME in times:
+            # delay from Composter publish to receive
+            observe("deliver", symbol, max(received - times[PUBLISH_TIME], 0) / 1000)
+
+    # get side and size of all tokens which already send balance,
+    # tokens with size 0 not need order
+    sidzes = ledger.get_sides_and_sizes(prices)
+
+    jobs = {}
+    for symbol, sidze in sidzes.items():
+        observe_since("decide", symbol, received)
+        jobs[symbol] = partial(
+            make_order,
+            symbol,
+            prices[symbol],
+            sidze,
+            f"{symbol}.{seq}",
+            event_time,
+        )
+    ack_in_background(msg, jobs, received)
+
+
+def balance(entry: KeyValue.Entry) -> None:
+    """Collect balance of each tokens.
+
+    recieve in format
+    {"symbol": "TRXUSDT", "baseincrement": "0.00010000", "available": "0"}
+    """
+    data = orjson.loads(entry.value)
+
+    symbol = data["symbol"]
+    available = data["available"]
+
+    ledger.update(symbol, data["baseincrement"], available)
+
+    logger.success(f"Change balance:{symbol} to {available}")
+
+
+def execution_report(msg: dict) -> None:
+    """Work with change status of order on exchange.
+
+    {"e": "executionReport", "s": "BTCUSDT", "c": "...", "C": "", "X": "FILLED", ...}
+    """
+    if msg["e"] != "executionReport":
+        return
+
+    # for cancel "c" is id of cancel request, "C" is id of canceled order
+    client_order_id = msg.get("C") or msg["c"]
+
+    if msg["X"] in CLOSED_STATUSES:
+        live_orders.close(client_order_id)
+    elif msg["X"] == "PARTIALLY_FILLED":
+        live_orders.fill(client_order_id)
+    elif msg["X"] == "NEW":
+        live_orders.confirm(client_order_id)
+
+
+async def web_socket(listen_key: str) -> None:
+    """Run infinity listening stream of orders."""
+    async with connect(
+        uri=f"{STREAM_URI}/ws/{listen_key}",
+        max_queue=1024,
+    ) as ws:
+        while True:
+            msg = await ws.recv()
+            FRAMES.labels("user").inc()
+            execution_report(orjson.loads(msg))
+
+
+async def run_keep_alive(listen_key: str) -> None:
+    """Infinity sent PUT for KeepAlive."""
+    while True:
+        await keep_alive_listen_key(access, listen_key)
+        await asyncio.sleep(600)  # sleep 10 min
+
+
+def symbol_filter(entry: KeyValue.Entry) -> None:
+    """Collect exchange filters of each tokens.
+
+    recieve in format
+    {"symbol": "TRXUSDT", "tickSize": "0.00010000", "minPrice": "0.00010000",
+    "maxPrice": "1000.00000000", "stepSize": "0.10000000", "minQty": "0.10000000",
+    "maxQty": "9000000.00000000", "minNotional": "5.00000000"}
+    """
+    data = orjson.loads(entry.value)
+    filters[data["symbol"]] = SymbolFilter(
+        data,
+        expires=entry.created.timestamp() + FILTERS_TTL,
+    )
+
+
+async def load_bucket(
+    watcher: KeyValue.KeyWatcher,
+    handler: Callable[[KeyValue.Entry], None],
+) -> None:
+    """Load last values of all keys by one read of KV bucket."""
+    start = perf_counter()
+    count = 0
+
+    # watcher send last value of each key, None after all of them
+    while entry := await watcher.updates(timeout=None):
+        if entry.operation is None:  # skip DEL and PURGE
+            handler(entry)
+            count += 1
+
+    logger.info(
+        f"Snapshot {handler.__name__}:{count} keys in {perf_counter() - start:.3f}s",
+    )
+
+
+async def watch_bucket(
+    watcher: KeyValue.KeyWatcher,
+    handler: Callable[[KeyValue.Entry], None],
+) -> None:
+    """Infinity watch changes of keys in KV bucket."""
+    while True:
+        entry = await watcher.updates(timeout=None)
+
+        if entry is not None and entry.operation is None:  # skip DEL and PURGE
+            handler(entry)
+
+
+def get_candle_consumer(subjects: list[str]) -> ConsumerConfig:
+    """Get durable consumer of replica with candles of own shards."""
+    durable = f"candle_{replica_id}"
+    return ConsumerConfig(
+        name=durable,
+        durable_name=durable,
+        deliver_subject=f"deliver.{durable}",
+        ack_policy=AckPolicy.EXPLICIT,
+        # replica without shards get nothing, empty filter is all subjects
+        filter_subjects=subjects or ["candle.none"],
+        inactive_threshold=60 * 60,
+    )
+
+
+def get_own_subjects() -> list[str]:
+    """Get subjects of shards owned by replica."""
+    shards = ring.get_owned([str(shard) for shard in range(CANDLE_SHARDS)])
+    return [get_shard_subject(int(shard)) for shard in shards]
+
+
+async def run_heartbeat(
+    js: JetStreamContext,
+    replicas: KeyValue,
+    heartbeat: float,
+) -> None:
+    """Infinity mark replica as live, move filter of consumer by live replicas."""
+    subjects = get_own_subjects()
+
+    while True:
+        await replicas.put(replica_id, b"")
+        ring.set_members(await replicas.keys())
+
+        if subjects != (new_subjects := get_own_subjects()):
+            subjects = new_subjects
+            await js.add_consumer("bnnc", get_candle_consumer(subjects))
+            logger.info(f"Replicas:{ring.members}, own shards:{subjects}")
+
+        await asyncio.sleep(heartbeat)
+
+
+async def main() -> None:
+    """Main func in microservice."""
+    logger.info("Start Processor")
+    start_metrics()
+    global ledger, access, token, dispatcher, background_tasks
+    global replica_id, ring, claims, filters, live_orders
+    background_tasks = set()
+
+    # Resting order of each symbol for cancel or keep on next candle
+    live_orders = LiveOrders()
+
+    # Exchange filters of symbols
+    filters = {}
+
+    # Replica own part of symbols by consistent hash
+    replica_id = config("REPLICA_ID", cast=str, default=gethostname())
+    ring = HashRing(replica_id)
+    heartbeat = config("HEARTBEAT", cast=float, default=5.0)
+
+    # Jobs of one symbol run in order, orders of all symbols run together
+    dispatcher = Dispatcher(
+        concurrency=config("ORDER_CONCURRENCY", cast=int, default=32),
+    )
+
+    js = await get_js_context()
+
+    # Access object
+    access = Access(
+        key=config("KEY", cast=str),
+        secret=config("SECRET", cast=str),
+        base_uri=API_URI,
+    )
+
+    # Token's object
+    token = Token(
+        time_shift=config("TIME_SHIFT", cast=str, default="1h"),
+        base_stable=config("BASE_STABLE", cast=str, default="USDT"),
+        currency=config("ALLCURRENCY", cast=Csv(str)),
+        ignore_currency=config("IGNORECURRENCY", cast=Csv(str)),
+        base_keep=Decimal(config("BASE_KEEP", cast=int)),
+    )
+
+    # Balance of all tokens for rebalance by one pass
+    ledger = Portfolio(base_keep=config("BASE_KEEP", cast=int))
+
+    await setup_stream(js)
+
+    # Full ledger before first candle, then only changes
+    kv = await get_kv_balance(js)
+    watcher = await kv.watchall()
+    await load_bucket(watcher, balance)
+
+    # Filters shared by Balancer, keys expire if not refreshed
+    filters_watcher = await (await get_kv_filters(js)).watchall()
+    await load_bucket(filters_watcher, symbol_filter)
+
+    replicas = await get_kv_replicas(js, ttl=heartbeat * 3)
+    claims = await get_kv_claims(js)
+
+    # Each replica read candles of own shards by own durable consumer
+    await replicas.put(replica_id, b"")
+    ring.set_members(await replicas.keys())
+    consumer = await js.add_consumer(
+        "bnnc",
+        get_candle_consumer(get_own_subjects()),
+    )
+    await js.subscribe_bind(
+        stream="bnnc",
+        config=consumer.config,
+        consumer=consumer.name,
+        cb=candle,
+        manual_ack=True,
+    )
+
+    # Events of orders drop filled and canceled orders from live_orders
+    listen_key = (await get_websocket_listen_key(access))["listenKey"]
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(web_socket(listen_key))
+            tg.create_task(run_keep_alive(listen_key))
+            tg.create_task(watch_bucket(watcher, balance))
+            tg.create_task(watch_bucket(filters_watcher, symbol_filter))
+            tg.create_task(run_heartbeat(js, replicas, heartbeat))
+    finally:
+        await replicas.delete(replica_id)  # other replicas take shards
+        await close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,127 +1,285 @@
-"""Classes for work."""
-
-import hashlib
-import hmac
-from decimal import Decimal
-from typing import Self
-
-
-class Access:
-    """Class for store access condention to exchange."""
-
-    def __init__(self, key: str, secret: str, base_uri: str) -> None:
-        """Init access condention keys."""
-        self.key: str = key
-        self.secret: str = secret
-        self.base_uri: str = base_uri
-
-    def encrypted(self: Self, msg: str) -> str:
-        """Encrypted msg for exchange."""
-        return hmac.new(
-            self.secret.encode("utf-8"),
-            msg.encode("utf-8"),
-            hashlib.sha256,
-        ).hexdigest()
-
-
-class Token:
-    """Class for store token data for trade."""
-
-    def __init__(
-        self: Self,
-        currency: list,
-        ignore_currency: list,
-        base_keep: Decimal,
-        time_shift: str = "1h",
-        base_stable: str = "USDT",
-    ) -> None:
-        """Init class for store trade tokens."""
-        self.trade_currency: list[str] = currency  # Tokens for trade in bot
-        self.ignore_currency: list[str] = ignore_currency
-        self.base_keep: Decimal = base_keep
-        self.base_stable: str = base_stable
-        self.time_shift: str = time_shift
-        self.borrow_size: Decimal = Decimal("0")
-        self.avail_size: Decimal = Decimal("0")
-
-        self.accept_tokens: list[str] = []  # tradable tokens
-        self.new_tokens: list[str] = (
-            []
-        )  # tokens that can be traded but are not in the bot
-        self.del_tokens: list[str] = (
-            []
-        )  # tokens that have been removed from the exchange
-        self.history: dict = {}
-
-    def init_history(self: Self) -> None:
-        """Init history."""
-        self.history = {f"{key}-{self.base_stable}": "" for key in self.trade_currency}
-
-    def get_candles_for_kline(self: Self, tokens: list) -> str:
-        """Get str candles for kline websocket."""
-        return ",".join(
-            [f"{sym}-{self.base_stable}_{self.time_shift}" for sym in tokens],
-        )
-
-    def get_clear_borrow(self: Self) -> Decimal:
-        """Get clear borrow size."""
-        return self.borrow_size - self.avail_size
-
-    def get_percent_borrow(self: Self) -> int:
-        """Get percent of borrowing."""
-        return (
-            self.get_clear_borrow()
-            * 100
-            / (self.trade_currency * float(self.base_keep))
-        )
-
-    def get_len_trade_currency(self: Self) -> int:
-        """Get len of trade_currency."""
-        return len(self.trade_currency)
-
-    def get_len_accept_tokens(self: Self) -> int:
-        """Get len of accept_tokens."""
-        return len(self.accept_tokens)
-
-    def get_len_del_tokens(self: Self) -> int:
-        """Get len del_tokens."""
-        return len(self.del_tokens)
-
-    def get_len_ignore_currency(self: Self) -> int:
-        """Get len of ignore_currency."""
-        return len(self.ignore_currency)
-
-    def get_len_new_tokens(self: Self) -> int:
-        """Get len of new_tokens."""
-        return len(self.new_tokens)
-
-    @staticmethod
-    def remove_postfix(symbol: str, postfix: str = "-USDT") -> str:
-        """Remove postfix."""
-        return symbol.replace(postfix, "")
-
-    def save_accept_tokens(self: Self, all_token_in_excange: list) -> None:
-        """Save all accepted token."""
-        self.accept_tokens = [
-            Token.remove_postfix(token_in_excange["symbol"])
-            for token_in_excange in all_token_in_excange
-            if token_in_excange["isMarginEnabled"]
-            and token_in_excange["quoteCurrency"] == "USDT"
-            and Token.remove_postfix(token_in_excange["symbol"])
-            not in self.ignore_currency
-        ]
-
-    def save_new_tokens(self: Self, all_token_in_excange: list) -> None:
-        """."""
-        self.new_tokens = [
-            Token.remove_postfix(token_in_excange["symbol"])
-            for token_in_excange in all_token_in_excange
-            if Token.remove_postfix(token_in_excange["symbol"])
-            not in self.accept_tokens
-        ]
-
-    def save_del_tokens(self: Self) -> None:
-        """."""
-        self.del_tokens = [
-            used for used in self.trade_currency if used not in self.accept_tokens
-        ]
+"""Classes for work."""
+
+import asyncio
+import bisect
+import hashlib
+import hmac
+from collections.abc import Awaitable, Callable
+from decimal import Decimal
+from typing import Self
+
+
+class Access:
+    """Class for store access condention to exchange."""
+
+    def __init__(self, key: str, secret: str, base_uri: str) -> None:
+        """Init access condention keys."""
+        self.key: str = key
+        self.secret: str = secret
+        self.base_uri: str = base_uri
+
+    def encrypted(self: Self, msg: str) -> str:
+        """Encrypted msg for exchange."""
+        return hmac.new(
+            self.secret.encode("utf-8"),
+            msg.encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+
+
+class Token:
+    """Class for store token data for trade."""
+
+    def __init__(
+        self: Self,
+        currency: list,
+        ignore_currency: list,
+        base_keep: Decimal,
+        time_shift: str = "1h",
+        base_stable: str = "USDT",
+    ) -> None:
+        """Init class for store trade tokens."""
+        self.trade_currency: list[str] = currency  # Tokens for trade in bot
+        self.ignore_currency: list[str] = ignore_currency
+        self.base_keep: Decimal = base_keep
+        self.base_stable: str = base_stable
+        self.time_shift: str = time_shift
+        self.borrow_size: Decimal = Decimal("0")
+        self.avail_size: Decimal = Decimal("0")
+
+        self.accept_tokens: list[str] = []  # tradable tokens
+        self.new_tokens: list[str] = (
+            []
+        )  # tokens that can be traded but are not in the bot
+        self.del_tokens: list[str] = (
+            []
+        )  # tokens that have been removed from the exchange
+        self.history: dict = {}
+
+    def init_history(self: Self) -> None:
+        """Init history."""
+        self.history = {f"{key}-{self.base_stable}": "" for key in self.trade_currency}
+
+    def get_candles_for_kline(self: Self, tokens: list) -> str:
+        """Get str candles for kline websocket."""
+        return ",".join(
+            [f"{sym}-{self.base_stable}_{self.time_shift}" for sym in tokens],
+        )
+
+    def get_clear_borrow(self: Self) -> Decimal:
+        """Get clear borrow size."""
+        return self.borrow_size - self.avail_size
+
+    def get_percent_borrow(self: Self) -> int:
+        """Get percent of borrowing."""
+        return (
+            self.get_clear_borrow()
+            * 100
+            / (self.trade_currency * float(self.base_keep))
+        )
+
+    def get_len_trade_currency(self: Self) -> int:
+        """Get len of trade_currency."""
+        return len(self.trade_currency)
+
+    def get_len_accept_tokens(self: Self) -> int:
+        """Get len of accept_tokens."""
+        return len(self.accept_tokens)
+
+    def get_len_del_tokens(self: Self) -> int:
+        """Get len del_tokens."""
+        return len(self.del_tokens)
+
+    def get_len_ignore_currency(self: Self) -> int:
+        """Get len of ignore_currency."""
+        return len(self.ignore_currency)
+
+    def get_len_new_tokens(self: Self) -> int:
+        """Get len of new_tokens."""
+        return len(self.new_tokens)
+
+    @staticmethod
+    def remove_postfix(symbol: str, postfix: str = "-USDT") -> str:
+        """Remove postfix."""
+        return symbol.replace(postfix, "")
+
+    def save_accept_tokens(self: Self, all_token_in_excange: list) -> None:
+        """Save all accepted token."""
+        self.accept_tokens = [
+            Token.remove_postfix(token_in_excange["symbol"])
+            for token_in_excange in all_token_in_excange
+            if token_in_excange["isMarginEnabled"]
+            and token_in_excange["quoteCurrency"] == "USDT"
+            and Token.remove_postfix(token_in_excange["symbol"])
+            not in self.ignore_currency
+        ]
+
+    def save_new_tokens(self: Self, all_token_in_excange: list) -> None:
+        """."""
+        self.new_tokens = [
+            Token.remove_postfix(token_in_excange["symbol"])
+            for token_in_excange in all_token_in_excange
+            if Token.remove_postfix(token_in_excange["symbol"])
+            not in self.accept_tokens
+        ]
+
+    def save_del_tokens(self: Self) -> None:
+        """."""
+        self.del_tokens = [
+            used for used in self.trade_currency if used not in self.accept_tokens
+        ]
+
+
+class Dispatcher:
+    """Class for run jobs by symbol in order with bounded concurrency."""
+
+    def __init__(self: Self, concurrency: int) -> None:
+        """Init dispatcher with limit of jobs running together."""
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self.queues: dict[str, asyncio.Queue] = {}
+        self.workers: dict[str, asyncio.Task] = {}
+
+    def submit(
+        self: Self,
+        symbol: str,
+        job: Callable[[], Awaitable[None]],
+    ) -> asyncio.Future:
+        """Put job in queue of symbol, return future of job result."""
+        if symbol not in self.queues:
+            self.queues[symbol] = asyncio.Queue()
+            self.workers[symbol] = asyncio.create_task(
+                self.worker(self.queues[symbol]),
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        self.queues[symbol].put_nowait((job, future))
+        return future
+
+    async def worker(self: Self, queue: asyncio.Queue) -> None:
+        """Run jobs of one symbol one by one."""
+        while True:
+            job, future = await queue.get()
+            async with self.semaphore:
+                try:
+                    await job()
+                except Exception as e:  # noqa: BLE001
+                    future.set_exception(e)
+                else:
+                    future.set_result(None)
+
+
+class HashRing:
+    """Class for split shards of symbols between replicas by consistent hash."""
+
+    def __init__(self: Self, replica_id: str, vnodes: int = 64) -> None:
+        """Init ring with only own replica."""
+        self.replica_id: str = replica_id
+        self.vnodes: int = vnodes
+        self.members: list[str] = []
+        self.points: list[int] = []
+        self.owners: list[str] = []
+        self.set_members([replica_id])
+
+    @staticmethod
+    def get_hash(key: str) -> int:
+        """Get stable hash of key."""
+        return int.from_bytes(
+            hashlib.md5(key.encode("utf-8"), usedforsecurity=False).digest()[:8],
+            "big",
+        )
+
+    def set_members(self: Self, members: list[str]) -> None:
+        """Rebuild ring when replicas join or leave."""
+        members = sorted(members)
+        if members == self.members:
+            return
+
+        self.members = members
+        ring = sorted(
+            (self.get_hash(f"{member}#{i}"), member)
+            for member in members
+            for i in range(self.vnodes)
+        )
+        self.points = [point for point, _ in ring]
+        self.owners = [owner for _, owner in ring]
+
+    def get_owner(self: Self, key: str) -> str:
+        """Get replica which own key."""
+        i = bisect.bisect(self.points, self.get_hash(key)) % len(self.points)
+        return self.owners[i]
+
+    def get_owned(self: Self, keys: list[str]) -> list[str]:
+        """Get keys owned by own replica."""
+        return [key for key in keys if self.get_owner(key) == self.replica_id]
+
+
+class LiveOrders:
+    """Class for store resting order of each symbol by order events of exchange.
+
+    {"BTCUSDT": {"clientOrderId": "...", "side": "sell", "price": "97000.01",
+    "size": "0.0012", "placed": True, "filled": False}}
+    """
+
+    def __init__(self: Self) -> None:
+        """Init empty map."""
+        self.orders: dict[str, dict] = {}
+        self.symbols: dict[str, str] = {}  # clientOrderId to symbol
+
+    def get(self: Self, symbol: str) -> dict | None:
+        """Get resting order of symbol."""
+        return self.orders.get(symbol)
+
+    def save(
+        self: Self,
+        symbol: str,
+        client_order_id: str,
+        side: str,
+        price: str,
+        size: str,
+    ) -> None:
+        """Save order of symbol before place, report can come before response."""
+        self.pop(symbol)
+        self.orders[symbol] = {
+            "clientOrderId": client_order_id,
+            "side": side,
+            "price": price,
+            "size": size,
+            "placed": False,
+            "filled": False,
+        }
+        self.symbols[client_order_id] = symbol
+
+    def pop(self: Self, symbol: str) -> dict | None:
+        """Remove order of symbol after cancel or failed place."""
+        order = self.orders.pop(symbol, None)
+        if order is not None:
+            self.symbols.pop(order["clientOrderId"], None)
+        return order
+
+    def close(self: Self, client_order_id: str) -> None:
+        """Remove order filled, canceled or expired on exchange."""
+        symbol = self.symbols.get(client_order_id)
+        if symbol is not None:
+            self.pop(symbol)
+
+    def confirm(self: Self, client_order_id: str) -> None:
+        """Mark order as placed by response or NEW event of exchange."""
+        symbol = self.symbols.get(client_order_id)
+        if symbol is not None:
+            self.orders[symbol]["placed"] = True
+
+    def fill(self: Self, client_order_id: str) -> None:
+        """Mark order as partially filled, rest size differ from saved."""
+        symbol = self.symbols.get(client_order_id)
+        if symbol is not None:
+            self.orders[symbol]["filled"] = True
+
+    def is_same(self: Self, symbol: str, side: str, price: str, size: str) -> bool:
+        """Check resting order already match target, placed and not filled."""
+        order = self.orders.get(symbol)
+        return (
+            order is not None
+            and order["placed"]
+            and not order["filled"]
+            and (order["side"], order["price"], order["size"]) == (side, price, size)
+        )
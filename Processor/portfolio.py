@@ -0,0 +1,248 @@
+"""Vectorized ledger of all tokens for rebalance by one pass."""
+
+from typing import Self
+
+import numpy as np
+
+# Bound of relative error of float pass, few roundings of 2**-53 with margin
+FLOAT_ERROR = 2.0**-48
+# Bigger sizes lose units in float, they use python int
+FLOAT_EXACT = 2.0**52
+
+# Count of decimals for exchange filters, exchange use not more 8
+FILTER_EXP = 8
+
+
+def to_fixed(value: str) -> tuple[int, int]:
+    """Convert str number to int mantissa and count of decimals.
+
+    "0.38640000" -> (3864, 4)
+    """
+    integer, _, fraction = value.partition(".")
+    fraction = fraction.rstrip("0")
+    return int(integer + fraction), len(fraction)
+
+
+def from_fixed(value: int, exp: int) -> str:
+    """Convert int mantissa and count of decimals to str number.
+
+    (1234, 4) -> "0.1234"
+    """
+    if not exp:
+        return str(value)
+
+    integer, fraction = divmod(value, 10**exp)
+    return f"{integer}.{fraction:0{exp}d}"
+
+
+def to_scale(value: str, exp: int) -> int:
+    """Convert str number to int with exp decimals, extra decimals dropped.
+
+    ("0.38640000", 8) -> 38640000
+    """
+    mantissa, value_exp = to_fixed(value)
+    if value_exp <= exp:
+        return mantissa * 10 ** (exp - value_exp)
+    return mantissa // 10 ** (value_exp - exp)
+
+
+def get_fixed_side_and_size(  # noqa: PLR0913, PLR0917
+    price: int,
+    price_exp: int,
+    available: int,
+    available_exp: int,
+    increment_exp: int,
+    base_keep: int,
+) -> tuple[bool, int]:
+    """Get side (True is sell) and size in increments by python int.
+
+    Same rule as vectorized pass, without limits of int64.
+    """
+    num = price * available - base_keep * 10 ** (price_exp + available_exp)
+    size = abs(num) * 10**increment_exp // (price * 10**available_exp)
+    return num >= 0, size
+
+
+class Portfolio:
+    """Class for store ledger of all tokens as numpy arrays."""
+
+    def __init__(self: Self, base_keep: int, capacity: int = 64) -> None:
+        """Init empty ledger.
+
+        available is float copy of balance for fast pass,
+        fixed is exact (mantissa, decimals) of balance,
+        baseincrement has increment_exp decimals
+        """
+        self.base_keep: int = base_keep
+        self.index: dict[str, int] = {}  # symbol to row in arrays
+        self.available = np.zeros(capacity, dtype=np.float64)
+        self.increment_exp = np.zeros(capacity, dtype=np.int64)
+        self.fixed: list[tuple[int, int]] = []
+
+    def __contains__(self: Self, symbol: str) -> bool:
+        """Check symbol already send balance."""
+        return symbol in self.index
+
+    def get_row(self: Self, symbol: str) -> int:
+        """Get row of symbol, add new row with grow of arrays."""
+        if symbol not in self.index:
+            if len(self.index) == len(self.available):
+                capacity = len(self.available) * 2
+                self.available = np.resize(self.available, capacity)
+                self.increment_exp = np.resize(self.increment_exp, capacity)
+            self.index[symbol] = len(self.index)
+            self.fixed.append((0, 0))
+        return self.index[symbol]
+
+    def update(self: Self, symbol: str, baseincrement: str, available: str) -> None:
+        """Update balance and increment of symbol."""
+        row = self.get_row(symbol)
+        self.available[row] = float(available)
+        self.fixed[row] = to_fixed(available)
+        # quantize use exponent of increment: "0.00010000" round to 8 decimals
+        self.increment_exp[row] = len(baseincrement.partition(".")[2])
+
+    def get_sides_and_sizes(self: Self, prices: dict[str, str]) -> dict[str, dict]:
+        """Get side of trade and size of tokens for all symbols by one pass.
+
+        Result equal get_side_and_size with ROUND_DOWN by baseincrement,
+        symbols with size 0 are skipped
+
+        {"BTCUSDT": {"side": "sell", "size": "0.0012"}}
+        """
+        symbols = [symbol for symbol in prices if symbol in self.index]
+        rows = np.fromiter(
+            (self.index[symbol] for symbol in symbols),
+            dtype=np.int64,
+            count=len(symbols),
+        )
+        price = np.fromiter(
+            (float(prices[symbol]) for symbol in symbols),
+            dtype=np.float64,
+            count=len(symbols),
+        )
+        available = self.available[rows]
+        increment_exp = self.increment_exp[rows]
+        scale = 10.0**increment_exp  # exact, not more 8 decimals
+
+        # tokens = available - base_keep / price, sell if not negative
+        with np.errstate(divide="ignore", invalid="ignore"):  # zero price
+            keep_tokens = self.base_keep / price
+            tokens = available - keep_tokens
+            size = np.abs(tokens) * scale
+            units = np.floor(size)
+
+            # floor is exact if size far from int by error of float,
+            # else row go to python int, zero price is nan and go too
+            error = (np.abs(available) + keep_tokens) * scale * FLOAT_ERROR
+            exact = (
+                (size - units > error)
+                & (units + 1 - size > error)
+                & (size < FLOAT_EXACT)
+            )
+
+        # size under 2**52 printed with exp decimals is exact units
+        values = (units / scale).tolist()
+
+        result = {}
+        for symbol, row, is_exact, is_sell, count, value, exp in zip(
+            symbols,
+            rows.tolist(),
+            exact.tolist(),
+            (tokens >= 0).tolist(),
+            units.tolist(),
+            values,
+            increment_exp.tolist(),
+            strict=True,
+        ):
+            if is_exact:
+                if count:
+                    result[symbol] = {
+                        "side": "sell" if is_sell else "buy",
+                        "size": f"{value:.{exp}f}",
+                    }
+            else:
+                self.add_fixed(result, symbol, prices[symbol], row, exp)
+
+        return result
+
+    def add_fixed(
+        self: Self,
+        result: dict[str, dict],
+        symbol: str,
+        price: str,
+        row: int,
+        exp: int,
+    ) -> None:
+        """Add side and size of symbol by python int, zero price skipped."""
+        fixed_price = to_fixed(price)
+        if not fixed_price[0]:
+            return
+
+        is_sell, units = get_fixed_side_and_size(
+            *fixed_price,
+            *self.fixed[row],
+            exp,
+            self.base_keep,
+        )
+        if units:
+            result[symbol] = {
+                "side": "sell" if is_sell else "buy",
+                "size": from_fixed(units, exp),
+            }
+
+
+class SymbolFilter:
+    """Class for check order by exchange filters before send.
+
+    all values are int with FILTER_EXP decimals, 0 is filter disabled
+    """
+
+    def __init__(self: Self, data: dict, expires: float) -> None:
+        """Init filters of symbol, not used after expires (unix seconds).
+
+        {"symbol": "BTCUSDT", "tickSize": "0.01", "minPrice": "0.01",
+        "maxPrice": "1000000", "stepSize": "0.00001", "minQty": "0.00001",
+        "maxQty": "9000", "minNotional": "5"}
+        """
+        self.expires: float = expires
+        self.tick_size: int = to_scale(data["tickSize"], FILTER_EXP)
+        self.min_price: int = to_scale(data["minPrice"], FILTER_EXP)
+        self.max_price: int = to_scale(data["maxPrice"], FILTER_EXP)
+        self.step_size: int = to_scale(data["stepSize"], FILTER_EXP)
+        self.min_qty: int = to_scale(data["minQty"], FILTER_EXP)
+        self.max_qty: int = to_scale(data["maxQty"], FILTER_EXP)
+        self.min_notional: int = to_scale(data["minNotional"], FILTER_EXP)
+
+    def is_fresh(self: Self, now: float) -> bool:
+        """Check filters refreshed by Balancer not later TTL of bucket."""
+        return now < self.expires
+
+    def check(self: Self, price: str, size: str) -> tuple[str, str] | None:
+        """Get price and size fixed by filters, None if order will be rejected."""
+        price_ = origin_price = to_scale(price, FILTER_EXP)
+        size_ = origin_size = to_scale(size, FILTER_EXP)
+
+        # PRICE_FILTER
+        if self.tick_size:
+            price_ -= price_ % self.tick_size
+        if price_ < self.min_price or (self.max_price and price_ > self.max_price):
+            return None
+
+        # LOT_SIZE
+        if self.max_qty:
+            size_ = min(size_, self.max_qty)
+        if self.step_size:
+            size_ -= size_ % self.step_size
+        if not size_ or size_ < self.min_qty:
+            return None
+
+        # NOTIONAL
+        if price_ * size_ < self.min_notional * 10**FILTER_EXP:
+            return None
+
+        # keep origin str if not fixed
+        return (
+            price if price_ == origin_price else from_fixed(price_, FILTER_EXP),
+            size if size_ == origin_size else from_fixed(size_, FILTER_EXP),
+        )
@@ -0,0 +1,101 @@
+"""Check pooled session against local HTTPS stand-in of exchange."""
+
+import asyncio
+import ssl
+from collections.abc import Awaitable, Callable
+from functools import partial
+from statistics import quantiles
+from time import perf_counter
+
+import aiohttp
+import trustme
+from aiohttp import web
+
+from httplocal import close_session, get_session
+
+ORDERS = 200  # order requests by each mode
+ORDER_PATH = "/sapi/v1/margin/order"
+
+
+async def get_server(
+    server_ssl: ssl.SSLContext,
+    peers: set,
+) -> tuple[web.AppRunner, str]:
+    """Run HTTPS stand-in which answer order and save peer of each connection."""
+
+    async def order(request: web.Request) -> web.Response:
+        peers.add(request.transport.get_extra_info("peername"))
+        return web.json_response({"orderId": 1, "clientOrderId": "test"})
+
+    app = web.Application()
+    app.router.add_post(ORDER_PATH, order)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0, ssl_context=server_ssl)
+    await site.start()
+
+    port = runner.addresses[0][1]
+    return runner, f"https://localhost:{port}{ORDER_PATH}"
+
+
+async def measure(send: Callable[[], Awaitable[dict]]) -> list[float]:
+    """Get latency in ms of each order one by one."""
+    latencies = []
+    for _ in range(ORDERS):
+        start = perf_counter()
+        result = await send()
+        latencies.append((perf_counter() - start) * 1000)
+        assert result["orderId"] == 1
+    return latencies
+
+
+async def new_session_order(url: str, client_ssl: ssl.SSLContext) -> dict:
+    """Make order by new session, former path with own TCP and TLS on each order."""
+    async with (
+        aiohttp.ClientSession() as session,
+        session.post(url, ssl=client_ssl) as resp,
+    ):
+        return await resp.json()
+
+
+async def pooled_order(url: str, client_ssl: ssl.SSLContext) -> dict:
+    """Make order by shared session of process."""
+    async with get_session().post(url, ssl=client_ssl) as resp:
+        return await resp.json()
+
+
+async def run_benchmark() -> dict[str, tuple[list[float], int]]:
+    """Get latencies and count of connections by new session and pooled session."""
+    ca = trustme.CA()
+    server_ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ca.issue_cert("localhost").configure_cert(server_ssl)
+    client_ssl = ssl.create_default_context()
+    ca.configure_trust(client_ssl)
+
+    report = {}
+    for name, send in (("new session", new_session_order), ("pooled", pooled_order)):
+        peers = set()
+        runner, url = await get_server(server_ssl, peers)
+        try:
+            report[name] = (await measure(partial(send, url, client_ssl)), len(peers))
+        finally:
+            await close_session()
+            await runner.cleanup()
+    return report
+
+
+def test_benchmark_pooled() -> None:
+    """Compare p50 and p99 of order submit, run with -s for report."""
+    report = asyncio.run(run_benchmark())
+
+    for name, (latencies, connections) in report.items():
+        percentiles = quantiles(latencies, n=100)
+        print(
+            f"\n{name}: p50 {percentiles[49]:.2f}ms, p99 {percentiles[98]:.2f}ms, "
+            f"{connections} connections",
+        )
+
+    # pooled session make TCP and TLS once, then reuse connection
+    assert report["new session"][1] == ORDERS
+    assert report["pooled"][1] == 1
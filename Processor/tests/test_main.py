@@ -0,0 +1,229 @@
+"""Check ack and retry of candle jobs in Processor."""
+
+import asyncio
+from functools import partial
+from time import time
+
+import pytest
+from nats.js.errors import KeyWrongLastSequenceError
+
+import main
+from models import Dispatcher, HashRing, LiveOrders
+from natslocal import CANDLE_SHARDS, get_shard_subject
+from portfolio import SymbolFilter
+
+# Filters which reject order of test by min notional
+STRICT_FILTERS = {
+    "symbol": "BTCUSDT",
+    "tickSize": "0.01",
+    "minPrice": "0.01",
+    "maxPrice": "1000000",
+    "stepSize": "0.00001",
+    "minQty": "0.00001",
+    "maxQty": "9000",
+    "minNotional": "1000",
+}
+
+
+class FakeMsg:
+    """Candle message which count acks."""
+
+    def __init__(self: "FakeMsg") -> None:
+        """Init message without ack."""
+        self.subject = "candle.7.all"
+        self.acks = 0
+
+    async def ack(self: "FakeMsg") -> None:
+        """Count ack."""
+        self.acks += 1
+
+
+class FlakyJob:
+    """Job of symbol which fail first calls, then done."""
+
+    def __init__(self: "FlakyJob", calls: list[str], symbol: str, fails: int) -> None:
+        """Init job with shared list of calls."""
+        self.calls = calls
+        self.symbol = symbol
+        self.fails = fails
+
+    async def __call__(self: "FlakyJob") -> None:
+        """Save call and fail while fails left."""
+        self.calls.append(self.symbol)
+        if self.calls.count(self.symbol) <= self.fails:
+            raise ConnectionError(self.symbol)
+
+
+class FakeClaims:
+    """KV bucket of claims, create only if key not exist."""
+
+    def __init__(self: "FakeClaims") -> None:
+        """Init empty bucket."""
+        self.keys: dict[str, int] = {}
+        self.revision = 0
+
+    async def create(self: "FakeClaims", key: str, value: bytes) -> int:
+        """Create key or raise as nats when key exist."""
+        if key in self.keys:
+            raise KeyWrongLastSequenceError(value.decode())
+        self.revision += 1
+        self.keys[key] = self.revision
+        return self.revision
+
+    async def delete(self: "FakeClaims", key: str, last: int) -> None:
+        """Delete key of own revision."""
+        if self.keys.get(key) == last:
+            del self.keys[key]
+
+
+class FlakyExchange:
+    """Exchange which lose response of first orders."""
+
+    def __init__(self: "FlakyExchange", fails: int) -> None:
+        """Init exchange without orders."""
+        self.fails = fails
+        self.orders: list[str] = []
+
+    async def make_order(self: "FlakyExchange", **kwargs: str) -> dict:
+        """Place order or raise timeout while fails left."""
+        if self.fails:
+            self.fails -= 1
+            raise TimeoutError
+        self.orders.append(kwargs["client_order_id"])
+        return {"orderId": len(self.orders), "clientOrderId": kwargs["client_order_id"]}
+
+    async def cancel_order(self: "FlakyExchange", *_: str) -> dict:
+        """Cancel of order which never placed."""
+        return {"code": main.UNKNOWN_ORDER, "msg": "Unknown order sent."}
+
+
+@pytest.fixture(autouse=True)
+def processor(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Set globals of Processor which main() set on start."""
+    monkeypatch.setattr(main, "ORDER_RETRY_DELAY", 0)
+    monkeypatch.setattr(main, "background_tasks", set(), raising=False)
+    monkeypatch.setattr(main, "dispatcher", Dispatcher(concurrency=4), raising=False)
+    monkeypatch.setattr(main, "claims", FakeClaims(), raising=False)
+    monkeypatch.setattr(main, "live_orders", LiveOrders(), raising=False)
+    monkeypatch.setattr(main, "filters", {}, raising=False)
+    monkeypatch.setattr(main, "access", None, raising=False)
+    monkeypatch.setattr(main, "replica_id", "processor-1", raising=False)
+
+
+@pytest.fixture
+def exchange(monkeypatch: pytest.MonkeyPatch) -> FlakyExchange:
+    """Exchange which lose response of first order."""
+    exchange = FlakyExchange(fails=1)
+    monkeypatch.setattr(main, "make_margin_limit_order", exchange.make_order)
+    monkeypatch.setattr(main, "cancel_margin_order", exchange.cancel_order)
+    return exchange
+
+
+def test_retry_only_failed() -> None:
+    """Failed symbol retried alone, msg acked once without wait of retry."""
+    calls = []
+    msg = FakeMsg()
+    jobs = {
+        "BTCUSDT": FlakyJob(calls, "BTCUSDT", fails=0),
+        "ETHUSDT": FlakyJob(calls, "ETHUSDT", fails=2),
+    }
+
+    asyncio.run(main.ack_when_done(msg, jobs, main.get_now()))
+
+    assert msg.acks == 1
+    assert calls == ["BTCUSDT", "ETHUSDT", "ETHUSDT", "ETHUSDT"]
+
+
+def test_give_up() -> None:
+    """Symbol which always fail retried ORDER_RETRIES times, msg still acked."""
+    calls = []
+    msg = FakeMsg()
+    jobs = {"ETHUSDT": FlakyJob(calls, "ETHUSDT", fails=100)}
+
+    asyncio.run(main.ack_when_done(msg, jobs, main.get_now()))
+
+    assert msg.acks == 1
+    assert len(calls) == 1 + main.ORDER_RETRIES
+
+
+def test_redelivery_after_failed_order(exchange: FlakyExchange) -> None:
+    """Failed order release claim, redelivered candle place order."""
+    order = partial(
+        main.make_order,
+        "BTCUSDT",
+        "97000.01",
+        {"side": "sell", "size": "0.0012"},
+        "BTCUSDT.7",
+        main.get_now(),
+    )
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(order())
+    assert main.claims.keys == {}
+
+    asyncio.run(order())
+
+    assert len(exchange.orders) == 1
+    assert "BTCUSDT.7" in main.claims.keys
+    assert main.live_orders.is_same("BTCUSDT", "sell", "97000.01", "0.0012")
+
+
+def test_retry_after_failed_order(exchange: FlakyExchange) -> None:
+    """Failed order of candle placed by retry, not kept as resting."""
+    msg = FakeMsg()
+    jobs = {
+        "BTCUSDT": partial(
+            main.make_order,
+            "BTCUSDT",
+            "97000.01",
+            {"side": "sell", "size": "0.0012"},
+            "BTCUSDT.7",
+            main.get_now(),
+        ),
+    }
+
+    asyncio.run(main.ack_when_done(msg, jobs, main.get_now()))
+
+    assert msg.acks == 1
+    assert len(exchange.orders) == 1
+    assert main.live_orders.get("BTCUSDT")["clientOrderId"] == exchange.orders[0]
+
+
+def test_shards_split(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Each shard filtered by consumer of one live replica."""
+    members = ["processor-1", "processor-2", "processor-3"]
+
+    subjects = []
+    for member in members:
+        ring = HashRing(member)
+        ring.set_members(members)
+        monkeypatch.setattr(main, "ring", ring, raising=False)
+        subjects.extend(main.get_own_subjects())
+
+    assert sorted(subjects) == sorted(
+        get_shard_subject(shard) for shard in range(CANDLE_SHARDS)
+    )
+
+
+@pytest.mark.parametrize(("expires_in", "orders"), [(60, 0), (-1, 1)])
+def test_expired_filters(
+    monkeypatch: pytest.MonkeyPatch,
+    expires_in: int,
+    orders: int,
+) -> None:
+    """Filters not refreshed in TTL are not used for check of order."""
+    exchange = FlakyExchange(fails=0)
+    monkeypatch.setattr(main, "make_margin_limit_order", exchange.make_order)
+    main.filters["BTCUSDT"] = SymbolFilter(STRICT_FILTERS, expires=time() + expires_in)
+
+    asyncio.run(
+        main.make_order(
+            "BTCUSDT",
+            "97000.01",
+            {"side": "sell", "size": "0.0012"},
+            "BTCUSDT.7",
+            main.get_now(),
+        ),
+    )
+
+    assert len(exchange.orders) == orders
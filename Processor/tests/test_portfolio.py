@@ -0,0 +1,270 @@
+"""Check vectorized Portfolio against Decimal side and size by symbol."""
+
+import random
+from decimal import ROUND_DOWN, Context, Decimal, DefaultContext, localcontext
+from time import perf_counter
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from portfolio import (
+    Portfolio,
+    from_fixed,
+    get_fixed_side_and_size,
+    to_fixed,
+)
+
+BASE_KEEP = 1000
+
+# Default Decimal context round products over 28 digits, big cases need more
+EXACT = Context(prec=80)
+
+
+def get_side_and_size(
+    available: Decimal,
+    baseincrement: Decimal,
+    price: Decimal,
+    base_keep: Decimal,
+) -> dict:
+    """Get side of trade and size of tokens by Decimal, one symbol.
+
+    Former path of Processor, oracle for Portfolio
+    """
+    new_balance = price * available
+
+    if new_balance >= base_keep:
+        tokens_count = (new_balance - base_keep) / price
+        side = "sell"
+    else:
+        tokens_count = (base_keep - new_balance) / price
+        side = "buy"
+
+    return {"side": side, "size": tokens_count.quantize(baseincrement, ROUND_DOWN)}
+
+
+def get_expected(
+    balances: dict[str, tuple[str, str]],
+    prices: dict[str, str],
+    base_keep: int,
+) -> dict[str, dict]:
+    """Get result of Portfolio by Decimal path, size 0 skipped."""
+    result = {}
+    for symbol, price in prices.items():
+        if symbol not in balances:
+            continue
+
+        baseincrement, available = balances[symbol]
+        sidze = get_side_and_size(
+            Decimal(available),
+            Decimal(baseincrement),
+            Decimal(price),
+            Decimal(base_keep),
+        )
+        if sidze["size"]:
+            result[symbol] = {"side": sidze["side"], "size": f"{sidze['size']:f}"}
+    return result
+
+
+def get_portfolio(balances: dict[str, tuple[str, str]], base_keep: int) -> Portfolio:
+    """Get Portfolio with balances of symbols."""
+    portfolio = Portfolio(base_keep=base_keep)
+    for symbol, (baseincrement, available) in balances.items():
+        portfolio.update(symbol, baseincrement, available)
+    return portfolio
+
+
+def get_number(rnd: random.Random, digits: int, exp: int, low: int = 0) -> str:
+    """Get random str number as exchange send, with trailing zeros."""
+    return f"{Decimal(rnd.randrange(low, 10**digits)).scaleb(-exp):f}"
+
+
+def get_market(
+    count: int,
+    seed: int,
+) -> tuple[dict[str, tuple[str, str]], dict[str, str]]:
+    """Get random balances and prices of count symbols."""
+    rnd = random.Random(seed)
+    balances = {}
+    prices = {}
+    for i in range(count):
+        symbol = f"T{i}USDT"
+        balances[symbol] = (
+            f"{Decimal(1).scaleb(-rnd.randint(0, 8)):f}",
+            get_number(rnd, rnd.randint(1, 12), 8),
+        )
+        prices[symbol] = get_number(rnd, rnd.randint(1, 12), 8, low=1)
+    return balances, prices
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_equal_decimal(seed: int) -> None:
+    """Random market give same side and size string as Decimal path."""
+    balances, prices = get_market(200, seed)
+    prices["UNKNOWNUSDT"] = "1.0"  # candle without balance
+
+    portfolio = get_portfolio(balances, BASE_KEEP)
+
+    assert portfolio.get_sides_and_sizes(prices) == get_expected(
+        balances,
+        prices,
+        BASE_KEEP,
+    )
+
+
+@pytest.mark.parametrize("count", [50, 500, 5000])
+def test_benchmark(count: int) -> None:
+    """Compare time of one pass with Decimal loop, run with -s for report."""
+    balances, prices = get_market(count, count)
+    portfolio = get_portfolio(balances, BASE_KEEP)
+
+    start = perf_counter()
+    expected = get_expected(balances, prices, BASE_KEEP)
+    decimal_time = perf_counter() - start
+
+    start = perf_counter()
+    result = portfolio.get_sides_and_sizes(prices)
+    portfolio_time = perf_counter() - start
+
+    print(
+        f"\n{count} symbols: Decimal {decimal_time * 1000:.2f}ms, "
+        f"Portfolio {portfolio_time * 1000:.2f}ms",
+    )
+    assert result == expected
+
+
+def get_str(mantissa: int, exp: int) -> str:
+    """Get str number as exchange send, 12 and 4 -> "0.0012"."""
+    return f"{Decimal(mantissa).scaleb(-exp):f}"
+
+
+prices = st.builds(get_str, st.integers(1, 10**16), st.integers(0, 8))
+availables = st.builds(get_str, st.integers(-(10**16), 10**16), st.integers(0, 8))
+increments = st.builds(get_str, st.just(1), st.integers(0, 8))
+base_keeps = st.integers(1, 10**7)
+
+
+@given(availables, increments, prices, base_keeps)
+def test_property_portfolio(
+    available: str,
+    baseincrement: str,
+    price: str,
+    base_keep: int,
+) -> None:
+    """Any balance and price give same result as exact Decimal path."""
+    balances = {"BTCUSDT": (baseincrement, available)}
+    portfolio = get_portfolio(balances, base_keep)
+
+    with localcontext(EXACT):
+        expected = get_expected(balances, {"BTCUSDT": price}, base_keep)
+
+    assert portfolio.get_sides_and_sizes({"BTCUSDT": price}) == expected
+
+
+# Ranges of exchange with 8 decimals: price under 10**5, balance under 10**7
+# tokens, so product fit 28 digits of default Decimal context of Processor
+exchange_prices = st.builds(get_str, st.integers(1, 10**13 - 1), st.just(8))
+exchange_availables = st.builds(
+    get_str,
+    st.integers(-(10**15 - 1), 10**15 - 1),
+    st.just(8),
+)
+exchange_base_keeps = st.integers(1, 10**6)
+
+
+@given(exchange_availables, increments, exchange_prices, exchange_base_keeps)
+def test_property_default_context(
+    available: str,
+    baseincrement: str,
+    price: str,
+    base_keep: int,
+) -> None:
+    """Balance and price of exchange give same result as Decimal path of Processor."""
+    balances = {"BTCUSDT": (baseincrement, available)}
+    portfolio = get_portfolio(balances, base_keep)
+
+    with localcontext(DefaultContext):
+        expected = get_expected(balances, {"BTCUSDT": price}, base_keep)
+
+    assert portfolio.get_sides_and_sizes({"BTCUSDT": price}) == expected
+
+
+@given(availables, increments, prices, base_keeps)
+def test_property_fixed(
+    available: str,
+    baseincrement: str,
+    price: str,
+    base_keep: int,
+) -> None:
+    """Python int path give same side and size as exact Decimal path."""
+    increment_exp = len(baseincrement.partition(".")[2])
+    is_sell, units = get_fixed_side_and_size(
+        *to_fixed(price),
+        *to_fixed(available),
+        increment_exp,
+        base_keep,
+    )
+
+    with localcontext(EXACT):
+        sidze = get_side_and_size(
+            Decimal(available),
+            Decimal(baseincrement),
+            Decimal(price),
+            Decimal(base_keep),
+        )
+
+    assert from_fixed(units, increment_exp) == f"{sidze['size']:f}"
+    assert ("sell" if is_sell else "buy") == sidze["side"]
+
+
+@pytest.mark.parametrize(
+    ("available", "baseincrement", "price"),
+    [
+        ("0", "0.0001", "97000.01"),  # zero balance, buy all keep
+        ("0.00000000", "1", "0.00000001"),  # zero with decimals
+        ("10", "0.1", "100"),  # balance equal keep, size 0
+        ("10.00010000", "0.0001", "100"),  # one unit over keep
+        ("9.99990000", "0.0001", "100"),  # one unit under keep
+        ("10.00009999", "0.0001", "100"),  # just under one unit, size 0
+        ("1", "0.001", "0"),  # zero price, no order
+        ("99999999999.99999999", "0.00000001", "99999999.99999999"),  # over int64
+        ("-100000000000", "1", "100000000"),  # negative over int64
+        ("-92233720368.54775807", "0.00000001", "1.00000000"),  # negative near int64
+        ("0.00000001", "0.00000001", "92233720368.54775807"),  # price near int64
+    ],
+)
+def test_edge(available: str, baseincrement: str, price: str) -> None:
+    """Zero, boundary and big values give same result as Decimal path."""
+    balances = {"BTCUSDT": (baseincrement, available)}
+    portfolio = get_portfolio(balances, BASE_KEEP)
+
+    with localcontext(EXACT):
+        expected = (
+            get_expected(balances, {"BTCUSDT": price}, BASE_KEEP)
+            if Decimal(price)
+            else {}  # Decimal path divide by zero
+        )
+
+    assert portfolio.get_sides_and_sizes({"BTCUSDT": price}) == expected
+
+
+def test_benchmark_fixed() -> None:
+    """Compare parse and format of fixed point with Decimal, run with -s."""
+    values = [get_number(random.Random(i), 10, 8, low=1) for i in range(10000)]
+
+    start = perf_counter()
+    decimals = [Decimal(value) for value in values]
+    formatted = [str(value) for value in decimals]
+    decimal_time = perf_counter() - start
+
+    start = perf_counter()
+    fixed = [to_fixed(value) for value in values]
+    fixed_formatted = [from_fixed(*value) for value in fixed]
+    fixed_time = perf_counter() - start
+
+    print(
+        f"\nparse and format 10000: Decimal {decimal_time * 1000:.2f}ms, "
+        f"fixed {fixed_time * 1000:.2f}ms",
+    )
+    assert [Decimal(value) for value in fixed_formatted] == decimals
+    assert len(formatted) == len(fixed_formatted)
@@ -0,0 +1,79 @@
+"""Check WsApiSession against local websocket stand-in."""
+
+import asyncio
+
+import orjson
+import pytest
+from websockets.asyncio.server import ServerConnection, serve
+
+from models import Access
+from wsapi import WsApiSession
+
+ACCESS = Access("key", "secret", "http://127.0.0.1")
+
+
+async def reverse_server(ws: ServerConnection) -> None:
+    """Answer each two requests in reverse order, echo symbol as result."""
+    requests = []
+    async for frame in ws:
+        requests.append(orjson.loads(frame))
+        if len(requests) == 2:
+            for request in reversed(requests):
+                await ws.send(
+                    orjson.dumps(
+                        {
+                            "id": request["id"],
+                            "status": 200,
+                            "result": {"symbol": request["params"]["symbol"]},
+                        },
+                    ).decode(),
+                )
+            requests = []
+
+
+async def close_server(ws: ServerConnection) -> None:
+    """Close connection on first request without answer."""
+    await ws.recv()
+    await ws.close()
+
+
+async def run_session(handler: object, symbols: list[str]) -> list:
+    """Run session against server and send order.test of each symbol."""
+    async with serve(handler, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        session = WsApiSession(ACCESS, f"ws://127.0.0.1:{port}")
+        task = asyncio.create_task(session.run())
+
+        await session.connected.wait()
+
+        try:
+            return await asyncio.gather(
+                *[session.request("order.test", {"symbol": s}) for s in symbols],
+                return_exceptions=True,
+            )
+        finally:
+            task.cancel()
+
+
+def test_match_by_id() -> None:
+    """Responses in other order go to own request."""
+    symbols = ["BTCUSDT", "ETHUSDT", "TRXUSDT", "XRPUSDT"]
+
+    results = asyncio.run(run_session(reverse_server, symbols))
+
+    assert results == [{"symbol": symbol} for symbol in symbols]
+
+
+def test_fail_pending_on_close() -> None:
+    """Waiting requests fail by ConnectionError when connection lost."""
+    results = asyncio.run(run_session(close_server, ["BTCUSDT", "ETHUSDT"]))
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+def test_not_ready() -> None:
+    """Request without connection fail at once."""
+    session = WsApiSession(ACCESS, "ws://127.0.0.1:1")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(session.request("order.test", {"symbol": "BTCUSDT"}))
@@ -3,9 +3,9 @@
 from time import time
 from uuid import uuid4
 
-import aiohttp
 from loguru import logger
 
+from httplocal import API_URI, binance_request
 from models import Access
 
 
@@ -20,15 +20,12 @@ async def get_margin_account(access: Access) -> dict:
     signature = access.encrypted(query_string)
     data.update({"signature": signature})
 
-    async with (
-        aiohttp.ClientSession(
-            headers={"X-MBX-APIKEY": access.key},
-        ) as session,
-        session.get(
-            url="https://api.binance.com/sapi/v1/margin/account",
-            params=data,
-        ) as resp,
-    ):
+    async with binance_request(
+        "GET",
+        url=f"{API_URI}/sapi/v1/margin/account",
+        params=data,
+        headers={"X-MBX-APIKEY": access.key},
+    ) as resp:
         return await resp.json()
 
 
@@ -39,26 +36,30 @@ async def exchangeinfo(tokens: list[str]) -> dict:
     """
     filter_tokens = str(tokens).replace(" ", "").replace("'", '"')
 
-    url = "https://api.binance.com/api/v3/exchangeInfo"
-
-    async with (
-        aiohttp.ClientSession() as session,
-        session.get(
-            url=url,
-            params={
-                "symbols": filter_tokens,
-            },
-        ) as resp,
-    ):
+    url = f"{API_URI}/api/v3/exchangeInfo"
+
+    async with binance_request(
+        "GET",
+        url=url,
+        params={
+            "symbols": filter_tokens,
+        },
+    ) as resp:
         return await resp.json()
 
 
-async def make_margin_limit_order(
+def get_client_order_id() -> str:
+    """Get new unique newClientOrderId."""
+    return str(uuid4()).replace("-", "")
+
+
+async def make_margin_limit_order(  # noqa: PLR0913, PLR0917
     access: Access,
     side: str,
     price: str,
     symbol: str,
-    size: float,
+    size: str,
+    client_order_id: str,
 ) -> dict:
     """Make limit order by price."""
     logger.info(f"{side=}:{price=}:{symbol=}:{size=}")
@@ -73,7 +74,7 @@ async def make_margin_limit_order(
         "sideEffectType": "AUTO_BORROW_REPAY",
         "recvWindows": 10000,
         "timestamp": timestamp,
-        "newClientOrderId": str(uuid4()).replace("-", ""),
+        "newClientOrderId": client_order_id,
         "timeInForce": "GTC",
     }
 
@@ -82,16 +83,77 @@ async def make_margin_limit_order(
     signature = access.encrypted(query_string)
     data.update({"signature": signature})
 
-    async with (
-        aiohttp.ClientSession(
-            headers={
-                "X-MBX-APIKEY": access.key,
-                "Content-Type": "application/x-www-form-urlencoded",
-            },
-        ) as session,
-        session.post(
-            url="https://api.binance.com/sapi/v1/margin/order",
-            data=data,
-        ) as resp,
-    ):
-        await resp.json()
+    async with binance_request(
+        "POST",
+        url=f"{API_URI}/sapi/v1/margin/order",
+        data=data,
+        headers={
+            "X-MBX-APIKEY": access.key,
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+    ) as resp:
+        return await resp.json()
+
+
+async def cancel_margin_order(
+    access: Access,
+    symbol: str,
+    client_order_id: str,
+) -> dict:
+    """Cancel order by newClientOrderId."""
+    logger.info(f"Cancel:{symbol=}:{client_order_id=}")
+    timestamp = int(time() * 1000)
+
+    data = {
+        "symbol": symbol,
+        "origClientOrderId": client_order_id,
+        "recvWindows": 10000,
+        "timestamp": timestamp,
+    }
+
+    query_string = "&".join([f"{k}={v}" for k, v in data.items()])
+
+    signature = access.encrypted(query_string)
+    data.update({"signature": signature})
+
+    async with binance_request(
+        "DELETE",
+        url=f"{API_URI}/sapi/v1/margin/order",
+        params=data,
+        headers={
+            "X-MBX-APIKEY": access.key,
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+    ) as resp:
+        return await resp.json()
+
+
+async def get_websocket_listen_key(access: Access) -> dict:
+    """Get listenKey for websocket.
+
+    {
+            "listenKey": "..."
+    }
+    """
+    async with binance_request(
+        "POST",
+        url=f"{API_URI}/sapi/v1/userDataStream",
+        headers={
+            "X-MBX-APIKEY": access.key,
+        },
+    ) as resp:
+        return await resp.json()
+
+
+async def keep_alive_listen_key(access: Access, listen_key: str) -> dict:
+    """KeepAlive for listenKey."""
+    params = {"listenKey": listen_key}
+    async with binance_request(
+        "PUT",
+        url=f"{API_URI}/sapi/v1/userDataStream",
+        params=params,
+        headers={
+            "X-MBX-APIKEY": access.key,
+        },
+    ) as resp:
+        return await resp.json()
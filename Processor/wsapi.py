@@ -0,0 +1,118 @@
+"""Transport for send requests over Binance WebSocket API."""
+
+import asyncio
+from random import uniform
+from time import time
+from typing import TYPE_CHECKING, Self
+from uuid import uuid4
+
+import orjson
+from decouple import config
+from loguru import logger
+from websockets import ConnectionClosed, WebSocketException, connect
+
+from models import Access
+
+if TYPE_CHECKING:
+    from websockets.asyncio.client import ClientConnection
+
+WS_API_URI = config(
+    "WS_API_URI",
+    cast=str,
+    default="wss://ws-api.binance.com:443/ws-api/v3",
+)
+WS_API_TIMEOUT = config("WS_API_TIMEOUT", cast=float, default=5.0)
+BACKOFF_CAP = config("BACKOFF_CAP", cast=float, default=60.0)
+
+
+class WsApiSession:
+    """Class for hold one WebSocket API connection and match responses by id."""
+
+    def __init__(self: Self, access: Access, uri: str = WS_API_URI) -> None:
+        """Init session without connection."""
+        self.access: Access = access
+        self.uri: str = uri
+        self.ws: ClientConnection | None = None
+        self.pending: dict[str, asyncio.Future] = {}
+        self.connected: asyncio.Event = asyncio.Event()
+
+    def is_ready(self: Self) -> bool:
+        """Check connection is open."""
+        return self.ws is not None
+
+    def sign(self: Self, params: dict) -> dict:
+        """Add apiKey, timestamp and signature of sorted params."""
+        params = {
+            **params,
+            "apiKey": self.access.key,
+            "timestamp": int(time() * 1000),
+        }
+        query_string = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+        return {**params, "signature": self.access.encrypted(query_string)}
+
+    async def request(self: Self, method: str, params: dict) -> dict:
+        """Send signed request and wait response with same id.
+
+        result like REST: {"orderId": 28, ...} or error {"code": -2010, "msg": "..."}
+        """
+        if self.ws is None:
+            msg = "WebSocket API session not ready"
+            raise ConnectionError(msg)
+
+        request_id = uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+
+        try:
+            await self.ws.send(
+                orjson.dumps(
+                    {"id": request_id, "method": method, "params": self.sign(params)},
+                ).decode(),
+            )
+            async with asyncio.timeout(WS_API_TIMEOUT):
+                response = await future
+        except ConnectionClosed as e:
+            raise ConnectionError(str(e)) from e
+        finally:
+            self.pending.pop(request_id, None)
+
+        return response.get("result", response.get("error", {}))
+
+    def resolve(self: Self, frame: bytes) -> None:
+        """Set response to future waiting it."""
+        response = orjson.loads(frame)
+        future = self.pending.get(response.get("id"))
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def fail_pending(self: Self, error: Exception) -> None:
+        """Fail all waiting requests after lost connection."""
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+    async def run(self: Self) -> None:
+        """Run infinity connection with reconnect."""
+        attempt = 0
+
+        while True:
+            try:
+                async with connect(uri=self.uri, max_queue=1024) as ws:
+                    self.ws = ws
+                    self.connected.set()
+                    attempt = 0
+                    logger.info(f"WebSocket API connected:{self.uri}")
+
+                    while True:
+                        self.resolve(await ws.recv(decode=False))
+
+            except (WebSocketException, OSError, TimeoutError) as e:
+                self.ws = None
+                self.connected.clear()
+                self.fail_pending(ConnectionError(str(e)))
+
+                attempt += 1
+                delay = uniform(0, min(BACKOFF_CAP, 2**attempt))  # noqa: S311
+                logger.error(f"WebSocket API lost:{e}, reconnect in {delay:.2f}s")
+                await asyncio.sleep(delay)
@@ -0,0 +1,521 @@
+"""Bnnc Simulator.
+
+Local exchange for load test: replay recorded websocket frames to Composter,
+match limit orders by replayed prices, send user data to Balancer and
+Orderest, report throughput of pipeline.
+"""
+
+import asyncio
+import math
+import random
+from collections.abc import Awaitable, Callable
+from itertools import count
+from pathlib import Path
+from time import perf_counter
+
+import aiohttp
+import orjson
+from aiohttp import web
+from decouple import Csv, config
+from loguru import logger
+
+from models import Replay, Weights, get_now
+from recordlocal import HEADER
+
+SIM_PORT = config("SIM_PORT", cast=int, default=8080)
+REPLAY_FILE = config("REPLAY_FILE", cast=str, default="frames.bin")
+REPLAY_SPEED = config("REPLAY_SPEED", cast=float, default=1.0)  # 0 is max speed
+REPLAY_WAIT = config("REPLAY_WAIT", cast=float, default=60.0)  # seconds
+REPLAY_DRAIN = config("REPLAY_DRAIN", cast=float, default=10.0)  # seconds
+REPLAY_USER = config("REPLAY_USER", cast=bool, default=False)
+METRICS_TARGETS = config("METRICS_TARGETS", cast=Csv(str), default="")
+
+# Simulated exchange
+SIM_BALANCE = config("SIM_BALANCE", cast=str, default="100")  # of each asset
+SIM_LATENCY = config("SIM_LATENCY", cast=float, default=0.0)  # ms
+SIM_JITTER = config("SIM_JITTER", cast=float, default=0.0)  # ms
+SIM_ERROR_RATE = config("SIM_ERROR_RATE", cast=float, default=0.0)  # 0..1
+SIM_API_WEIGHT = config("SIM_API_WEIGHT", cast=int, default=6000)
+SIM_SAPI_WEIGHT = config("SIM_SAPI_WEIGHT", cast=int, default=12000)
+SIM_ORDER_LIMIT = config("SIM_ORDER_LIMIT", cast=int, default=100)  # in 10s
+SIM_PAIRS = config("SIM_PAIRS", cast=int, default=0)  # pad allPairs to size
+
+INTERNAL_ERROR = {
+    "code": -1001,
+    "msg": "Internal error; unable to process your request. Please try again.",
+}
+MALFORMED_REQUEST = {
+    "code": -1102,
+    "msg": "Mandatory parameter was not sent, was empty/null, or malformed.",
+}
+
+REPLAY = web.AppKey("replay", Replay)
+WEIGHTS = web.AppKey("weights", Weights)
+client_ids = count(1)
+
+
+def get_synthetic_frames(
+    symbols: int,
+    candles: int,
+    updates: int,
+) -> list[tuple[int, bytes]]:
+    """Get kline and balance frames of synthetic symbols S0001USDT...
+
+    updates - frames of each candle by symbol, only first start candle
+    """
+    interval = 3_600_000
+    start = get_now() - get_now() % interval
+    names = [f"S{i:04d}" for i in range(1, symbols + 1)]
+    prices = dict.fromkeys(names, 1.0)
+    frames = []
+
+    for candle in range(candles):
+        open_time = start + candle * interval
+
+        for update in range(updates):
+            received = open_time + update * interval // updates
+
+            for name in names:
+                prices[name] *= random.uniform(0.99, 1.01)  # noqa: S311
+                kline = {
+                    "stream": f"{name.lower()}usdt@kline_1h",
+                    "data": {
+                        "e": "kline",
+                        "E": received,
+                        "s": f"{name}USDT",
+                        "k": {
+                            "t": open_time,
+                            "T": open_time + interval - 1,
+                            "s": f"{name}USDT",
+                            "i": "1h",
+                            "o": f"{prices[name]:.4f}",
+                            "c": f"{prices[name]:.4f}",
+                            "x": update == updates - 1,
+                        },
+                    },
+                }
+                frames.append((received, orjson.dumps(kline)))
+
+        # part of balances changed by fills of last candle
+        changed = random.sample(names, max(len(names) // 10, 1))
+        frames.append(
+            (
+                open_time + interval // 2,
+                orjson.dumps(
+                    {
+                        "e": "outboundAccountPosition",
+                        "E": open_time + interval // 2,
+                        "u": open_time + interval // 2,
+                        "B": [
+                            {"a": name, "f": f"{random.uniform(0, 200):.2f}", "l": "0"}  # noqa: S311
+                            for name in changed
+                        ],
+                    },
+                ),
+            ),
+        )
+
+    return sorted(frames, key=lambda frame: frame[0])
+
+
+def write_synthetic(path: str, symbols: int, candles: int, updates: int) -> None:
+    """Write synthetic frames to file in record format."""
+    frames = get_synthetic_frames(symbols, candles, updates)
+
+    with Path(path).open("wb") as file:
+        for received, frame in frames:
+            file.write(HEADER.pack(received, len(frame)))
+            file.write(frame)
+
+    logger.info(f"Write {len(frames)} frames of {symbols} symbols to {path}")
+    logger.info(
+        "ALLCURRENCY=" + ",".join(f"S{i:04d}" for i in range(1, symbols + 1)),
+    )
+
+
+async def kline_stream(request: web.Request) -> web.WebSocketResponse:
+    """Combined kline stream, streams added by SUBSCRIBE."""
+    replay = request.app[REPLAY]
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    replay.kline_clients[ws] = set()
+    try:
+        async for msg in ws:
+            data = orjson.loads(msg.data)
+            if data.get("method") == "SUBSCRIBE":
+                replay.kline_clients[ws].update(data["params"])
+                await ws.send_str(
+                    orjson.dumps({"result": None, "id": data["id"]}).decode(),
+                )
+    finally:
+        del replay.kline_clients[ws]
+
+    return ws
+
+
+async def user_stream(request: web.Request) -> web.WebSocketResponse:
+    """User data stream by listenKey."""
+    replay = request.app[REPLAY]
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    replay.user_clients.add(ws)
+    try:
+        async for _ in ws:
+            pass
+    finally:
+        replay.user_clients.discard(ws)
+
+    return ws
+
+
+async def listen_key(_: web.Request) -> web.Response:
+    """Create and keep alive userDataStream."""
+    return web.json_response({"listenKey": "replay"}, dumps=orjson_dumps)
+
+
+async def exchange_info(request: web.Request) -> web.Response:
+    """ExchangeInfo with same filters for all symbols."""
+    symbols = orjson.loads(request.query.get("symbols", "[]"))
+    return web.json_response(
+        {
+            "symbols": [
+                {
+                    "symbol": symbol,
+                    "filters": [
+                        {
+                            "filterType": "PRICE_FILTER",
+                            "tickSize": "0.00010000",
+                            "minPrice": "0.00010000",
+                            "maxPrice": "1000.00000000",
+                        },
+                        {
+                            "filterType": "LOT_SIZE",
+                            "stepSize": "0.01000000",
+                            "minQty": "0.01000000",
+                            "maxQty": "9000000.00000000",
+                        },
+                        {"filterType": "NOTIONAL", "minNotional": "1.00000000"},
+                    ],
+                }
+                for symbol in symbols
+            ],
+        },
+        dumps=orjson_dumps,
+    )
+
+
+async def margin_account(request: web.Request) -> web.Response:
+    """Margin account with balances of simulated exchange."""
+    return web.json_response(
+        request.app[REPLAY].exchange.get_account(),
+        dumps=orjson_dumps,
+    )
+
+
+async def all_pairs(request: web.Request) -> web.Response:
+    """Margin pairs of all replayed symbols.
+
+    padded by synthetic pairs to SIM_PAIRS for load of Alertest
+    """
+    symbols = sorted(request.app[REPLAY].symbols)
+    symbols += [f"SIM{i}USDT" for i in range(SIM_PAIRS - len(symbols))]
+    return web.json_response(
+        [
+            {
+                "symbol": symbol,
+                "base": symbol.removesuffix("USDT"),
+                "quote": "USDT",
+                "isMarginTrade": True,
+                "isBuyAllowed": True,
+                "isSellAllowed": True,
+            }
+            for symbol in symbols
+        ],
+        dumps=orjson_dumps,
+    )
+
+
+async def klines(request: web.Request) -> web.Response:
+    """Klines with last replayed open price."""
+    replay = request.app[REPLAY]
+    symbol = request.query["symbol"]
+    return web.json_response(
+        [[replay.open_times.get(symbol, 0), replay.prices.get(symbol, "0")]],
+        dumps=orjson_dumps,
+    )
+
+
+def get_response(result: dict | list) -> web.Response:
+    """Get response with status 400 on error of exchange."""
+    status = 400 if isinstance(result, dict) and "code" in result else 200
+    return web.json_response(result, status=status, dumps=orjson_dumps)
+
+
+async def new_order(request: web.Request) -> web.Response:
+    """Place limit order on simulated exchange."""
+    replay = request.app[REPLAY]
+    data = await request.post()
+
+    result = replay.exchange.place(
+        data["symbol"],
+        data["side"],
+        data["price"],
+        data["quantity"],
+        data.get("newClientOrderId", str(next(client_ids))),
+    )
+    if "orderId" in result:
+        replay.save_order(data["symbol"])
+
+    await replay.send_events()
+    return get_response(result)
+
+
+async def order_test(_: web.Request) -> web.Response:
+    """Check new order without place, for latency test of transport."""
+    return web.json_response({}, dumps=orjson_dumps)
+
+
+async def cancel_order(request: web.Request) -> web.Response:
+    """Cancel order by orderId or origClientOrderId."""
+    replay = request.app[REPLAY]
+    query = request.query
+
+    result = replay.exchange.cancel(
+        query["symbol"],
+        order_id=int(query.get("orderId", 0)),
+        client_order_id=query.get("origClientOrderId"),
+    )
+
+    await replay.send_events()
+    return get_response(result)
+
+
+async def open_orders(request: web.Request) -> web.Response:
+    """Open orders of symbol or all symbols."""
+    return get_response(
+        request.app[REPLAY].exchange.get_open_orders(request.query.get("symbol")),
+    )
+
+
+async def cancel_open_orders(request: web.Request) -> web.Response:
+    """Cancel all open orders of symbol."""
+    replay = request.app[REPLAY]
+    result = replay.exchange.cancel_all(request.query["symbol"])
+
+    await replay.send_events()
+    return get_response(result)
+
+
+async def ws_api_answer(replay: Replay, ws: web.WebSocketResponse, data: dict) -> None:
+    """Answer one request of WebSocket API."""
+    params = data["params"]
+
+    await inject_latency()
+    if random.random() < SIM_ERROR_RATE:  # noqa: S311
+        result = INTERNAL_ERROR
+    elif data["method"] == "order.test":
+        result = {}  # checked, not placed
+    else:
+        result = replay.exchange.place(
+            params["symbol"],
+            params["side"],
+            params["price"],
+            params["quantity"],
+            params.get("newClientOrderId", str(next(client_ids))),
+        )
+
+    if "code" in result:
+        response = {"id": data["id"], "status": 400, "error": result}
+    else:
+        if "orderId" in result:
+            replay.save_order(params["symbol"])
+        response = {"id": data["id"], "status": 200, "result": result}
+
+    await ws.send_str(orjson.dumps(response).decode())
+    await replay.send_events()
+
+
+async def ws_api_request(replay: Replay, ws: web.WebSocketResponse, raw: str) -> None:
+    """Answer one request, malformed one get error frame and not close connection."""
+    data = {}
+    try:
+        data = orjson.loads(raw)
+        await ws_api_answer(replay, ws, data)
+    except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+        logger.warning(f"Malformed WebSocket API request:{e!r}")
+        response = {
+            "id": data.get("id") if isinstance(data, dict) else None,
+            "status": 400,
+            "error": MALFORMED_REQUEST,
+        }
+        await ws.send_str(orjson.dumps(response).decode())
+
+
+async def ws_api(request: web.Request) -> web.WebSocketResponse:
+    """WebSocket API order.place and order.test on simulated exchange.
+
+    requests are answered concurrently, responses can come in other order
+    """
+    replay = request.app[REPLAY]
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    async with asyncio.TaskGroup() as tg:
+        async for msg in ws:
+            tg.create_task(ws_api_request(replay, ws, msg.data))
+
+    return ws
+
+
+async def inject_latency() -> None:
+    """Sleep configured latency with jitter."""
+    delay = SIM_LATENCY + random.uniform(0, SIM_JITTER)  # noqa: S311
+    if delay:
+        await asyncio.sleep(delay / 1000)
+
+
+@web.middleware
+async def exchange_middleware(
+    request: web.Request,
+    handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+) -> web.StreamResponse:
+    """Add latency, errors and weight accounting to REST endpoints."""
+    if not request.path.startswith(("/api/", "/sapi/")):
+        return await handler(request)
+
+    await inject_latency()
+
+    if random.random() < SIM_ERROR_RATE:  # noqa: S311
+        return web.json_response(INTERNAL_ERROR, status=500, dumps=orjson_dumps)
+
+    headers, retry = request.app[WEIGHTS].spend(request.method, request.path)
+    if retry:
+        return web.json_response(
+            {"code": -1003, "msg": "Too many requests."},
+            status=429,
+            headers={**headers, "Retry-After": str(math.ceil(retry))},
+            dumps=orjson_dumps,
+        )
+
+    response = await handler(request)
+    response.headers.update(headers)
+    return response
+
+
+def orjson_dumps(data: dict | list) -> str:
+    """Dumps json by orjson."""
+    return orjson.dumps(data).decode()
+
+
+async def get_usage() -> dict[str, dict[str, float]]:
+    """Get cpu seconds and rss bytes of services from Prometheus endpoints."""
+    usage = {}
+    async with aiohttp.ClientSession() as session:
+        for target in METRICS_TARGETS:
+            try:
+                async with session.get(target) as resp:
+                    text = await resp.text()
+            except aiohttp.ClientError as e:
+                logger.error(f"Metrics:{target}:{e}")
+                continue
+
+            values = dict(
+                line.split(" ", 1)
+                for line in text.splitlines()
+                if line.startswith(
+                    ("process_cpu_seconds_total ", "process_resident_memory_bytes "),
+                )
+            )
+            usage[target] = {
+                "cpu": float(values.get("process_cpu_seconds_total", 0)),
+                "rss": float(values.get("process_resident_memory_bytes", 0)),
+            }
+    return usage
+
+
+async def run_replay(replay: Replay) -> None:
+    """Wait subscribe of all streams, replay frames and report."""
+    start = perf_counter()
+    while replay.get_streams() < len(replay.symbols):
+        if perf_counter() - start > REPLAY_WAIT:
+            logger.warning(f"Subscribed {replay.get_streams()}/{len(replay.symbols)}")
+            break
+        await asyncio.sleep(0.5)
+
+    logger.info(f"Replay {len(replay.frames)} frames with speed {REPLAY_SPEED}")
+    before = await get_usage()
+    await replay.run()
+    await asyncio.sleep(REPLAY_DRAIN)  # wait orders of last candles
+    after = await get_usage()
+
+    replay.get_report(
+        {
+            target: {
+                "cpu": (after[target]["cpu"] - before[target]["cpu"])
+                / (replay.duration + REPLAY_DRAIN),
+                "rss": after[target]["rss"],
+            }
+            for target in after
+            if target in before
+        },
+    )
+
+
+async def main() -> None:
+    """Main func in microservice."""
+    logger.info("Start Simulator")
+
+    if config("MODE", cast=str, default="replay") == "synth":
+        write_synthetic(
+            REPLAY_FILE,
+            symbols=config("SYNTH_SYMBOLS", cast=int, default=1000),
+            candles=config("SYNTH_CANDLES", cast=int, default=24),
+            updates=config("SYNTH_UPDATES", cast=int, default=10),
+        )
+        return
+
+    app = web.Application(middlewares=[exchange_middleware])
+    app[REPLAY] = Replay(
+        REPLAY_FILE,
+        REPLAY_SPEED,
+        SIM_BALANCE,
+        replay_user=REPLAY_USER,
+    )
+    app[WEIGHTS] = Weights(
+        {"api": SIM_API_WEIGHT, "sapi": SIM_SAPI_WEIGHT, "orders": SIM_ORDER_LIMIT},
+    )
+    app.add_routes(
+        [
+            web.get("/stream", kline_stream),
+            web.get("/ws/{listen_key}", user_stream),
+            web.get("/ws-api/v3", ws_api),
+            web.post("/sapi/v1/userDataStream", listen_key),
+            web.put("/sapi/v1/userDataStream", listen_key),
+            web.get("/api/v3/exchangeInfo", exchange_info),
+            web.get("/api/v3/klines", klines),
+            web.get("/sapi/v1/margin/account", margin_account),
+            web.get("/sapi/v1/margin/allPairs", all_pairs),
+            web.get("/sapi/v1/margin/openOrders", open_orders),
+            web.delete("/sapi/v1/margin/openOrders", cancel_open_orders),
+            web.post("/sapi/v1/margin/order", new_order),
+            web.post("/api/v3/order/test", order_test),
+            web.delete("/sapi/v1/margin/order", cancel_order),
+        ],
+    )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, port=SIM_PORT).start()
+    logger.info(f"Simulator on :{SIM_PORT}")
+
+    try:
+        await run_replay(app[REPLAY])
+        await asyncio.Event().wait()  # serve stubs until stop
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,427 @@
+"""Classes for work."""
+
+import asyncio
+import statistics
+from collections import defaultdict
+from decimal import Decimal
+from itertools import count
+from time import perf_counter, time
+from typing import TYPE_CHECKING, Self
+
+import orjson
+from loguru import logger
+
+from recordlocal import read_frames
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from aiohttp import web
+
+# Request weight of endpoints, same as exchange
+ENDPOINT_WEIGHT = {
+    ("GET", "/api/v3/exchangeInfo"): 20,
+    ("GET", "/api/v3/klines"): 2,
+    ("GET", "/sapi/v1/margin/account"): 10,
+    ("GET", "/sapi/v1/margin/allPairs"): 1,
+    ("GET", "/sapi/v1/margin/openOrders"): 10,
+    ("POST", "/sapi/v1/margin/order"): 6,
+    ("POST", "/api/v3/order/test"): 1,
+    ("DELETE", "/sapi/v1/margin/order"): 10,
+    ("DELETE", "/sapi/v1/margin/openOrders"): 1,
+    ("POST", "/sapi/v1/userDataStream"): 1,
+    ("PUT", "/sapi/v1/userDataStream"): 1,
+}
+DEFAULT_WEIGHT = 10
+ORDER_ENDPOINTS = {("POST", "/sapi/v1/margin/order")}
+WEIGHT_HEADERS = {
+    "api": "X-MBX-USED-WEIGHT-1M",
+    "sapi": "X-SAPI-USED-IP-WEIGHT-1M",
+    "orders": "X-MBX-ORDER-COUNT-10S",
+}
+
+
+def get_now() -> int:
+    """Get now time in ms."""
+    return int(time() * 1000)
+
+
+def get_interval_ms(interval: str) -> int:
+    """Get length of candle in milliseconds, 1h -> 3600000."""
+    units = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}
+    return int(interval[:-1]) * units[interval[-1]]
+
+
+class Replay:
+    """Class for send recorded frames to connected services by speed."""
+
+    def __init__(
+        self: Self,
+        path: str,
+        speed: float,
+        balance: str,
+        *,
+        replay_user: bool,
+    ) -> None:
+        """Load all frames of file in memory.
+
+        speed - 1 is real time, 10 is 10x faster, 0 is max speed
+        balance - start balance of each asset on simulated account
+        replay_user - send recorded user data frames with simulated
+        """
+        self.speed: float = speed
+        self.replay_user: bool = replay_user
+        self.frames: list[tuple[int, bytes]] = list(read_frames(path))
+        self.first: int = self.frames[0][0] if self.frames else 0
+        self.start: int = 0  # time in ms of first sent frame
+        self.duration: float = 0.0
+        self.sent: int = 0
+
+        # ws of Composter to subscribed streams, ws of Balancer
+        self.kline_clients: dict[web.WebSocketResponse, set[str]] = {}
+        self.user_clients: set[web.WebSocketResponse] = set()
+
+        self.prices: dict[str, str] = {}  # last open price by symbol
+        self.open_times: dict[str, int] = {}  # last candle start by symbol
+        self.candle_sent: dict[str, float] = {}  # perf_counter of new candle
+        self.latencies: list[float] = []  # new candle to order by symbol
+        self.orders: int = 0
+        self.started: float = 0.0  # perf_counter of first sent frame
+        self.last_order: float = 0.0  # perf_counter of last order
+
+        self.symbols: set[str] = {
+            frame[pos + 5 : frame.find(b'"', pos + 5)].decode()
+            for _, frame in self.frames
+            if (pos := frame.find(b'"s":"')) != -1 and frame.startswith(b'{"stream"')
+        }
+        self.exchange: Exchange = Exchange(
+            sorted(symbol.removesuffix("USDT") for symbol in self.symbols),
+            balance,
+        )
+
+    def get_streams(self: Self) -> int:
+        """Get count of subscribed streams."""
+        return sum(len(streams) for streams in self.kline_clients.values())
+
+    def shift(self: Self, recorded: int, interval: str) -> int:
+        """Move recorded time of kline to replay by whole intervals.
+
+        open time stay aligned to interval on any speed, speed change only
+        time of send, candles on 10x speed come 10x often with usual times
+        """
+        interval_ms = get_interval_ms(interval)
+        return recorded + (self.start - self.first) // interval_ms * interval_ms
+
+    async def send_kline(self: Self, data: dict) -> None:
+        """Send kline frame to subscribed clients."""
+        kline = data["data"]["k"]
+        symbol = data["data"]["s"]
+
+        data["data"]["E"] = get_now()
+        kline["T"] = self.shift(kline["T"], kline["i"])
+        kline["t"] = self.shift(kline["t"], kline["i"])
+
+        if self.open_times.get(symbol) != kline["t"]:
+            self.open_times[symbol] = kline["t"]
+            self.prices[symbol] = kline["o"]
+            self.candle_sent[symbol] = perf_counter()
+
+        frame = orjson.dumps(data).decode()
+        for ws, streams in list(self.kline_clients.items()):
+            if data["stream"] in streams:
+                await ws.send_str(frame)
+
+        self.exchange.match(symbol, kline["c"])
+        await self.send_events()
+
+    async def send_events(self: Self) -> None:
+        """Send user data events of simulated exchange."""
+        for event in self.exchange.pop_events():
+            await self.send_user(event)
+
+    async def send_user(self: Self, data: dict) -> None:
+        """Send user data frame to all clients."""
+        data["E"] = get_now()
+
+        frame = orjson.dumps(data).decode()
+        for ws in list(self.user_clients):
+            await ws.send_str(frame)
+
+    async def run(self: Self) -> None:
+        """Send all frames with recorded intervals divided by speed."""
+        self.start = get_now()
+        self.started = start = perf_counter()
+
+        for received, frame in self.frames:
+            if self.speed:
+                delay = (received - self.first) / self.speed / 1000
+                if (wait := delay - (perf_counter() - start)) > 0:
+                    await asyncio.sleep(wait)
+            elif not self.sent % 100:
+                await asyncio.sleep(0)  # let services read
+
+            data = orjson.loads(frame)
+            if "stream" in data:
+                await self.send_kline(data)
+            elif self.replay_user:
+                await self.send_user(data)
+            self.sent += 1
+
+        self.duration = perf_counter() - start
+
+    def save_order(self: Self, symbol: str) -> None:
+        """Save latency from new candle to order of symbol."""
+        self.orders += 1
+        self.last_order = perf_counter()
+        if (sent := self.candle_sent.pop(symbol, None)) is not None:
+            self.latencies.append(perf_counter() - sent)
+
+    def get_report(self: Self, usage: dict[str, dict[str, float]]) -> str:
+        """Get report of replay run."""
+        orders_duration = max(self.last_order - self.started, 1e-9)
+        lines = [
+            (
+                f"Frames:{self.sent} in {self.duration:.2f}s:"
+                f"{self.sent / max(self.duration, 1e-9):.0f}/s"
+            ),
+            (
+                f"Orders:{self.orders} in {orders_duration:.2f}s:"
+                f"{self.orders / orders_duration:.1f}/s:filled {self.exchange.filled}"
+            ),
+        ]
+
+        if len(self.latencies) > 1:
+            quantiles = statistics.quantiles(self.latencies, n=100, method="inclusive")
+            lines.append(
+                f"Candle to order:p50 {quantiles[49] * 1000:.1f}ms:"
+                f"p90 {quantiles[89] * 1000:.1f}ms:"
+                f"p99 {quantiles[98] * 1000:.1f}ms:"
+                f"max {max(self.latencies) * 1000:.1f}ms",
+            )
+
+        lines.extend(
+            f"{target}:cpu {value['cpu']:.2f} cores:rss {value['rss'] / 2**20:.0f}MiB"
+            for target, value in usage.items()
+        )
+
+        report = "\n".join(lines)
+        logger.success(f"Replay report\n{report}")
+        return report
+
+
+class Exchange:
+    """Class for simple matching of limit orders and balances of margin account.
+
+    order filled by own price when close price of kline cross it
+    """
+
+    def __init__(self: Self, assets: list[str], balance: str) -> None:
+        """Init account with same balance of all assets."""
+        self.balances: dict[str, Decimal] = {
+            asset: Decimal(balance) for asset in [*assets, "USDT"]
+        }
+        self.orders: dict[int, dict] = {}  # orderId to open order
+        self.by_symbol: dict[str, set[int]] = defaultdict(set)
+        self.client_ids: dict[str, int] = {}  # clientOrderId of open orders
+        self.order_ids: Iterator[int] = count(1)
+        self.events: list[dict] = []  # user data events for send
+        self.filled: int = 0
+
+    def add_execution(self: Self, order: dict) -> None:
+        """Add executionReport event of order."""
+        self.events.append(
+            {
+                "e": "executionReport",
+                "E": get_now(),
+                "s": order["symbol"],
+                "c": order["clientOrderId"],
+                "S": order["side"],
+                "o": order["type"],
+                "f": order["timeInForce"],
+                "q": order["origQty"],
+                "p": order["price"],
+                "X": order["status"],
+                "i": order["orderId"],
+                "z": order["executedQty"],
+                "O": order["time"],
+            },
+        )
+
+    def add_position(self: Self, assets: list[str]) -> None:
+        """Add outboundAccountPosition event of changed assets."""
+        self.events.append(
+            {
+                "e": "outboundAccountPosition",
+                "E": get_now(),
+                "u": get_now(),
+                "B": [
+                    {"a": asset, "f": str(self.balances[asset]), "l": "0"}
+                    for asset in assets
+                ],
+            },
+        )
+
+    def pop_events(self: Self) -> list[dict]:
+        """Get events for send and clear them."""
+        events, self.events = self.events, []
+        return events
+
+    def place(
+        self: Self,
+        symbol: str,
+        side: str,
+        price: str,
+        quantity: str,
+        client_order_id: str,
+    ) -> dict:
+        """Place limit order, error if clientOrderId already open."""
+        if client_order_id in self.client_ids:
+            return {"code": -2010, "msg": "Duplicate order sent."}
+
+        order = {
+            "symbol": symbol,
+            "orderId": next(self.order_ids),
+            "clientOrderId": client_order_id,
+            "transactTime": get_now(),
+            "time": get_now(),
+            "price": price,
+            "origQty": quantity,
+            "executedQty": "0",
+            "status": "NEW",
+            "timeInForce": "GTC",
+            "type": "LIMIT",
+            "side": side,
+        }
+        self.orders[order["orderId"]] = order
+        self.by_symbol[symbol].add(order["orderId"])
+        self.client_ids[client_order_id] = order["orderId"]
+
+        self.add_execution(order)
+        return order
+
+    def remove(self: Self, order_id: int, status: str) -> dict:
+        """Remove order from open orders with new status."""
+        order = self.orders.pop(order_id)
+        self.by_symbol[order["symbol"]].discard(order_id)
+        del self.client_ids[order["clientOrderId"]]
+
+        order["status"] = status
+        self.add_execution(order)
+        return order
+
+    def cancel(
+        self: Self,
+        symbol: str,
+        order_id: int | None = None,
+        client_order_id: str | None = None,
+    ) -> dict:
+        """Cancel open order by orderId or clientOrderId."""
+        order_id = order_id or self.client_ids.get(client_order_id or "")
+        order = self.orders.get(order_id or 0)
+
+        if order is None or order["symbol"] != symbol:
+            return {"code": -2011, "msg": "Unknown order sent."}
+
+        return self.remove(order["orderId"], "CANCELED")
+
+    def cancel_all(self: Self, symbol: str) -> list[dict] | dict:
+        """Cancel all open orders of symbol."""
+        if not self.by_symbol[symbol]:
+            return {"code": -2011, "msg": "Unknown order sent."}
+
+        return [
+            self.remove(order_id, "CANCELED")
+            for order_id in list(self.by_symbol[symbol])
+        ]
+
+    def get_open_orders(self: Self, symbol: str | None = None) -> list[dict]:
+        """Get open orders of symbol or all symbols."""
+        return [
+            order
+            for order in self.orders.values()
+            if symbol is None or order["symbol"] == symbol
+        ]
+
+    def match(self: Self, symbol: str, close: str) -> None:
+        """Fill orders of symbol crossed by close price."""
+        price = Decimal(close)
+
+        for order_id in list(self.by_symbol.get(symbol, ())):
+            order = self.orders[order_id]
+            limit = Decimal(order["price"])
+
+            if (order["side"] == "BUY" and price <= limit) or (
+                order["side"] == "SELL" and price >= limit
+            ):
+                self.fill(order)
+
+    def fill(self: Self, order: dict) -> None:
+        """Fill full order by own price, borrow if balance not enough."""
+        asset = order["symbol"].removesuffix("USDT")
+        quantity = Decimal(order["origQty"])
+        cost = quantity * Decimal(order["price"])
+        sign = 1 if order["side"] == "BUY" else -1
+
+        self.balances[asset] = self.balances.get(asset, Decimal(0)) + sign * quantity
+        self.balances["USDT"] -= sign * cost
+
+        order["executedQty"] = order["origQty"]
+        self.remove(order["orderId"], "FILLED")
+        self.add_position([asset, "USDT"])
+        self.filled += 1
+
+    def get_account(self: Self) -> dict:
+        """Get margin account in format of exchange."""
+        return {
+            "userAssets": [
+                {
+                    "asset": asset,
+                    "free": str(max(balance, Decimal(0))),
+                    "locked": "0",
+                    "borrowed": str(max(-balance, Decimal(0))),
+                    "interest": "0",
+                    "netAsset": str(balance),
+                }
+                for asset, balance in self.balances.items()
+            ],
+        }
+
+
+class Weights:
+    """Class for count request weight by fixed windows like exchange."""
+
+    def __init__(self: Self, limits: dict[str, int]) -> None:
+        """Init windows of api, sapi and orders."""
+        self.limits: dict[str, int] = limits
+        self.windows: dict[str, int] = dict.fromkeys(limits, 0)
+        self.used: dict[str, int] = dict.fromkeys(limits, 0)
+
+    def add(self: Self, name: str, cost: int, now: float) -> float:
+        """Add cost to window, get seconds to retry if over limit."""
+        length = 10 if name == "orders" else 60
+        window = int(now // length)
+        if window != self.windows[name]:
+            self.windows[name] = window
+            self.used[name] = 0
+
+        self.used[name] += cost
+        if self.used[name] > self.limits[name]:
+            return (window + 1) * length - now
+        return 0.0
+
+    def spend(self: Self, method: str, path: str) -> tuple[dict[str, str], float]:
+        """Spend weight of request, get headers and seconds to retry."""
+        now = time()
+        name = "sapi" if path.startswith("/sapi/") else "api"
+        cost = ENDPOINT_WEIGHT.get((method, path), DEFAULT_WEIGHT)
+
+        retry = self.add(name, cost, now)
+        headers = {
+            WEIGHT_HEADERS[name]: str(self.used[name]),
+        }
+
+        if (method, path) in ORDER_ENDPOINTS:
+            retry = max(retry, self.add("orders", 1, now))
+            headers[WEIGHT_HEADERS["orders"]] = str(self.used["orders"])
+
+        return headers, retry